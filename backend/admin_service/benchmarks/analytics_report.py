@@ -0,0 +1,80 @@
+"""
+End-to-end latency of GET /report/analytics against menu size.
+
+user_service and order_service are simulated with an httpx.MockTransport that adds a fixed
+per-call latency. Ratings come back already limited to the report window, so the report makes
+one order_trends call plus one ratings call per REPORT_BATCH_SIZE items (it used to make one
+menu_preferences call per item).
+
+Usage (from backend/admin_service):
+    python benchmarks/analytics_report.py [--menu-sizes 10 50 200] [--latency-ms 5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import warnings
+from urllib.parse import parse_qs, urlparse
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+from fastapi.testclient import TestClient
+
+import main
+from main import app, verify_admin
+
+def make_transport(menu_size, latency, calls):
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(latency)
+        url = urlparse(str(request.url))
+        if url.path == "/ratings/bulk":
+            ids = parse_qs(url.query)["menu_item_ids"][0].split(",")
+            return httpx.Response(200, json=[
+                {"menu_item_id": int(i), "menu_item_name": f"Dish {i}", "total_reviews": 10,
+                 "good_reviews": 7, "good_ratio": 0.7}
+                for i in ids
+            ])
+        rows = "".join(f"{i},Dish {i},{i % 7 + 1},{(i % 7 + 1) * 10.0:.2f}\n" for i in range(1, menu_size + 1))
+        return httpx.Response(200, text="item_id,item_name,quantity,income\n" + rows)
+    return httpx.MockTransport(handler)
+
+async def override_verify_admin():
+    return {"id": 1, "username": "bench", "role": "admin"}
+
+def measure(menu_size, latency, repeat):
+    calls = []
+    with TestClient(app) as client:
+        main.service_client = httpx.AsyncClient(transport=make_transport(menu_size, latency, calls))
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get("/report/analytics", params={"report_period": "weekly"})
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+            assert "ERROR" not in response.text
+    return min(timings), len(calls) // repeat
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--menu-sizes", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore")
+    app.dependency_overrides[verify_admin] = override_verify_admin
+    latency = args.latency_ms / 1000
+
+    print(f"{'items':>5} {'calls':>6} {'report ms':>9}")
+    for menu_size in args.menu_sizes:
+        elapsed, calls = measure(menu_size, latency, args.repeat)
+        print(f"{menu_size:>5} {calls:>6} {elapsed * 1000:>9.1f}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,96 @@
+"""
+Requests/sec for GET /menu-items/: the old per-request path vs. the cached snapshot
+served through response_model vs. pre-serialized bytes (plain and gzip).
+
+Usage (from backend/admin_service):
+    python benchmarks/menu_response.py [--menu-sizes 20 100 500] [--requests 500]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import warnings
+from typing import List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import main
+import models
+import schemas
+from main import app, get_db, menu_cache
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@app.get("/bench/legacy-menu-items/", response_model=List[schemas.MenuItem])
+async def legacy_get_all_menu_items(db: Session = Depends(get_db)) -> List[schemas.MenuItem]:
+    """The pre-cache get_all_menu_items: query, from_orm per row, response_model re-validation"""
+    menu_items = db.query(models.MenuItem).filter(models.MenuItem.is_deleted == False).all()
+    return [schemas.MenuItem.from_orm(item) for item in menu_items]
+
+def seed(menu_size):
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    for i in range(menu_size):
+        db.add(models.MenuItem(
+            zh_name=f"菜{i}", en_name=f"Dish {i}", price=10.0 + i,
+            url=f"http://example.com/dish_{i}.png", is_available=True, is_deleted=False
+        ))
+    db.commit()
+    db.close()
+    menu_cache.bump()
+
+def measure(client, path, requests, headers=None, preserialized=True):
+    main.MENU_PRESERIALIZED = preserialized
+    client.get(path, headers=headers)  # warm up / fill the cache
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.text
+    return requests / (time.perf_counter() - start), len(response.content)
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--menu-sizes", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore")
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+    identity = {"Accept-Encoding": "identity"}
+    gzip_only = {"Accept-Encoding": "gzip"}
+
+    print(f"{'items':>5} {'legacy rps':>10} {'model rps':>9} {'bytes rps':>9} {'gzip rps':>8} {'body B':>8} {'gzip B':>7}")
+    for menu_size in args.menu_sizes:
+        seed(menu_size)
+        legacy, _ = measure(client, "/bench/legacy-menu-items/", args.requests, identity)
+        model, _ = measure(client, "/menu-items/", args.requests, identity, preserialized=False)
+        raw, body_size = measure(client, "/menu-items/", args.requests, identity)
+        compressed, _ = measure(client, "/menu-items/", args.requests, gzip_only)
+        gzip_size = len(menu_cache.get(SessionLocal()).encoded("gzip"))
+        print(f"{menu_size:>5} {legacy:>10.0f} {model:>9.0f} {raw:>9.0f} {compressed:>8.0f} {body_size:>8} {gzip_size:>7}")
+
+if __name__ == "__main__":
+    run()
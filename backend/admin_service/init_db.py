@@ -1,14 +1,29 @@
 # admin_service/init_db.py
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
 from database import engine
-from models import Base
-# ----------------------------------------------------------------------
-# 關鍵修改：明確導入所有你想要創建的表所對應的模型類
-from models import MenuItem, MenuChange, BillingNotification, Analytics
-# ----------------------------------------------------------------------
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+# 導入 Alembic 之前已由 create_all 建好的資料庫，結構等同這個 revision
+BASELINE_REVISION = "0001"
+
+def run_migrations():
+    """Upgrade the schema to the latest Alembic revision"""
+    config = Config(ALEMBIC_INI)
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        tables = inspect(connection).get_table_names()
+        if tables and "alembic_version" not in tables:
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, "head")
 
 def init_db():
     print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+    run_migrations()
     print("Database tables created successfully!")
 
 if __name__ == "__main__":
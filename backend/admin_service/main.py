@@ -1,18 +1,26 @@
 # main.py
-from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Header, status
 from sqlalchemy.orm import Session
 from typing import List, Dict, Optional
+import os
+import asyncio
+import httpx
 import requests
 from datetime import datetime, timedelta
 import models
 import schemas
-from database import get_db, Base, engine # <-- 確保從 database.py 導入 Base 和 engine
+from database import get_db, Base, engine, SessionLocal # <-- 確保從 database.py 導入 Base 和 engine
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import io
 import csv
+import pyarrow as pa
 import pika
 import json
-from rabbitmq import send_notifications_to_users, send_menu_notification
+from rabbitmq import send_notifications_to_users, send_menu_notification, publisher
+from menu_cache import menu_cache, etag_matches, MENU_CACHE_CONTROL
+import report_snapshots
+import export_formats
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import HTTPException, status
 from fastapi import Security
@@ -42,12 +50,19 @@ app.add_middleware(
 )
 USER_SERVICE_URL = "http://user-service:8000"
 ORDER_SERVICE_URL = "http://order-service:8000"
+# user_service / order_service 分頁回應帶下一頁 cursor 的 header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# 報表向 order_service / user_service 發出的每個請求的 timeout
+REPORT_CALL_TIMEOUT = float(os.getenv("REPORT_CALL_TIMEOUT", "5"))  # seconds
+service_client: Optional[httpx.AsyncClient] = None
+# 菜單列表直接回傳每個版本預先序列化好的 bytes；設為 false 則走 response_model 序列化
+MENU_PRESERIALIZED = os.getenv("MENU_PRESERIALIZED", "true").lower() == "true"
 
 from fastapi import Request 
 from fastapi.responses import JSONResponse
 security = HTTPBearer(auto_error=False)
 # JWT configuration
-SECRET_KEY = "mealprovider"  # Should be obtained from environment variables in production
+SECRET_KEY = os.getenv("SECRET_KEY", "mealprovider")  # same key user_service signs tokens with
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 async def verify_admin(
@@ -125,6 +140,24 @@ async def validate_and_translate_names(zh_name: str, en_name: str) -> tuple[str,
         en = result.text
 
     return zh, en
+report_precompute_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def startup_event():
+    """Schedule the after-midnight report precompute"""
+    global report_precompute_task
+    if report_snapshots.REPORT_PRECOMPUTE_ENABLED:
+        report_precompute_task = asyncio.create_task(report_precompute_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled RabbitMQ publisher connections and the shared HTTP client"""
+    if report_precompute_task is not None:
+        report_precompute_task.cancel()
+    publisher.close()
+    if service_client is not None:
+        await service_client.aclose()
+
 @app.get("/test/")
 async def test_endpoint():
     return {"message": "Test successful!"}
@@ -132,12 +165,28 @@ async def test_endpoint():
 # 取得所有菜品
 @app.get("/menu-items/", response_model=List[schemas.MenuItem])
 async def get_all_menu_items(
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
+    accept_encoding: Optional[str] = Header(default=None),
     db: Session = Depends(get_db),
    # admin: dict = Security(verify_admin)
 ) -> List[schemas.MenuItem]:
-    # 軟刪除後，預設只顯示未被軟刪除的菜品
-    menu_items = db.query(models.MenuItem).filter(models.MenuItem.is_deleted == False).all()
-    return [schemas.MenuItem.from_orm(item) for item in menu_items]
+    # 菜單只在版本變更後重新載入，沒變就回 304
+    snapshot = menu_cache.get(db)
+    encoding = snapshot.choose_encoding(accept_encoding) if MENU_PRESERIALIZED else None
+    headers = {
+        "ETag": snapshot.etag_for(encoding),
+        "Cache-Control": MENU_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(if_none_match, *snapshot.etags):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if not MENU_PRESERIALIZED:
+        response.headers.update(headers)
+        return list(snapshot.items)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=snapshot.encoded(encoding), media_type="application/json", headers=headers)
 
 # 取得單一菜品 (根據 ID)
 @app.get("/menu-items/{menu_item_id}", response_model=schemas.MenuItem)
@@ -193,6 +242,7 @@ async def soft_delete_menu_item( # 函數名稱也改為 soft_delete
     
     db.commit() # 提交 MenuItem 的更新
     db.refresh(menu_item) # 刷新以獲取更新後的狀態
+    menu_cache.bump()
 
     # 記錄變更：change_type 為 "soft_remove"
     db_menu_change = models.MenuChange(
@@ -237,6 +287,7 @@ async def toggle_menu_item_availability(
     menu_item.is_available = new_is_available # 更新 ORM 對象的狀態
     db.commit()
     db.refresh(menu_item)
+    menu_cache.bump()
     
     admin_role_to_id_map = {
         "admin": 1,
@@ -277,6 +328,7 @@ async def create_menu_item(
     db.add(db_menu_item)
     db.commit()
     db.refresh(db_menu_item) # 刷新以獲取由資料庫生成的 ID 和時間戳
+    menu_cache.bump()
     admin_role_to_id_map = {
         "admin": 1,        # 為 'admin' 角色指定一個整數 ID
         "super_admin": 2,  # 為 'super_admin' 角色指定一個整數 ID
@@ -366,6 +418,7 @@ async def update_menu_item_and_record_change(
     
     db.commit()
     db.refresh(menu_item)
+    menu_cache.bump()
 
     admin_role_to_id_map = {
         "admin": 1,
@@ -419,147 +472,377 @@ async def update_menu_item_and_record_change(
 
     return schemas.MenuChange.from_orm(db_menu_change)
 
+def get_service_client():
+    """Shared async client for report requests, created lazily on the running event loop"""
+    global service_client
+    if service_client is None or service_client.is_closed:
+        service_client = httpx.AsyncClient(timeout=REPORT_CALL_TIMEOUT)
+    return service_client
+
+REPORT_PERIOD_DAYS = {"daily": 1, "weekly": 7, "monthly": 30}
+# 報表每批向 user_service 查詢評價的菜品數，以及累積多少 bytes 就送出一段 CSV
+REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", "200"))
+REPORT_FLUSH_BYTES = int(os.getenv("REPORT_FLUSH_BYTES", "65536"))
+
+def report_window(report_period: str, start_date: Optional[datetime], end_date: Optional[datetime]):
+    """[start, end) of the report in naive UTC; start_date / end_date override report_period"""
+    end = report_snapshots.to_naive_utc(end_date) or datetime.utcnow()
+    start = report_snapshots.to_naive_utc(start_date) or end - timedelta(days=REPORT_PERIOD_DAYS[report_period])
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start_date must be before end_date")
+    return start, end
+
+async def fetch_item_ratings(item_ids: List[str], start: datetime, end: datetime):
+    """
+    一次向 user_service 取得所有菜品在 [start, end) 期間用餐紀錄的評價。
+    回傳 ({menu_item_id: rating_data}, 錯誤訊息或 None)
+    """
+    if not item_ids:
+        return {}, None
+    try:
+        rating_res = await get_service_client().get(
+            f"{USER_SERVICE_URL}/ratings/bulk",
+            params={"menu_item_ids": ",".join(item_ids), "start_date": start.isoformat(), "end_date": end.isoformat()}
+        )
+    except httpx.HTTPError as e:
+        return {}, f"ratings error: {e.__class__.__name__} {e}"
+    if rating_res.status_code != 200:
+        return {}, f"ratings response {rating_res.status_code}"
+    return {str(rating["menu_item_id"]): rating for rating in rating_res.json()}, None
+
+def item_rating(item_id: str, rating_data: Optional[dict], bulk_error: Optional[str]):
+    """回傳 (rating 欄位 dict 或 None, 錯誤訊息或 None)"""
+    if bulk_error:
+        return None, f"menu_item_id {item_id} {bulk_error}"
+    if rating_data is None:
+        # 沒有任何用餐紀錄，等同原本單筆查詢的 404
+        return None, f"menu_item_id {item_id} response 404"
+    total_reviews = rating_data["total_reviews"]
+    good_reviews = rating_data["good_reviews"]
+    return {
+        "total_reviews": total_reviews,
+        "good_reviews": good_reviews,
+        "good_ratio": round(good_reviews / total_reviews, 2) if total_reviews > 0 else 0.0,
+    }, None
+
+async def open_order_trends(report_period: str, start: datetime, end: datetime):
+    """
+    Open the order_trends CSV of [start, end) as a stream.
+    回傳 (response, 欄位名稱, 尚未讀取的資料列 line iterator)；呼叫端負責 aclose()
+    """
+    client = get_service_client()
+    request = client.build_request(
+        "GET",
+        f"{ORDER_SERVICE_URL}/api/analytics",
+        params={
+            "report_type": "order_trends",
+            "report_period": report_period,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat()
+        }
+    )
+    try:
+        response = await client.send(request, stream=True)
+    except httpx.HTTPError:
+        raise HTTPException(status_code=503, detail="Order or Rating service unavailable")
+    if response.status_code != 200:
+        await response.aclose()
+        raise HTTPException(status_code=response.status_code, detail="Failed to fetch analytics report")
+
+    lines = response.aiter_lines()
+    try:
+        header = await lines.__anext__()
+    except StopAsyncIteration:
+        header = ""
+    except httpx.HTTPError:
+        await response.aclose()
+        raise HTTPException(status_code=503, detail="Order or Rating service unavailable")
+    if not header.strip():
+        await response.aclose()
+        raise HTTPException(status_code=502, detail="Empty analytics report from order service")
+    return response, next(csv.reader([header])), lines
+
+def enrich_batch(batch: List[dict], bulk_ratings: dict, bulk_error: Optional[str], totals: dict):
+    """Add the rating columns to one batch of rows and fold it into the running totals"""
+    for row in batch:
+        item_id = row.pop("item_id")
+        rating, error = item_rating(item_id, bulk_ratings.get(item_id), bulk_error)
+        if error:
+            print(f"Analytics report enrichment failed: {error}")
+            totals["errors"].append(error)
+            totals["failed_item_ids"].append(item_id)
+        if rating:
+            row.update(rating)
+            # ✅ 累加總評論數與好評數
+            totals["total_reviews"] += int(rating["total_reviews"])
+            totals["good_reviews"] += int(rating["good_reviews"])
+        else:
+            row["total_reviews"] = ""
+            row["good_reviews"] = ""
+            row["good_ratio"] = ""
+
+        try:
+            totals["income"] += float(row["income"])
+            totals["quantity"] += int(row["quantity"])
+        except (KeyError, TypeError, ValueError):
+            pass
+    return batch
+
+async def enriched_rows(response, columns: List[str], lines, start: datetime, end: datetime, errors: List[str]):
+    """
+    逐列讀取 order_trends，每 REPORT_BATCH_SIZE 個菜品向 user_service 查一次評價後立即輸出，
+    最後輸出邊讀邊累加的 TOTAL 列（以及 ERROR 列）。錯誤訊息同時附加到 errors。
+    """
+    first_column = [name for name in columns if name != "item_id"][0]
+    totals = {"quantity": 0, "income": 0.0, "total_reviews": 0, "good_reviews": 0,
+              "errors": errors, "failed_item_ids": []}
+    stream_error = None
+    try:
+        batch = []
+        try:
+            async for line in lines:
+                if not line:
+                    continue
+                batch.append(dict(zip(columns, next(csv.reader([line])))))
+                if len(batch) >= REPORT_BATCH_SIZE:
+                    # 評價由 user_service 依 dining_date 直接算出同一期間的數量，不需再向 order_service 校正
+                    bulk_ratings, bulk_error = await fetch_item_ratings([row["item_id"] for row in batch], start, end)
+                    for row in enrich_batch(batch, bulk_ratings, bulk_error, totals):
+                        yield row
+                    batch = []
+        except httpx.HTTPError as e:
+            # 已經開始輸出，無法再改 status code，只能在報表最後註明
+            stream_error = f"order trends stream interrupted: {e.__class__.__name__} {e}"
+            print(f"Analytics report failed: {stream_error}")
+            errors.append(stream_error)
+        if batch:
+            bulk_ratings, bulk_error = await fetch_item_ratings([row["item_id"] for row in batch], start, end)
+            for row in enrich_batch(batch, bulk_ratings, bulk_error, totals):
+                yield row
+    finally:
+        await response.aclose()
+
+    # 加總好評比
+    sum_total_reviews = totals["total_reviews"]
+    yield {
+        first_column: "TOTAL",
+        "quantity": totals["quantity"],
+        "income": f"{totals['income']:.2f}",
+        "total_reviews": sum_total_reviews,
+        "good_reviews": totals["good_reviews"],
+        "good_ratio": round(totals["good_reviews"] / sum_total_reviews, 2) if sum_total_reviews else ""
+    }
+
+    # ✅ 加入錯誤提示行
+    failed_item_ids = totals["failed_item_ids"]
+    if failed_item_ids:
+        yield {
+            first_column: f"ERROR: {len(failed_item_ids)} menu items failed to fetch ratings (menu_item_id {' '.join(failed_item_ids)})."
+        }
+    if stream_error:
+        yield {first_column: f"ERROR: {stream_error}"}
+
+async def open_analytics_report(report_period: str, start: datetime, end: datetime):
+    """
+    Sales from order_service joined with ratings from user_service for [start, end), row by row.
+    回傳 (fieldnames, rows async generator 含 TOTAL 列, 錯誤訊息 list；rows 讀完後才完整)
+    """
+    response, columns, lines = await open_order_trends(report_period, start, end)
+    fieldnames = [name for name in columns if name != "item_id"]
+    fieldnames += ["total_reviews", "good_reviews", "good_ratio"]
+    errors = []
+    return fieldnames, enriched_rows(response, columns, lines, start, end, errors), errors
+
+async def build_analytics_report(report_period: str, start: datetime, end: datetime):
+    """The whole report in memory: (fieldnames, rows 含 TOTAL 列, 錯誤訊息 list)"""
+    fieldnames, rows, errors = await open_analytics_report(report_period, start, end)
+    return fieldnames, [row async for row in rows], errors
+
+async def iterate_rows(rows: List[dict]):
+    for row in rows:
+        yield row
+
+def run_with_session(fn, *args):
+    """Call fn(db, *args) in a session of its own; run it with run_in_threadpool from async code"""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+async def save_snapshot_when_complete(rows, fieldnames: List[str], report_period: str, end: datetime, errors: List[str]):
+    """Pass the rows through and store them as the snapshot once the report finished without errors"""
+    # 只有可快取的報表會留下整份資料，快照本身就需要完整的 rows
+    collected = []
+    async for row in rows:
+        collected.append(row)
+        yield row
+    if errors:
+        return
+    # yield 型的 get_db 在開始串流前就已關閉，這裡另開 session
+    await run_in_threadpool(
+        run_with_session, report_snapshots.save_snapshot,
+        "order_trends", report_period, end, {"fieldnames": fieldnames, "rows": collected}
+    )
+
+async def stream_csv(fieldnames: List[str], rows):
+    """CSV text in chunks of about REPORT_FLUSH_BYTES"""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer.writeheader()
+    async for row in rows:
+        writer.writerow(row)
+        if output.tell() >= REPORT_FLUSH_BYTES:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+
+# 其他欄位（item_name 等）一律當作字串
+REPORT_COLUMN_TYPES = {
+    "quantity": pa.int64(),
+    "income": pa.float64(),
+    "total_reviews": pa.int64(),
+    "good_reviews": pa.int64(),
+    "good_ratio": pa.float64(),
+}
+
+def report_schema(fieldnames: List[str]):
+    return pa.schema([(name, REPORT_COLUMN_TYPES.get(name, pa.string())) for name in fieldnames])
+
+def parse_report_column(values, field: pa.Field):
+    """BatchEncoder convert hook: CSV 讀進來的數字是字串，沒有評價時是空字串"""
+    if pa.types.is_string(field.type):
+        return [None if value is None else str(value) for value in values]
+    cast = int if pa.types.is_integer(field.type) else float
+    return [None if value is None or value == "" else cast(value) for value in values]
+
+async def stream_columnar(fieldnames: List[str], rows, export_format: str):
+    """Parquet / Arrow stream, one row group / record batch per REPORT_BATCH_SIZE rows"""
+    encoder = export_formats.BatchEncoder(export_format, report_schema(fieldnames), parse_report_column)
+    batch = []
+    async for row in rows:
+        # TOTAL / ERROR 列只有部分欄位，缺的欄位留 null
+        batch.append(tuple(row.get(name) for name in fieldnames))
+        if len(batch) >= REPORT_BATCH_SIZE:
+            yield encoder.write(batch)
+            batch = []
+    if batch:
+        yield encoder.write(batch)
+    yield encoder.close()
+
+def analytics_response(fieldnames: List[str], rows, snapshot: str, export_format: str = "csv"):
+    body = stream_csv(fieldnames, rows) if export_format == "csv" else stream_columnar(fieldnames, rows, export_format)
+    return StreamingResponse(
+        body,
+        media_type=export_formats.MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f"attachment; filename={export_formats.filename('analytics_with_ratings', export_format)}",
+            "X-Report-Snapshot": snapshot  # hit, miss, none
+        }
+    )
+
 @app.get("/report/analytics", response_class=StreamingResponse)
 async def fetch_analytics_report(
     admin: dict = Security(verify_admin),
     report_period: str = Query("daily", enum=["daily", "weekly", "monthly"]),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    refresh: bool = False,
+    export_format: str = Query("csv", alias="format", enum=list(export_formats.EXPORT_FORMATS)),
+    db: Session = Depends(get_db),
     #GET /report/analytics?report_type=order_trends&report_period=weekly
+    #GET /report/analytics?start_date=2024-01-01T00:00:00&end_date=2024-02-01T00:00:00
 ):
-    try:
-        response = requests.get(
-            f"{ORDER_SERVICE_URL}/api/analytics",
-           params={"report_type": "order_trends", "period": report_period}
-        )
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Failed to fetch analytics report")
-
-        csv_lines = response.iter_lines(decode_unicode=True)
-        reader = csv.DictReader(csv_lines)
-
-        enriched_rows = []
-        errors = []
-
-        total_income = 0.0
-        total_quantity = 0
-        sum_total_reviews = 0
-        sum_good_reviews = 0
-
-        for row in reader:
-            item_id = row.pop("item_id")
-
-            try:
-                # rating_res = requests.get(f"{USER_SERVICE_URL}/ratings/{item_id}")
-                rating_res = requests.get(f"{USER_SERVICE_URL}/ratingswithorder/{item_id}")
-                if rating_res.status_code == 200:
-                    rating_data = rating_res.json()
-                    params = [
-                        ("report_type", "menu_preferences"),
-                        ("report_period", report_period)
-                    ]
-                    params.extend([("order_ids", oid) for oid in rating_data.get("order_ids", [])])
-                    response_with_order_ids = requests.get(
-                        f"{ORDER_SERVICE_URL}/api/analytics",
-                        params = params
-                    )
-                    if response_with_order_ids.status_code == 200:
-                        csv_lines_with_order_ids = response_with_order_ids.iter_lines(decode_unicode=True)
-                        reader_with_order_ids = csv.DictReader(csv_lines_with_order_ids)
-                        result_with_order_ids = next(reader_with_order_ids, None)
-                        total_order_id_count = int(result_with_order_ids["total_order_ids"])
-                        valid_order_id_count = int(result_with_order_ids["recent_orders_within_period"])
-                        invalid_order_id_count = total_order_id_count - valid_order_id_count
-                        row["total_reviews"] = rating_data["total_reviews"] - invalid_order_id_count
-                        row["good_reviews"] = rating_data["good_reviews"] - invalid_order_id_count
-                        row["good_ratio"] = round((rating_data["good_reviews"] - invalid_order_id_count) / (rating_data["total_reviews"] - invalid_order_id_count), 2) if (rating_data["total_reviews"] - invalid_order_id_count) > 0 else 0.0
-                    else:
-                        row["total_reviews"] = rating_data["total_reviews"]
-                        row["good_reviews"] = rating_data["good_reviews"]
-                        row["good_ratio"] = rating_data["good_ratio"]
-                        errors.append(f"menu_item_id {item_id} response {rating_res.status_code}")
-
-
-                    #row["total_reviews"] = rating_data["total_reviews"]
-                    #row["good_reviews"] = rating_data["good_reviews"]
-                    #row["good_ratio"] = rating_data["good_ratio"]
-
-                    # ✅ 累加總評論數與好評數
-                    sum_total_reviews += int(rating_data["total_reviews"]) - invalid_order_id_count
-                    sum_good_reviews += int(rating_data["good_reviews"]) - invalid_order_id_count
-                else:
-                    row["total_reviews"] = ""
-                    row["good_reviews"] = ""
-                    row["good_ratio"] = ""
-                    errors.append(f"menu_item_id {item_id} response {rating_res.status_code}")
-            except requests.RequestException as e:
-                row["total_reviews"] = ""
-                row["good_reviews"] = ""
-                row["good_ratio"] = ""
-                errors.append(f"menu_item_id {item_id} error: {str(e)}")
-
-            try:
-                total_income += float(row["income"])
-                total_quantity += int(row["quantity"])
-            except ValueError:
-                pass
-
-            enriched_rows.append(row)
-
-        # 加總好評比
-        total_good_ratio = round(sum_good_reviews / sum_total_reviews, 2) if sum_total_reviews else ""
-
-        output = io.StringIO()
-        fieldnames = list(enriched_rows[0].keys())
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(enriched_rows)
-
-        writer.writerow({
-            fieldnames[0]: "TOTAL",
-            "quantity": total_quantity,
-            "income": f"{total_income:.2f}",
-            "total_reviews": sum_total_reviews,
-            "good_reviews": sum_good_reviews,
-            "good_ratio": total_good_ratio
-        })
-
-        # ✅ 加入錯誤提示行
+    if export_format not in export_formats.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format")
+    start, end = report_window(report_period, start_date, end_date)
+
+    # 明確指定 end_date、已結束且長度等於 report_period 的期間不會再變動，直接使用儲存的快照；
+    # 預設的期間到現在為止，包含今天的訂單，每次都重新產生
+    cacheable = (
+        end_date is not None
+        and report_snapshots.is_closed(end)
+        and end - start == timedelta(days=REPORT_PERIOD_DAYS[report_period])
+    )
+    if cacheable and not refresh:
+        # 同步 session 的查詢交給 thread pool，不阻塞 event loop
+        snapshot = await run_in_threadpool(report_snapshots.load_snapshot, db, "order_trends", report_period, end)
+        if snapshot is not None:
+            return analytics_response(snapshot.data["fieldnames"], iterate_rows(snapshot.data["rows"]), "hit", export_format)
+
+    fieldnames, rows, errors = await open_analytics_report(report_period, start, end)
+    if cacheable:
+        rows = save_snapshot_when_complete(rows, fieldnames, report_period, end, errors)
+    return analytics_response(fieldnames, rows, "miss" if cacheable else "none", export_format)
+
+async def precompute_reports(now: Optional[datetime] = None):
+    """Store the daily / weekly / monthly reports ending at the last UTC midnight"""
+    end = report_snapshots.last_midnight(now)
+    for report_period, days in REPORT_PERIOD_DAYS.items():
+        existing = await run_in_threadpool(run_with_session, report_snapshots.load_snapshot, "order_trends", report_period, end)
+        if existing is not None:
+            continue
+        try:
+            fieldnames, rows, errors = await build_analytics_report(report_period, end - timedelta(days=days), end)
+        except HTTPException as e:
+            print(f"Report precompute failed for {report_period}: {e.detail}")
+            continue
         if errors:
-            writer.writerow({
-                fieldnames[0]: f"ERROR: {len(errors)} menu items failed to fetch ratings."
-            })
-
-        output.seek(0)
-
-        return StreamingResponse(
-            output,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=analytics_with_ratings.csv"}
+            print(f"Report precompute skipped {report_period}: {len(errors)} rating errors")
+            continue
+        await run_in_threadpool(
+            run_with_session, report_snapshots.save_snapshot,
+            "order_trends", report_period, end, {"fieldnames": fieldnames, "rows": rows}
         )
 
-    except requests.RequestException:
-        raise HTTPException(status_code=503, detail="Order or Rating service unavailable")
+async def report_precompute_loop():
+    while True:
+        await asyncio.sleep(report_snapshots.seconds_until_precompute())
+        try:
+            await precompute_reports()
+        except Exception as e:
+            print(f"Report precompute failed: {e}")
 
 # Get all dining records
 @app.get("/dining-records/", response_model=List[Dict])
 async def get_all_dining_records(
+    response: Response,
+    cursor: Optional[str] = None,  # 原樣轉給 user_service，下一頁的 cursor 由 X-Next-Cursor 帶回
+    limit: Optional[int] = None,  # 不指定時為 user_service 的預設頁大小，不會一次回傳全部紀錄
+    export_format: Optional[str] = Query(None, alias="format"),  # csv, parquet, arrow 直接轉送 user_service 的串流匯出
     db: Session = Depends(get_db),
     admin: dict = Security(verify_admin) #至關掉FOR TEST
 ):
+    if export_format is not None and export_format not in export_formats.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format")
     try:
         # Forward request to user service with API key
-        response = requests.get(
+        params = {"cursor": cursor, "limit": limit, "format": export_format}
+        user_response = requests.get(
             f"{USER_SERVICE_URL}/dining-records/",
+            params={key: value for key, value in params.items() if value is not None},
             headers={
                 "Authorization": f"Bearer {admin['token']}",
                 "X-API-Key": "mealprovider_admin_key"
-            }
+            },
+            stream=export_format is not None
         )
-        if response.status_code != 200:
+        if user_response.status_code != 200:
+            user_response.close()
             raise HTTPException(
-                status_code=response.status_code,
+                status_code=user_response.status_code,
                 detail="Failed to fetch dining records from user service"
             )
-        return response.json()
+        if export_format is not None:
+            return StreamingResponse(
+                user_response.iter_content(chunk_size=REPORT_FLUSH_BYTES),
+                media_type=export_formats.MEDIA_TYPES[export_format],
+                headers={"Content-Disposition": f"attachment; filename={export_formats.filename('dining_records', export_format)}"}
+            )
+        if NEXT_CURSOR_HEADER in user_response.headers:
+            response.headers[NEXT_CURSOR_HEADER] = user_response.headers[NEXT_CURSOR_HEADER]
+        return user_response.json()
     except requests.RequestException:
         raise HTTPException(
             status_code=503,
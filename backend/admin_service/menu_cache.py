@@ -0,0 +1,144 @@
+"""
+Versioned cache of the public menu listing for admin_service.
+
+Admin writes bump the version after they commit; GET /menu-items/ reloads the
+listing at most once per version and answers unchanged menus with 304.
+The JSON body (and its gzip/brotli variants) is rendered once per version and served as bytes.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+try:
+    import brotli  # optional: 沒安裝就只提供 gzip
+except ImportError:
+    brotli = None
+
+import models
+import schemas
+
+# 其他 replica 的寫入不會 bump 本機版本，超過 TTL 就重新從資料庫載入
+MENU_CACHE_TTL = float(os.getenv("MENU_CACHE_TTL", "60"))  # seconds, 0 停用過期檢查
+# 前端輪詢時每次都帶 If-None-Match 重新驗證
+MENU_CACHE_CONTROL = os.getenv("MENU_CACHE_CONTROL", "no-cache")
+# 小於這個大小的 body 壓縮不划算
+MENU_COMPRESS_MIN_SIZE = int(os.getenv("MENU_COMPRESS_MIN_SIZE", "512"))
+
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, compresslevel=6)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+ENCODING_PREFERENCE = ("br", "gzip")
+
+class MenuSnapshot:
+    def __init__(self, version: int, items: Tuple[schemas.MenuItem, ...]):
+        self.version = version
+        self.items = items
+        self.loaded_at = time.monotonic()
+        # 與 FastAPI JSONResponse 相同的編碼方式，輸出和 response_model 路徑一致
+        self.body = json.dumps(
+            [item.model_dump(mode="json") for item in items],
+            ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        ).encode("utf-8")
+        # Strong ETag 只取決於 body：各 replica 的版本號不同，相同菜單仍得到相同 ETag
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:16]}"'
+        self._encoded = {}
+
+    def etag_for(self, encoding: Optional[str]):
+        """Each content-coding is a different representation and gets its own strong ETag"""
+        if encoding is None:
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+    @property
+    def etags(self):
+        return [self.etag] + [self.etag_for(encoding) for encoding in COMPRESSORS]
+
+    def choose_encoding(self, accept_encoding: Optional[str]):
+        if not accept_encoding or len(self.body) < MENU_COMPRESS_MIN_SIZE:
+            return None
+        accepted = set()
+        for token in accept_encoding.split(","):
+            name, _, params = token.strip().partition(";")
+            params = params.replace(" ", "")
+            try:
+                quality = float(params[2:]) if params.startswith("q=") else 1.0
+            except ValueError:
+                quality = 0
+            if quality == 0:
+                continue
+            accepted.add(name.strip().lower())
+        for encoding in ENCODING_PREFERENCE:
+            if encoding in COMPRESSORS and (encoding in accepted or "*" in accepted):
+                return encoding
+        return None
+
+    def encoded(self, encoding: Optional[str]):
+        """Body bytes for the given content-coding, compressed at most once per version"""
+        if encoding is None:
+            return self.body
+        if encoding not in self._encoded:
+            self._encoded[encoding] = COMPRESSORS[encoding](self.body)
+        return self._encoded[encoding]
+
+    def is_stale(self):
+        return MENU_CACHE_TTL > 0 and time.monotonic() - self.loaded_at > MENU_CACHE_TTL
+
+class MenuCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot: Optional[MenuSnapshot] = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def bump(self):
+        """Called after a committed menu write: the next read reloads from the database"""
+        with self._lock:
+            self._version += 1
+            self._snapshot = None
+
+    def get(self, db: Session):
+        snapshot = self._snapshot
+        if snapshot is not None and not snapshot.is_stale():
+            return snapshot
+
+        version = self._version
+        # 軟刪除後，預設只顯示未被軟刪除的菜品
+        items = tuple(
+            schemas.MenuItem.model_validate(item)
+            for item in db.query(models.MenuItem)
+            .filter(models.MenuItem.is_deleted == False)
+            .order_by(models.MenuItem.id)
+            .all()
+        )
+        with self._lock:
+            if snapshot is not None and snapshot.version == self._version and snapshot.items == items:
+                # TTL 到期但內容沒變，沿用同一個 ETag
+                snapshot.loaded_at = time.monotonic()
+                return snapshot
+            fresh = MenuSnapshot(version, items)
+            # 載入期間若有寫入 bump 了版本，不要把舊資料存成新版本
+            if version == self._version:
+                self._snapshot = fresh
+            return fresh
+
+def etag_matches(if_none_match: Optional[str], *etags: str):
+    """RFC 9110 If-None-Match comparison (weak comparison, as required for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") in etags
+        for candidate in if_none_match.split(",")
+    )
+
+menu_cache = MenuCache()
@@ -0,0 +1,70 @@
+"""
+Alembic environment for this service.
+
+The target metadata is models.Base; the URL comes from sqlalchemy.url when it is set
+(alembic.ini or a programmatic Config) and falls back to database.DATABASE_URL.
+A connection passed in config.attributes["connection"] is used as is (init_db, tests).
+"""
+import os
+import sys
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import models
+
+config = context.config
+if config.config_file_name is not None:
+    # 由 init_db 在服務內呼叫時不能關掉服務本身的 logger
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = models.Base.metadata
+
+def database_url():
+    url = config.get_main_option("sqlalchemy.url")
+    if url:
+        return url
+    from database import DATABASE_URL
+    return DATABASE_URL
+
+def run_migrations_offline():
+    context.configure(
+        url=database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_with_connection(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite 無法 ALTER 多數 constraint，改用 batch（複製整張表）模式
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_with_connection(connection)
+        return
+
+    connectable = engine_from_config(
+        {"sqlalchemy.url": database_url()},
+        prefix="sqlalchemy.",
+        poolclass=pool.NullPool,
+    )
+    with connectable.connect() as connection:
+        run_with_connection(connection)
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
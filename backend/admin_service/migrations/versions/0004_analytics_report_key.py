@@ -0,0 +1,44 @@
+"""analytics report key
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 10:07:33.518026
+
+Report snapshots are identified by (report_type, report_period, report_date). Rows
+that would collide on that key are removed first, keeping the newest one.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+analytics = sa.table(
+    'analytics',
+    sa.column('id'), sa.column('report_type'), sa.column('report_period'), sa.column('report_date')
+)
+
+
+def remove_duplicates(bind) -> None:
+    newest = sa.select(sa.func.max(analytics.c.id)).group_by(
+        analytics.c.report_type, analytics.c.report_period, analytics.c.report_date
+    )
+    bind.execute(analytics.delete().where(analytics.c.id.notin_(newest)))
+
+
+def upgrade() -> None:
+    remove_duplicates(op.get_bind())
+    with op.batch_alter_table('analytics') as batch_op:
+        batch_op.create_unique_constraint('uq_analytics_report', ['report_type', 'report_period', 'report_date'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('analytics') as batch_op:
+        batch_op.drop_constraint('uq_analytics_report', type_='unique')
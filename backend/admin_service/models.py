@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, JSON, Table, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, JSON, Table, Boolean, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 from sqlalchemy.orm import relationship
@@ -34,6 +34,15 @@ class MenuItem(Base):
     deleted_at = Column(DateTime, nullable=True) # 記錄刪除時間，預設為 NULL
     # ----------------------
 
+    __table_args__ = (
+        # 菜單列表：WHERE is_deleted = false ORDER BY id，只索引未刪除的菜品
+        Index(
+            "ix_menu_items_active_id", id,
+            postgresql_where=is_deleted == False,
+            sqlite_where=is_deleted == False
+        ),
+    )
+
     # 定義與 MenuChange 的一對多關係，一個菜單項目可以有多個變更記錄
     menu_changes = relationship("MenuChange", back_populates="menu_item")
 
@@ -62,6 +71,11 @@ class MenuChange(Base):
     changed_by = Column(Integer, nullable=False) # 執行變更的管理員 ID
     changed_at = Column(DateTime, default=datetime.utcnow) # 變更發生的時間
 
+    __table_args__ = (
+        # 單一菜品的變更歷史：WHERE menu_item_id = ? ORDER BY changed_at，menu_item.menu_changes 也走這個索引
+        Index("ix_menu_changes_menu_item_id_changed_at", menu_item_id, changed_at),
+    )
+
     # 定義與 MenuItem 的多對一關係
     menu_item = relationship("MenuItem", back_populates="menu_changes")
 
@@ -92,10 +106,12 @@ class BillingNotification(Base):
 
 class Analytics(Base):
     __tablename__ = "analytics"
+    # 報表快照以 (類型, 期間, 期間結束時間) 唯一識別
+    __table_args__ = (UniqueConstraint("report_type", "report_period", "report_date", name="uq_analytics_report"),)
 
     id = Column(Integer, primary_key=True, index=True)
     report_type = Column(String)  # "order_trends", "menu_preferences"
     report_period = Column(String)  # "daily", "weekly", "monthly"
-    report_date = Column(DateTime)
+    report_date = Column(DateTime)  # end of the report window (exclusive)
     data = Column(JSON)
     generated_at = Column(DateTime, default=datetime.utcnow)
@@ -2,6 +2,11 @@ import pika
 import json
 from datetime import datetime
 import os
+import queue
+import logging
+
+logger = logging.getLogger(__name__)
+
 # RabbitMQ configuration
 RABBITMQ_HOST = "rabbitmq"
 RABBITMQ_PORT = 5672
@@ -10,32 +15,102 @@ RABBITMQ_PASSWORD = os.getenv("RABBITMQ_PASSWORD", "password")
 NOTIFICATION_EXCHANGE = "notifications"
 NOTIFICATION_ROUTING_KEY = "billing.notification"
 MENU_NOTIFICATION_QOUTING_KEY = "menu.notification"
+PUBLISHER_POOL_SIZE = int(os.getenv("RABBITMQ_PUBLISHER_POOL_SIZE", "4"))
+PUBLISHER_HEARTBEAT = 60  # seconds
+PUBLISHER_BLOCKED_TIMEOUT = 30  # seconds
+PUBLISH_RETRIES = 2
 
-def get_rabbitmq_channel():
-    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-    parameters = pika.ConnectionParameters(
-        host=RABBITMQ_HOST,
-        port=RABBITMQ_PORT,
-        credentials=credentials
-    )
-    connection = pika.BlockingConnection(parameters)
-    channel = connection.channel()
-    
-    # Declare exchange
-    channel.exchange_declare(
-        exchange=NOTIFICATION_EXCHANGE,
-        exchange_type='topic',
-        durable=True
-    )
-    
-    return channel, connection
+class RabbitMQPublisher:
+    """
+    Pool of long-lived publisher connections with publisher confirms.
+
+    Each slot holds one (connection, channel) pair that is opened lazily,
+    reused across publishes and reopened when the broker drops it.
+    BlockingConnection is not thread-safe, so a slot is checked out by one
+    thread at a time.
+    """
+
+    def __init__(self, pool_size=PUBLISHER_POOL_SIZE):
+        self._slots = queue.LifoQueue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._slots.put(None)
+
+    def _open(self):
+        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
+        parameters = pika.ConnectionParameters(
+            host=RABBITMQ_HOST,
+            port=RABBITMQ_PORT,
+            credentials=credentials,
+            heartbeat=PUBLISHER_HEARTBEAT,
+            blocked_connection_timeout=PUBLISHER_BLOCKED_TIMEOUT
+        )
+        connection = pika.BlockingConnection(parameters)
+        channel = connection.channel()
+        channel.confirm_delivery()
+        channel.exchange_declare(
+            exchange=NOTIFICATION_EXCHANGE,
+            exchange_type='topic',
+            durable=True
+        )
+        return connection, channel
+
+    @staticmethod
+    def _discard(slot):
+        if slot is None:
+            return
+        connection, _ = slot
+        try:
+            if connection.is_open:
+                connection.close()
+        except Exception:
+            pass
+
+    def publish(self, routing_key, message):
+        """Publish a persistent JSON message, blocking until the broker confirms it"""
+        body = json.dumps(message)
+        slot = self._slots.get()
+        try:
+            for attempt in range(PUBLISH_RETRIES):
+                try:
+                    if slot is None or not slot[1].is_open:
+                        self._discard(slot)
+                        slot = self._open()
+                    else:
+                        # Service heartbeats that piled up while the slot sat idle
+                        slot[0].process_data_events(time_limit=0)
+                    slot[1].basic_publish(
+                        exchange=NOTIFICATION_EXCHANGE,
+                        routing_key=routing_key,
+                        body=body,
+                        properties=pika.BasicProperties(
+                            delivery_mode=2,  # make message persistent
+                            content_type='application/json'
+                        )
+                    )
+                    return
+                except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+                    self._discard(slot)
+                    slot = None
+                    if attempt == PUBLISH_RETRIES - 1:
+                        logger.error(f"Failed to publish to RabbitMQ after {PUBLISH_RETRIES} attempts: {e}")
+                        raise
+                    logger.warning(f"RabbitMQ publish failed, reconnecting: {e}")
+        finally:
+            self._slots.put(slot)
+
+    def close(self):
+        """Close every pooled connection"""
+        for _ in range(self._slots.maxsize):
+            slot = self._slots.get()
+            self._discard(slot)
+            self._slots.put(None)
+
+publisher = RabbitMQPublisher()
 
 def send_notification(user_data):
     """
     Send a notification to RabbitMQ for a single user
     """
-    channel, connection = get_rabbitmq_channel()
-    
     notification = {
         "user_id": user_data["user_id"],
         "user_name": user_data["user_name"],
@@ -43,19 +118,8 @@ def send_notification(user_data):
         "timestamp": datetime.utcnow().isoformat()
     }
     
-    # Publish notification to RabbitMQ
-    channel.basic_publish(
-        exchange=NOTIFICATION_EXCHANGE,
-        routing_key=NOTIFICATION_ROUTING_KEY,
-        body=json.dumps(notification),
-        properties=pika.BasicProperties(
-            delivery_mode=2,  # make message persistent
-            content_type='application/json'
-        )
-    )
-    
-    # Close RabbitMQ connection
-    connection.close()
+    # Publish notification over a pooled connection
+    publisher.publish(NOTIFICATION_ROUTING_KEY, notification)
 
 def send_notifications_to_users(unpaid_users):
     """
@@ -77,8 +141,6 @@ def send_menu_notification(menu_item):
     """
     Send a menu item notification to RabbitMQ
     """
-    channel, connection = get_rabbitmq_channel()
-    
     notification = {
         "zh_name": menu_item["zh_name"],
         "en_name": menu_item["en_name"],
@@ -90,16 +152,5 @@ def send_menu_notification(menu_item):
     if "id" in menu_item:
         notification["id"] = menu_item["id"]
     
-    # Publish notification to RabbitMQ
-    channel.basic_publish(
-        exchange=NOTIFICATION_EXCHANGE,
-        routing_key=MENU_NOTIFICATION_QOUTING_KEY,
-        body=json.dumps(notification),
-        properties=pika.BasicProperties(
-            delivery_mode=2,  # make message persistent
-            content_type='application/json'
-        )
-    )
-    
-    # Close RabbitMQ connection
-    connection.close()
\ No newline at end of file
+    # Publish notification over a pooled connection
+    publisher.publish(MENU_NOTIFICATION_QOUTING_KEY, notification)
@@ -0,0 +1,58 @@
+"""
+Stored analytics report snapshots (the analytics table).
+
+A report whose window has already ended no longer changes, so it is kept keyed by
+(report_type, report_period, window end) and served from here on later calls.
+"""
+import os
+from datetime import datetime, time, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+
+# 每天 UTC 午夜後多久預先產生前一個日 / 週 / 月報表，設為 false 停用
+REPORT_PRECOMPUTE_ENABLED = os.getenv("REPORT_PRECOMPUTE_ENABLED", "true").lower() == "true"
+REPORT_PRECOMPUTE_DELAY = float(os.getenv("REPORT_PRECOMPUTE_DELAY", "600"))  # seconds after midnight
+
+def to_naive_utc(value: Optional[datetime]):
+    """Report windows are naive UTC (like report_date), so convert tz-aware inputs before comparing"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def is_closed(window_end: datetime, now: Optional[datetime] = None):
+    return to_naive_utc(window_end) <= (now or datetime.utcnow())
+
+def load_snapshot(db: Session, report_type: str, report_period: str, window_end: datetime):
+    return db.query(models.Analytics).filter(
+        models.Analytics.report_type == report_type,
+        models.Analytics.report_period == report_period,
+        models.Analytics.report_date == window_end
+    ).first()
+
+def save_snapshot(db: Session, report_type: str, report_period: str, window_end: datetime, data: dict):
+    """Insert or replace the snapshot; losing a race against another replica is fine"""
+    snapshot = load_snapshot(db, report_type, report_period, window_end)
+    if snapshot is None:
+        snapshot = models.Analytics(report_type=report_type, report_period=report_period, report_date=window_end)
+        db.add(snapshot)
+    snapshot.data = data
+    snapshot.generated_at = datetime.utcnow()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
+def last_midnight(now: Optional[datetime] = None):
+    return datetime.combine((now or datetime.utcnow()).date(), time(0))
+
+def seconds_until_precompute(now: Optional[datetime] = None):
+    """Seconds from now until the next run, REPORT_PRECOMPUTE_DELAY after a UTC midnight"""
+    now = now or datetime.utcnow()
+    next_run = last_midnight(now) + timedelta(seconds=REPORT_PRECOMPUTE_DELAY)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
@@ -69,6 +69,39 @@ def test_get_all_dining_records_service_error(client, mock_external_services_and
     assert response.status_code == 500
     assert "Failed to fetch dining records from user service" in response.json()["detail"]
 
+def test_get_all_dining_records_passes_cursor(client, mock_external_services_and_rabbitmq):
+    """Test that cursors are passed through to the user service and back."""
+    mock_external_services_and_rabbitmq.get(
+        f"{USER_SERVICE_URL}/dining-records/?cursor=abc&limit=2",
+        json=[{"id": 3, "user_id": 1}, {"id": 4, "user_id": 1}],
+        headers={"X-Next-Cursor": "def"},
+        status_code=200
+    )
+
+    response = client.get("/dining-records/", params={"cursor": "abc", "limit": 2})
+    assert response.status_code == 200
+    assert [record["id"] for record in response.json()] == [3, 4]
+    assert response.headers["X-Next-Cursor"] == "def"
+    assert mock_external_services_and_rabbitmq.last_request.qs == {"cursor": ["abc"], "limit": ["2"]}
+
+def test_get_all_dining_records_export(client, mock_external_services_and_rabbitmq):
+    """Test that columnar exports are streamed through from the user service."""
+    mock_external_services_and_rabbitmq.get(
+        f"{USER_SERVICE_URL}/dining-records/?format=arrow",
+        content=b"arrow-bytes",
+        headers={"Content-Type": "application/vnd.apache.arrow.stream"},
+        status_code=200
+    )
+
+    response = client.get("/dining-records/", params={"format": "arrow"})
+    assert response.status_code == 200
+    assert response.content == b"arrow-bytes"
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    assert mock_external_services_and_rabbitmq.last_request.qs["format"] == ["arrow"]
+
+    response = client.get("/dining-records/", params={"format": "xlsx"})
+    assert response.status_code == 400
+
 def test_get_unpaid_users(client, mock_external_services_and_rabbitmq):
     """Test getting all unpaid users."""
     response = client.get("/users/unpaid")
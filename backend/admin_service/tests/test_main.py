@@ -366,4 +366,82 @@ def test_toggle_availability_of_deleted_menu_item(client, db):
 
     response = client.put(f"/menu-items/{deleted_item.id}/toggle-availability")
     assert response.status_code == 404
-    assert response.json()["detail"] == "Menu item not found or has been deleted"
\ No newline at end of file
+    assert response.json()["detail"] == "Menu item not found or has been deleted"
+def test_get_all_menu_items_conditional(client, db):
+    """測試菜單列表的 ETag / If-None-Match，菜單變更後 ETag 隨之改變。"""
+    menu_item = MenuItem(
+        zh_name="排骨便當", en_name="Pork Chop Bento", price=100.0, url="url_pork", is_available=True, is_deleted=False
+    )
+    db.add(menu_item)
+    db.commit()
+    db.refresh(menu_item)
+    client.put(f"/menu-items/{menu_item.id}/toggle-availability")
+
+    first = client.get("/menu-items/")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+    assert any(item["id"] == menu_item.id and item["is_available"] is False for item in first.json())
+
+    not_modified = client.get("/menu-items/", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+
+    client.delete(f"/menu-items/{menu_item.id}")
+    changed = client.get("/menu-items/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert all(item["id"] != menu_item.id for item in changed.json())
+
+def test_get_all_menu_items_preserialized(client, db):
+    """測試預先序列化的菜單 bytes 與 response_model 路徑輸出一致，並依 Accept-Encoding 壓縮。"""
+    from admin_service import schemas as admin_schemas
+
+    for i in range(10):
+        db.add(MenuItem(
+            zh_name=f"預序列化菜品{i}", en_name=f"Preserialized Dish {i}", price=50.0 + i,
+            url=f"url_preserialized_{i}", is_available=True, is_deleted=False
+        ))
+    db.commit()
+    client.post("/menu-items/", json={
+        "zh_name": "滷肉飯", "en_name": "Braised Pork Rice", "price": 40.0, "url": "url_rice", "is_available": True
+    })
+
+    plain = client.get("/menu-items/", headers={"Accept-Encoding": "identity"})
+    assert plain.status_code == 200
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["content-type"] == "application/json"
+    expected = [
+        admin_schemas.MenuItem.model_validate(item).model_dump(mode="json")
+        for item in db.query(MenuItem).filter(MenuItem.is_deleted == False).order_by(MenuItem.id).all()
+    ]
+    assert plain.json() == expected
+
+    compressed = client.get("/menu-items/", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["vary"] == "Accept-Encoding"
+    assert compressed.headers["etag"] != plain.headers["etag"]
+    # TestClient (httpx) 會自動解壓縮
+    assert compressed.json() == expected
+
+    not_modified = client.get("/menu-items/", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": compressed.headers["etag"]
+    })
+    assert not_modified.status_code == 304
+
+
+def test_menu_etag_depends_only_on_content():
+    """不同 replica 的快取版本號不同，菜單內容相同時 ETag 必須一致。"""
+    from datetime import datetime
+    from admin_service import schemas as admin_schemas
+    from admin_service.menu_cache import MenuSnapshot
+
+    items = tuple(
+        admin_schemas.MenuItem(id=i, zh_name=f"菜{i}", en_name=f"Dish {i}", price=10.0, url="http://example.com",
+                               created_at=datetime(2025, 1, 1), is_deleted=False)
+        for i in (1, 2)
+    )
+    assert MenuSnapshot(1, items).etag == MenuSnapshot(7, items).etag
+    assert MenuSnapshot(1, items).etag_for("gzip") == MenuSnapshot(7, items).etag_for("gzip")
+    changed = (items[0], items[1].model_copy(update={"price": 12.0}))
+    assert MenuSnapshot(1, changed).etag != MenuSnapshot(1, items).etag
@@ -0,0 +1,104 @@
+"""
+Query plans of the menu listing and menu change history on a schema built by the Alembic migrations.
+
+Each query is run through EXPLAIN QUERY PLAN with the same bound parameters the
+endpoint sends; a full table scan or a temp B-tree for ORDER BY fails the test.
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import IntegrityError
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from admin_service import models
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "alembic.ini")
+
+@pytest.fixture(scope="module")
+def connection(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'admin.db'}")
+    with engine.begin() as connection:
+        config = Config(ALEMBIC_INI)
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
+
+        # 軟刪除的菜品會一直留在表內，大多數紀錄都已刪除
+        connection.execute(insert(models.MenuItem), [
+            {
+                "zh_name": f"菜品{i}",
+                "en_name": f"item{i}",
+                "price": 10.0,
+                "is_available": True,
+                "created_at": datetime(2025, 1, 1),
+                "is_deleted": i % 20 != 0,
+            }
+            for i in range(5000)
+        ])
+        connection.execute(insert(models.MenuChange), [
+            {
+                "menu_item_id": i % 250 + 1,
+                "change_type": "update",
+                "new_values": {"price": 10.0},
+                "changed_by": 1,
+                "changed_at": datetime(2025, 1, 1, i % 24),
+            }
+            for i in range(5000)
+        ])
+        connection.exec_driver_sql("ANALYZE")
+    with engine.connect() as connection:
+        yield connection
+    engine.dispose()
+
+def query_plan(connection, stmt):
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    rows = connection.exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + str(compiled),
+        tuple(params[name] for name in compiled.positiontup)
+    ).all()
+    return [row[-1] for row in rows]
+
+def test_migrations_match_models(connection):
+    assert compare_metadata(MigrationContext.configure(connection), models.Base.metadata) == []
+
+def test_active_menu_items_plan(connection):
+    # 與 menu_cache.MenuCache.get 相同的查詢
+    stmt = select(models.MenuItem).where(
+        models.MenuItem.is_deleted == False
+    ).order_by(models.MenuItem.id)
+    plan = query_plan(connection, stmt)
+    assert any("ix_menu_items_active_id" in step for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+def test_menu_change_history_plan(connection):
+    # 單一菜品的變更歷史，依時間排序
+    stmt = select(models.MenuChange).where(
+        models.MenuChange.menu_item_id == 42
+    ).order_by(models.MenuChange.changed_at)
+    plan = query_plan(connection, stmt)
+    assert any("ix_menu_changes_menu_item_id_changed_at" in step for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+def test_baseline_database_gets_the_report_key(tmp_path):
+    # create_all 建好的舊資料庫會被標記為 0001，重複的報表只留最新一筆再加上 unique key
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as connection:
+        config = Config(ALEMBIC_INI)
+        config.attributes["connection"] = connection
+        command.upgrade(config, "0001")
+        report = {"report_type": "order_trends", "report_period": "daily", "report_date": datetime(2025, 1, 2)}
+        connection.execute(insert(models.Analytics), [{"id": 1, **report}, {"id": 2, **report}])
+        command.upgrade(config, "head")
+
+        assert connection.execute(select(models.Analytics.id)).scalars().all() == [2]
+        with pytest.raises(IntegrityError):
+            connection.execute(insert(models.Analytics), [report])
+    engine.dispose()
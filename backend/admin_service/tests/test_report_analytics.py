@@ -1,7 +1,13 @@
 import pytest
 from fastapi.testclient import TestClient
+import httpx
 import requests
 import re
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from urllib.parse import parse_qs, urlparse
 
 import sys
 import os
@@ -9,17 +15,52 @@ import os
 # 將專案根目錄加入 sys.path (根據你之前的路徑設定調整)
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from admin_service.main import app, verify_admin, ORDER_SERVICE_URL, USER_SERVICE_URL
+from admin_service import main as admin_main
+from admin_service.main import app, get_db, verify_admin, ORDER_SERVICE_URL, USER_SERVICE_URL
+from admin_service.models import Analytics, Base
+from admin_service.report_snapshots import seconds_until_precompute
+
+# 報表快照寫入 analytics 資料表，使用 SQLite 記憶體資料庫
+engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+class RequestsTransport(httpx.AsyncBaseTransport):
+    """把報表使用的 httpx 請求轉給 requests，讓 requests_mock 的設定可以共用"""
+
+    async def handle_async_request(self, request):
+        try:
+            res = requests.request(request.method, str(request.url), headers=dict(request.headers))
+        except requests.exceptions.ConnectionError as e:
+            raise httpx.ConnectError(str(e), request=request)
+        headers = {k: v for k, v in res.headers.items() if k.lower() not in ("content-encoding", "content-length")}
+        return httpx.Response(res.status_code, headers=headers, content=res.content, request=request)
 
 # 模擬 verify_admin 權限（覆寫）
 @pytest.fixture(scope="function")
-def client():
+def client(monkeypatch):
     async def override_verify_admin(token: str = "test-token"):
         return {"id": 1, "username": "admin_test", "role": "admin", "token": token}
 
     app.dependency_overrides[verify_admin] = override_verify_admin
+    app.dependency_overrides[get_db] = override_get_db
+    # 串流結束後才寫入快照，那時已不在 get_db 的 session 內
+    monkeypatch.setattr(admin_main, "SessionLocal", TestingSessionLocal)
+    # 每個測試從沒有快照開始
+    db = TestingSessionLocal()
+    db.query(Analytics).delete()
+    db.commit()
+    db.close()
 
     with TestClient(app) as c:
+        admin_main.service_client = httpx.AsyncClient(transport=RequestsTransport())
         yield c
 
     app.dependency_overrides.clear()
@@ -38,16 +79,8 @@ def match_order_trends(request):
         return qs.get("report_type") == ["order_trends"] and (qs.get("period") == ["weekly"] or qs.get("report_period") == ["weekly"])
     return False
 
-# 判斷是否為 menu_preferences 查詢
-def match_menu_preferences(request):
-    if request.path_url.startswith("/api/analytics"):
-        qs = request.qs
-        return qs.get("report_type") == ["menu_preferences"]
-    return False
-
 def test_fetch_analytics_report_with_ratings_success(client, requests_mock_fixture):
     csv_content_order_trends = "item_id,item_name,quantity,income\n1,DishA,10,100.00\n2,DishB,5,50.00\n"
-    csv_content_menu_preferences = "total_order_ids,recent_orders_within_period\n10,8\n"
 
     # mock order_trends
     requests_mock_fixture.register_uri(
@@ -59,25 +92,13 @@ def test_fetch_analytics_report_with_ratings_success(client, requests_mock_fixtu
         headers={"Content-Type": "text/csv"},
     )
 
-    # mock menu_preferences
-    requests_mock_fixture.register_uri(
-        'GET',
-        f"{ORDER_SERVICE_URL}/api/analytics",
-        additional_matcher=match_menu_preferences,
-        content=csv_content_menu_preferences.encode("utf-8"),
-        status_code=200,
-        headers={"Content-Type": "text/csv"},
-    )
-
-    # mock user ratings
+    # mock user ratings (one bulk request for all items, already limited to the report window)
     requests_mock_fixture.get(
-        f"{USER_SERVICE_URL}/ratingswithorder/1",
-        json={"menu_item_id": 1, "menu_item_name": "DishA", "total_reviews": 10, "good_reviews": 8, "good_ratio": 0.75},
-        status_code=200
-    )
-    requests_mock_fixture.get(
-        f"{USER_SERVICE_URL}/ratingswithorder/2",
-        json={"menu_item_id": 2, "menu_item_name": "DishB", "total_reviews": 5, "good_reviews": 3, "good_ratio": 0.64},
+        f"{USER_SERVICE_URL}/ratings/bulk",
+        json=[
+            {"menu_item_id": 1, "menu_item_name": "DishA", "total_reviews": 8, "good_reviews": 6, "good_ratio": 0.75},
+            {"menu_item_id": 2, "menu_item_name": "DishB", "total_reviews": 3, "good_reviews": 1, "good_ratio": 0.33},
+        ],
         status_code=200
     )
 
@@ -103,9 +124,18 @@ def test_fetch_analytics_report_with_ratings_success(client, requests_mock_fixtu
 
     assert "ERROR:" not in total_line
 
+    bulk_requests = [r for r in requests_mock_fixture.request_history if r.path == "/ratings/bulk"]
+    assert len(bulk_requests) == 1
+    assert bulk_requests[0].qs["menu_item_ids"] == ["1,2"]
+    # 評價與銷售使用同一個期間，且不再呼叫 menu_preferences
+    order_requests = [r for r in requests_mock_fixture.request_history if r.path == "/api/analytics"]
+    assert len(order_requests) == 1
+    assert bulk_requests[0].qs["start_date"] == order_requests[0].qs["start_date"]
+    assert bulk_requests[0].qs["end_date"] == order_requests[0].qs["end_date"]
+    assert "include_order_ids" not in bulk_requests[0].qs
+
 def test_fetch_analytics_report_with_partial_rating_failures(client, requests_mock_fixture):
     csv_content_order_trends = "item_id,item_name,quantity,income\n1,DishA,10,100.00\n2,DishB,5,50.00\n3,DishC,2,20.00\n"
-    csv_content_menu_preferences = "total_order_ids,recent_orders_within_period\n17,12\n"
 
     requests_mock_fixture.register_uri(
         'GET',
@@ -115,28 +145,13 @@ def test_fetch_analytics_report_with_partial_rating_failures(client, requests_mo
         status_code=200,
         headers={"Content-Type": "text/csv"},
     )
-    requests_mock_fixture.register_uri(
-        'GET',
-        f"{ORDER_SERVICE_URL}/api/analytics",
-        additional_matcher=match_menu_preferences,
-        content=csv_content_menu_preferences.encode("utf-8"),
-        status_code=200,
-        headers={"Content-Type": "text/csv"},
-    )
 
+    # DishB、DishC 沒有評價資料
     requests_mock_fixture.get(
-        f"{USER_SERVICE_URL}/ratingswithorder/1",
-        json={"menu_item_id": 1, "menu_item_name": "DishA", "total_reviews": 10, "good_reviews": 8, "good_ratio": 0.8},
+        f"{USER_SERVICE_URL}/ratings/bulk",
+        json=[{"menu_item_id": 1, "menu_item_name": "DishA", "total_reviews": 5, "good_reviews": 3, "good_ratio": 0.6}],
         status_code=200
     )
-    requests_mock_fixture.get(
-        f"{USER_SERVICE_URL}/ratingswithorder/2",
-        status_code=404
-    )
-    requests_mock_fixture.get(
-        f"{USER_SERVICE_URL}/ratingswithorder/3",
-        status_code=500
-    )
 
     response = client.get("/report/analytics?report_type=order_trends&report_period=weekly")
 
@@ -163,7 +178,6 @@ def test_fetch_analytics_report_with_partial_rating_failures(client, requests_mo
 
 def test_fetch_analytics_report_default(client, requests_mock_fixture):
     csv_content_order_trends = "item_id,item_name,quantity,income\n1,DishA,10,100.00\n2,DishB,5,50.00\n"
-    csv_content_menu_preferences = "total_order_ids,recent_orders_within_period\n10,8\n"
 
     requests_mock_fixture.register_uri(
         'GET',
@@ -173,23 +187,13 @@ def test_fetch_analytics_report_default(client, requests_mock_fixture):
         status_code=200,
         headers={"Content-Type": "text/csv"},
     )
-    requests_mock_fixture.register_uri(
-        'GET',
-        f"{ORDER_SERVICE_URL}/api/analytics",
-        additional_matcher=match_menu_preferences,
-        content=csv_content_menu_preferences.encode("utf-8"),
-        status_code=200,
-        headers={"Content-Type": "text/csv"},
-    )
 
     requests_mock_fixture.get(
-        f"{USER_SERVICE_URL}/ratingswithorder/1",
-        json={"menu_item_id": 1, "menu_item_name": "DishA", "total_reviews": 10, "good_reviews": 8, "good_ratio": 0.8},
-        status_code=200,
-    )
-    requests_mock_fixture.get(
-        f"{USER_SERVICE_URL}/ratingswithorder/2",
-        json={"menu_item_id": 2, "menu_item_name": "DishB", "total_reviews": 5, "good_reviews": 3, "good_ratio": 0.6},
+        f"{USER_SERVICE_URL}/ratings/bulk",
+        json=[
+            {"menu_item_id": 1, "menu_item_name": "DishA", "total_reviews": 10, "good_reviews": 8, "good_ratio": 0.8},
+            {"menu_item_id": 2, "menu_item_name": "DishB", "total_reviews": 5, "good_reviews": 3, "good_ratio": 0.6},
+        ],
         status_code=200,
     )
 
@@ -209,3 +213,239 @@ def test_fetch_analytics_report_order_service_unavailable(client, requests_mock_
     response = client.get("/report/analytics?report_type=order_trends&report_period=weekly")
     assert response.status_code == 503
     assert "Order or Rating service unavailable" in response.text
+
+def test_fetch_analytics_report_rating_service_timeout(client, requests_mock_fixture):
+    csv_content_order_trends = "item_id,item_name,quantity,income\n1,DishA,10,100.00\n2,DishB,5,50.00\n"
+
+    requests_mock_fixture.register_uri(
+        'GET',
+        f"{ORDER_SERVICE_URL}/api/analytics",
+        additional_matcher=match_order_trends,
+        content=csv_content_order_trends.encode("utf-8"),
+        status_code=200,
+        headers={"Content-Type": "text/csv"},
+    )
+    # 評價服務逾時仍輸出銷售資料，只在報表最後列出失敗的 id
+    requests_mock_fixture.get(
+        f"{USER_SERVICE_URL}/ratings/bulk",
+        exc=requests.exceptions.ConnectTimeout,
+    )
+
+    response = client.get("/report/analytics?report_type=order_trends&report_period=weekly")
+
+    assert response.status_code == 200
+    lines = response.text.strip().splitlines()
+    assert lines[1] == "DishA,10,100.00,,,"
+    assert lines[2] == "DishB,5,50.00,,,"
+    assert lines[-2].startswith("TOTAL,15,150.00,0,0,")
+    assert lines[-1].startswith("ERROR: 2 menu items failed to fetch ratings (menu_item_id 1 2)")
+
+def test_fetch_analytics_report_custom_window(client, requests_mock_fixture):
+    requests_mock_fixture.get(
+        f"{ORDER_SERVICE_URL}/api/analytics",
+        text="item_id,item_name,quantity,income\n1,DishA,4,40.00\n",
+    )
+    requests_mock_fixture.get(
+        f"{USER_SERVICE_URL}/ratings/bulk",
+        json=[{"menu_item_id": 1, "menu_item_name": "DishA", "total_reviews": 2, "good_reviews": 1, "good_ratio": 0.5}],
+    )
+
+    response = client.get("/report/analytics", params={
+        "start_date": "2024-01-01T00:00:00", "end_date": "2024-01-15T12:00:00"
+    })
+
+    assert response.status_code == 200
+    assert response.text.splitlines()[1] == "DishA,4,40.00,2,1,0.5"
+    for request in requests_mock_fixture.request_history:
+        query = parse_qs(urlparse(request.url).query)
+        assert query["start_date"] == ["2024-01-01T00:00:00"]
+        assert query["end_date"] == ["2024-01-15T12:00:00"]
+
+    response = client.get("/report/analytics", params={
+        "start_date": "2024-01-15T00:00:00", "end_date": "2024-01-01T00:00:00"
+    })
+    assert response.status_code == 400
+
+def test_fetch_analytics_report_streams_in_batches(client, requests_mock_fixture, monkeypatch):
+    requests_mock_fixture.get(
+        f"{ORDER_SERVICE_URL}/api/analytics",
+        text="item_id,item_name,quantity,income\n1,DishA,10,100.00\n2,DishB,5,50.00\n3,DishC,2,20.00\n",
+    )
+
+    def ratings(request, context):
+        ids = parse_qs(urlparse(request.url).query)["menu_item_ids"][0].split(",")
+        return [{"menu_item_id": int(i), "menu_item_name": f"Dish{i}", "total_reviews": 4, "good_reviews": int(i)}
+                for i in ids]
+    requests_mock_fixture.get(f"{USER_SERVICE_URL}/ratings/bulk", json=ratings)
+    # 每 2 個菜品查一次評價，TOTAL 列由各批累加
+    monkeypatch.setattr(admin_main, "REPORT_BATCH_SIZE", 2)
+
+    response = client.get("/report/analytics", params={"report_period": "weekly"})
+
+    assert response.status_code == 200
+    assert response.text.strip().splitlines() == [
+        "item_name,quantity,income,total_reviews,good_reviews,good_ratio",
+        "DishA,10,100.00,4,1,0.25",
+        "DishB,5,50.00,4,2,0.5",
+        "DishC,2,20.00,4,3,0.75",
+        "TOTAL,17,170.00,12,6,0.5",
+    ]
+    bulk_requests = [r for r in requests_mock_fixture.request_history if r.path == "/ratings/bulk"]
+    assert [r.qs["menu_item_ids"] for r in bulk_requests] == [["1,2"], ["3"]]
+
+def test_fetch_analytics_report_columnar_formats(client, requests_mock_fixture, monkeypatch):
+    import io
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    requests_mock_fixture.get(
+        f"{ORDER_SERVICE_URL}/api/analytics",
+        text="item_id,item_name,quantity,income\n1,DishA,10,100.00\n2,DishB,5,50.00\n3,DishC,2,20.00\n",
+    )
+    # DishC 沒有評價資料
+    requests_mock_fixture.get(
+        f"{USER_SERVICE_URL}/ratings/bulk",
+        json=[
+            {"menu_item_id": 1, "menu_item_name": "DishA", "total_reviews": 4, "good_reviews": 1},
+            {"menu_item_id": 2, "menu_item_name": "DishB", "total_reviews": 4, "good_reviews": 2},
+        ],
+    )
+    monkeypatch.setattr(admin_main, "REPORT_BATCH_SIZE", 2)
+    expected = {
+        "item_name": ["DishA", "DishB", "DishC", "TOTAL",
+                      "ERROR: 1 menu items failed to fetch ratings (menu_item_id 3)."],
+        "quantity": [10, 5, 2, 17, None],
+        "income": [100.0, 50.0, 20.0, 170.0, None],
+        "total_reviews": [4, 4, None, 8, None],
+        "good_reviews": [1, 2, None, 3, None],
+        "good_ratio": [0.25, 0.5, None, 0.38, None],
+    }
+
+    response = client.get("/report/analytics", params={"report_period": "weekly", "format": "parquet"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.parquet"
+    parquet_file = pq.ParquetFile(io.BytesIO(response.content))
+    assert parquet_file.metadata.num_row_groups == 3
+    assert parquet_file.read(use_threads=False).to_pydict() == expected
+
+    response = client.get("/report/analytics", params={"report_period": "weekly", "format": "arrow"})
+    assert response.status_code == 200
+    assert "analytics_with_ratings.arrow" in response.headers["content-disposition"]
+    assert pa.ipc.open_stream(response.content).read_all().to_pydict() == expected
+
+    response = client.get("/report/analytics", params={"report_period": "weekly", "format": "xlsx"})
+    assert response.status_code == 400
+
+def mock_closed_period_services(requests_mock_fixture, ratings_exc=None):
+    requests_mock_fixture.get(
+        f"{ORDER_SERVICE_URL}/api/analytics",
+        text="item_id,item_name,quantity,income\n1,DishA,4,40.00\n",
+    )
+    if ratings_exc:
+        requests_mock_fixture.get(f"{USER_SERVICE_URL}/ratings/bulk", exc=ratings_exc)
+    else:
+        requests_mock_fixture.get(
+            f"{USER_SERVICE_URL}/ratings/bulk",
+            json=[{"menu_item_id": 1, "menu_item_name": "DishA", "total_reviews": 2, "good_reviews": 1, "good_ratio": 0.5}],
+        )
+
+def test_closed_period_served_from_snapshot(client, requests_mock_fixture):
+    db = TestingSessionLocal()
+    db.query(Analytics).delete()
+    db.commit()
+    mock_closed_period_services(requests_mock_fixture)
+    params = {"report_period": "weekly", "end_date": "2024-03-08T00:00:00"}
+
+    first = client.get("/report/analytics", params=params)
+    assert first.status_code == 200
+    assert first.headers["X-Report-Snapshot"] == "miss"
+    snapshot = db.query(Analytics).one()
+    assert (snapshot.report_type, snapshot.report_period, snapshot.report_date) == (
+        "order_trends", "weekly", datetime(2024, 3, 8)
+    )
+
+    # 已結束的期間不再呼叫 order_service / user_service
+    calls = requests_mock_fixture.call_count
+    second = client.get("/report/analytics", params=params)
+    assert second.headers["X-Report-Snapshot"] == "hit"
+    assert second.text == first.text
+    assert requests_mock_fixture.call_count == calls
+
+    refreshed = client.get("/report/analytics", params={**params, "refresh": "true"})
+    assert refreshed.headers["X-Report-Snapshot"] == "miss"
+    assert requests_mock_fixture.call_count == calls + 2
+
+    # 仍在進行中的期間與自訂長度的區間不快取
+    assert client.get("/report/analytics", params={
+        "report_period": "weekly", "start_date": "2024-03-02T00:00:00"
+    }).headers["X-Report-Snapshot"] == "none"
+    assert client.get("/report/analytics", params={
+        "start_date": "2024-03-02T00:00:00", "end_date": "2024-03-08T00:00:00"
+    }).headers["X-Report-Snapshot"] == "none"
+    assert db.query(Analytics).count() == 1
+    db.close()
+
+def test_window_with_offset_is_normalized_to_utc(client, requests_mock_fixture):
+    mock_closed_period_services(requests_mock_fixture)
+
+    # +08:00 的期間換成 UTC 後與不帶時區的同一期間共用快照
+    first = client.get("/report/analytics", params={"report_period": "weekly", "end_date": "2024-03-08T08:00:00+08:00"})
+    assert first.status_code == 200
+    assert first.headers["X-Report-Snapshot"] == "miss"
+    order_request = [r for r in requests_mock_fixture.request_history if r.path == "/api/analytics"][-1]
+    query = parse_qs(urlparse(order_request.url).query)
+    assert query["start_date"] == ["2024-03-01T00:00:00"]
+    assert query["end_date"] == ["2024-03-08T00:00:00"]
+    assert client.get("/report/analytics", params={
+        "report_period": "weekly", "end_date": "2024-03-08T00:00:00Z"
+    }).headers["X-Report-Snapshot"] == "hit"
+
+def test_report_with_errors_is_not_stored(client, requests_mock_fixture):
+    db = TestingSessionLocal()
+    db.query(Analytics).delete()
+    db.commit()
+    mock_closed_period_services(requests_mock_fixture, ratings_exc=requests.exceptions.ConnectTimeout)
+
+    response = client.get("/report/analytics", params={"report_period": "daily", "end_date": "2024-03-08T00:00:00"})
+    assert response.status_code == 200
+    assert response.text.strip().splitlines()[-1].startswith("ERROR:")
+    assert db.query(Analytics).count() == 0
+    db.close()
+
+def test_precompute_reports(client, requests_mock_fixture):
+    db = TestingSessionLocal()
+    db.query(Analytics).delete()
+    db.commit()
+    mock_closed_period_services(requests_mock_fixture)
+
+    client.portal.call(admin_main.precompute_reports, datetime(2024, 5, 2, 0, 10))
+    stored = {(row.report_period, row.report_date) for row in db.query(Analytics).all()}
+    assert stored == {(period, datetime(2024, 5, 2)) for period in ("daily", "weekly", "monthly")}
+
+    response = client.get("/report/analytics", params={"report_period": "monthly", "end_date": "2024-05-02T00:00:00"})
+    assert response.headers["X-Report-Snapshot"] == "hit"
+    db.close()
+
+def test_default_window_ends_now(client, requests_mock_fixture):
+    mock_closed_period_services(requests_mock_fixture)
+    client.portal.call(admin_main.precompute_reports, datetime.utcnow())
+
+    # 沒有 start_date / end_date：到現在為止的 report_period 天，包含今天的訂單，不使用也不儲存快照
+    before = datetime.utcnow()
+    response = client.get("/report/analytics", params={"report_period": "weekly"})
+    assert response.headers["X-Report-Snapshot"] == "none"
+    order_request = [r for r in requests_mock_fixture.request_history if r.path == "/api/analytics"][-1]
+    query = parse_qs(urlparse(order_request.url).query)
+    end = datetime.fromisoformat(query["end_date"][0])
+    assert before <= end <= datetime.utcnow()
+    assert datetime.fromisoformat(query["start_date"][0]) == end - timedelta(days=7)
+
+    db = TestingSessionLocal()
+    assert db.query(Analytics).count() == 3
+    db.close()
+
+def test_seconds_until_precompute():
+    # 預設在 UTC 午夜後 10 分鐘執行
+    assert seconds_until_precompute(datetime(2024, 5, 1, 23, 0)) == 70 * 60
+    assert seconds_until_precompute(datetime(2024, 5, 2, 0, 5)) == 5 * 60
+    assert seconds_until_precompute(datetime(2024, 5, 2, 0, 10)) == 24 * 60 * 60
@@ -0,0 +1,134 @@
+"""
+Local JWT verification for order_service.
+
+Tokens issued by user_service are checked here (signature + expiry) without a
+round trip. Optionally, whether the subject still exists is confirmed against
+user_service /users/me and cached for PRINCIPAL_CHECK_TTL seconds per token.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+import jwt
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+
+# 與 user_service 簽發 token 用的設定一致（backend-config 的 SECRET_KEY）
+SECRET_KEY = os.getenv("SECRET_KEY", "mealprovider")
+ALGORITHM = "HS256"
+
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user-service:8000")
+# 0 表示只做本地驗證，完全不呼叫 user_service
+PRINCIPAL_CHECK_TTL = float(os.getenv("PRINCIPAL_CHECK_TTL", "0"))  # seconds
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+# user_service 回這些狀態表示 token 確定無效
+DENIED_STATUSES = (401, 403, 404)
+ADMIN_ROLES = ("admin", "super_admin")
+
+security = HTTPBearer(auto_error=False)
+
+# 共用的非同步 HTTP client，重用連線並設定 timeout
+user_service_client = httpx.AsyncClient(base_url=USER_SERVICE_URL, timeout=5.0)
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+principal_cache = TTLCache(PRINCIPAL_CHECK_TTL, PRINCIPAL_CACHE_SIZE)
+
+def unauthorized(detail: str):
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def unavailable():
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="User service unavailable")
+
+def decode_token(token: str):
+    """Validate signature and expiry locally, return the token payload"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp", "sub"]})
+    except jwt.ExpiredSignatureError:
+        raise unauthorized("Token has expired")
+    except jwt.PyJWTError:
+        raise unauthorized("Invalid token")
+    return payload
+
+async def check_principal(token: str):
+    """Confirm the user still exists, at most once per PRINCIPAL_CHECK_TTL per token"""
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
+    try:
+        response = await user_service_client.get(
+            "/users/me",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    except httpx.HTTPError:
+        raise unavailable()
+    # 只快取確定的結果；不存在或被撤銷的也快取，避免同一個 token 一直打 user_service
+    if response.status_code == 200:
+        try:
+            principal = response.json()
+        except ValueError:
+            raise unavailable()
+    elif response.status_code in DENIED_STATUSES:
+        principal = False
+    else:
+        # 5xx、429 等暫時性錯誤不快取，否則有效的使用者會在整個 TTL 內被擋掉
+        raise unavailable()
+    principal_cache.set(token, principal)
+    return principal
+
+async def verify_token(
+    token: Optional[str] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Dependency: accepts a Bearer header (or the legacy ?token= query parameter)"""
+    if credentials:
+        token = credentials.credentials
+    if not token:
+        raise unauthorized("Missing authorization header")
+
+    payload = decode_token(token)
+    principal = {"username": payload["sub"], "id": payload.get("user_id"), "role": payload.get("role"), "token": token}
+    if PRINCIPAL_CHECK_TTL > 0:
+        user = await check_principal(token)
+        if not user:
+            raise unauthorized("Invalid token")
+        principal["id"] = user.get("id", principal["id"])
+        principal["role"] = user.get("role", principal["role"])
+    return principal
+
+def require_owner_or_admin(principal: dict, user_id: int):
+    """Only the user themselves or an admin may act on user_id's orders"""
+    if principal.get("role") not in ADMIN_ROLES and principal.get("id") != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
@@ -0,0 +1,135 @@
+"""
+Round trips per order for POST /orders/, before and after batch pricing.
+
+Usage (from backend/order_service):
+    python benchmarks/order_round_trips.py [--items 1 3 5 10] [--orders 50]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+os.environ.setdefault("IS_TEST", "true")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import models
+from main import app, get_db, menu_cache
+
+# 同一個 sqlite 檔案：同步 engine 給 legacy 版本與 seed，async engine 給 endpoint
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{DB_PATH}")
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+round_trips = 0
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    global round_trips
+    round_trips += 1
+
+def count_commit(conn):
+    global round_trips
+    round_trips += 1
+
+for counted_engine in (engine, async_engine.sync_engine):
+    event.listen(counted_engine, "before_cursor_execute", count_statement)
+    event.listen(counted_engine, "commit", count_commit)
+
+async def override_get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def legacy_create_order(order, db):
+    """The pre-batching create_order: one MenuItem query per line, two .get() per line, two commits"""
+    total_amount = 0
+    for item in order["items"]:
+        menu_item = db.query(models.MenuItem).filter(models.MenuItem.id == item["menu_item_id"]).first()
+        total_amount += menu_item.price * item["quantity"]
+    db_order = models.Order(
+        user_id=order["user_id"],
+        total_amount=total_amount,
+        payment_method=order["payment_method"],
+        payment_status="unpaid",
+    )
+    db.add(db_order)
+    db.commit()
+    db.refresh(db_order)
+    for item in order["items"]:
+        db_order_item = models.OrderItem(
+            order_id=db_order.id,
+            menu_item_id=item["menu_item_id"],
+            quantity=item["quantity"],
+            unit_price=db.query(models.MenuItem).get(item["menu_item_id"]).price
+        )
+        db.add(db_order_item)
+        db.query(models.MenuItem).get(item["menu_item_id"]).en_name
+    db.commit()
+    return db_order
+
+def seed(menu_size):
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    for i in range(menu_size):
+        db.add(models.MenuItem(zh_name=f"菜{i}", en_name=f"Dish {i}", price=10.0 + i, url="", is_available=True))
+    db.commit()
+    db.close()
+    menu_cache.invalidate()
+
+def make_order(items):
+    return {
+        "user_id": 1,
+        "payment_method": "cash",
+        "items": [{"menu_item_id": i + 1, "quantity": 1} for i in range(items)],
+    }
+
+def run_legacy(items, orders):
+    global round_trips
+    seed(items)
+    round_trips = 0
+    start = time.perf_counter()
+    for _ in range(orders):
+        db = SessionLocal()
+        legacy_create_order(make_order(items), db)
+        db.close()
+    return round_trips / orders, (time.perf_counter() - start) / orders
+
+def run_batched(client, items, orders):
+    global round_trips
+    seed(items)
+    round_trips = 0
+    start = time.perf_counter()
+    for _ in range(orders):
+        response = client.post("/orders/", json=make_order(items))
+        assert response.status_code == 200, response.text
+    return round_trips / orders, (time.perf_counter() - start) / orders
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--orders", type=int, default=50)
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore")
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+
+    print(f"{'items':>5} {'before trips':>12} {'after trips':>11} {'before ms':>9} {'after ms':>8}")
+    for items in args.items:
+        before_trips, before_latency = run_legacy(items, args.orders)
+        after_trips, after_latency = run_batched(client, items, args.orders)
+        print(f"{items:>5} {before_trips:>12.1f} {after_trips:>11.1f} {before_latency * 1000:>9.2f} {after_latency * 1000:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+CSV / Parquet / Arrow IPC stream encodings shared by the exports.
+
+Each service image only ships its own directory, so this file is copied verbatim into
+user_service, order_service and admin_service (tests/test_shared_modules.py in
+order_service keeps the copies identical). What differs per export is the schema and,
+optionally, a convert hook; both live next to the export that uses them.
+
+Rows are turned into typed Arrow columns one batch at a time and every batch is emitted
+as soon as it is encoded: one Parquet row group or one Arrow record batch per batch.
+"""
+import csv
+import io
+from typing import Callable, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EXPORT_FORMATS = ("csv", "parquet", "arrow")
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+def filename(name: str, export_format: str):
+    return f"{name}.{export_format}"
+
+def _unchanged(values, field: pa.Field):
+    return values
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain; tell() keeps counting"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet footer 以檔案 offset 記錄 row group 位置，drain 之後也不能歸零
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class BatchEncoder:
+    """Incremental CSV / Parquet / Arrow stream writer; write() and close() return the bytes ready to send
+
+    convert(values, field) is called once per column and batch before the Arrow array is
+    built, e.g. to parse numbers or round them; CSV rows are written as they are.
+    """
+
+    def __init__(
+        self,
+        export_format: str,
+        schema: pa.Schema,
+        convert: Optional[Callable[[Sequence, pa.Field], Sequence]] = None
+    ):
+        self.export_format = export_format
+        self.schema = schema
+        self.convert = convert or _unchanged
+        if export_format == "csv":
+            self._text = io.StringIO()
+            self._csv = csv.writer(self._text, lineterminator="\n")
+            self._csv.writerow(schema.names)
+            return
+        self._sink = _ChunkSink()
+        if export_format == "parquet":
+            self._writer = pq.ParquetWriter(self._sink, schema)
+        else:
+            self._writer = pa.ipc.new_stream(self._sink, schema)
+
+    def _drain_text(self):
+        data = self._text.getvalue().encode("utf-8")
+        self._text.seek(0)
+        self._text.truncate()
+        return data
+
+    def write(self, rows: Sequence[Sequence]):
+        """Append one batch of rows (tuples in schema order)"""
+        if self.export_format == "csv":
+            self._csv.writerows(rows)
+            return self._drain_text()
+        columns = zip(*rows)
+        batch = pa.record_batch(
+            [pa.array(self.convert(column, field), type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+        self._writer.write_batch(batch)
+        return self._sink.drain()
+
+    def close(self):
+        if self.export_format == "csv":
+            return self._drain_text()
+        self._writer.close()
+        return self._sink.drain()
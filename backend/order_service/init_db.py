@@ -1,5 +1,10 @@
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
 from database import engine
-from models import Base
 
 import logging
 
@@ -7,8 +12,22 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+# 導入 Alembic 之前已由 create_all 建好的資料庫，結構等同這個 revision
+BASELINE_REVISION = "0001"
+
+def run_migrations():
+    """Upgrade the schema to the latest Alembic revision"""
+    config = Config(ALEMBIC_INI)
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        tables = inspect(connection).get_table_names()
+        if tables and "alembic_version" not in tables:
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, "head")
+
 
 def init_db():
     logger.info("Initializing database...")
-    # Base.metadata.drop_all(bind=engine)  # 清除舊的表
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    # 每小時 / 每日 rollup 由 migration 0003 從既有訂單回填
+    run_migrations()
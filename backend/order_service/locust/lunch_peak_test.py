@@ -0,0 +1,26 @@
+from locust import HttpUser, constant, task
+
+order_data = {
+    "user_id": 1,
+    "payment_method": "credit_card",
+    "items": [
+        {
+            "menu_item_id": 1,
+            "quantity": 2
+        }
+    ]
+}
+
+class LunchPeakOrderUser(HttpUser):
+    """午餐尖峰：大量同時下單，用來比較 sync / async order_service 的 POST /orders/ 吞吐量
+
+    與 loading_test.py 的基準負載分開，基準測試結果才能與改版前比較：
+    locust -f locust/lunch_peak_test.py --host http://localhost:8001 \\
+        -u 200 -r 20 --headless -t 1m
+    在同樣的 worker 數下分別對改版前後的服務執行，比較 Requests/s 與 p95 latency。
+    """
+    wait_time = constant(0)
+
+    @task
+    def create_order(self):
+        self.client.post("/orders/", json=order_data, name="/orders/")
@@ -1,16 +1,17 @@
-import requests
 import io
 import os
 if os.getenv("IS_TEST") != "true":
     from init_db import init_db
     init_db()
-from fastapi import FastAPI, Depends, HTTPException, APIRouter, Query
+from fastapi import FastAPI, Depends, HTTPException, APIRouter, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, insert, update, or_, select
+import numpy as np
+import pyarrow as pa
 from datetime import date, datetime, time ,timedelta
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from starlette.responses import Response
@@ -18,8 +19,13 @@ from starlette.responses import Response
 import models
 import schemas
 import database
-from database import get_db
+from database import get_db, SessionLocal
 from rabbitmq import *
+from menu_cache import menu_cache, etag_matches, MENU_CACHE_CONTROL
+from auth import verify_token, require_owner_or_admin, user_service_client
+import rollups
+import export_formats
+import pagination
 
 app = FastAPI(title="Order Service API")
 origins = [
@@ -37,11 +43,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[pagination.NEXT_CURSOR_HEADER],
 )
 
-# 用戶服務URL（在k8s中會通過服務發現來獲取）
-USER_SERVICE_URL = "http://user-service:8000"
-
 consumer_thread = None
 
 # Prometheus metrics
@@ -59,27 +63,21 @@ REQUEST_LATENCY = Histogram(
 
 @app.on_event("startup")
 async def startup_event():
-    from database import engine
-    from models import Base
-
-    def init_db():
-        Base.metadata.create_all(bind=engine)
-
-    print("Creating database tables...")
-    init_db()
-    print("Database tables created successfully!")
     """Initialize services on startup"""
-    
-    # Get a database session
-    db = next(get_db())
+    # 資料表由 init_db 透過 Alembic migration 建立（見檔案開頭），這裡不再 create_all
+
+    # Get a database session (the consumer thread uses the sync engine)
+    db = SessionLocal()
     
     try:
+        # 啟動時載入菜單快照，之後由 menu.notification consumer 更新
+        menu_cache.replace(db.query(models.MenuItem).all())
         if os.getenv("IS_TEST") != "true":
             global consumer_thread
             # Set up RabbitMQ
             setup_rabbitmq()
-            # Start the consumer thread
-            consumer_thread = start_consumer_thread(db)
+            # Start the consumer thread; it opens its own session per batch
+            consumer_thread = start_consumer_thread(SessionLocal)
     finally:
         db.close()
 
@@ -90,6 +88,8 @@ async def shutdown_event():
     if consumer_thread and consumer_thread.is_alive():
         # The thread is a daemon thread, so it will be terminated when the main process exits
         pass
+    await publisher.close()
+    await user_service_client.aclose()
 
 # Add metrics endpoint
 @app.get("/metrics")
@@ -116,57 +116,92 @@ async def metrics_middleware(request, call_next):
     
     return response
 
-# 驗證用戶token的依賴
-async def verify_token(token: str, db: Session = Depends(get_db)):
-    try:
-        response = requests.get(
-            f"{USER_SERVICE_URL}/users/me",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        if response.status_code == 200:
-            return response.json()
-        raise HTTPException(status_code=401, detail="Invalid token")
-    except requests.RequestException:
-        raise HTTPException(status_code=503, detail="User service unavailable")
 
 # 菜單項目相關路由
 @app.post("/menu-items/", response_model=schemas.MenuItem)
-def create_menu_item(
+async def create_menu_item(
     menu_item: schemas.MenuItemCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     db_menu_item = models.MenuItem(**menu_item.dict())
     db.add(db_menu_item)
-    db.commit()
-    db.refresh(db_menu_item)
+    await db.commit()
+    await db.refresh(db_menu_item)
+    menu_cache.upsert(db_menu_item)
     return db_menu_item
 
+async def load_menu_snapshot(db: AsyncSession):
+    """Reload the whole menu from the database into the in-process cache"""
+    result = await db.execute(select(models.MenuItem))
+    return menu_cache.replace(result.scalars().all())
+
 @app.get("/menu-items/", response_model=List[schemas.MenuItem])
-def get_menu_items(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+async def get_menu_items(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_db)
 ):
-    return db.query(models.MenuItem).offset(skip).limit(limit).all()
+    snapshot = menu_cache.get("list") or await load_menu_snapshot(db)
+    headers = {"ETag": snapshot.etag, "Cache-Control": MENU_CACHE_CONTROL}
+    # 菜單沒變就直接回 304，不查資料庫也不序列化
+    if etag_matches(if_none_match, snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    # 依 (created_at, id) 由舊到新分頁，直接在快照上二分搜尋 cursor 位置
+    items = snapshot.page(pagination.decode_cursor(cursor) if cursor else None, limit)
+    return pagination.page(response, items, limit, lambda item: (item.created_at, item.id))
 
-# 訂單相關路由
-@app.post("/orders/", response_model=schemas.Order)
-async def create_order(
-    order: schemas.OrderCreate,
-    db: Session = Depends(get_db)
-):
-    # 計算訂單總金額
+async def price_order_items(db: AsyncSession, items: List[schemas.OrderItemCreate]):
+    """
+    Price an order from the menu snapshot; items missing from it are read with one IN query.
+    Repeated menu items are merged into one line, returns ([(menu_item, quantity)], total_amount)
+    """
+    quantities = {}
+    for item in items:
+        quantities[item.menu_item_id] = quantities.get(item.menu_item_id, 0) + item.quantity
+
+    snapshot = menu_cache.get("price") or await load_menu_snapshot(db)
+    menu_items = {
+        menu_item_id: snapshot.by_id[menu_item_id]
+        for menu_item_id in quantities
+        if menu_item_id in snapshot.by_id
+    }
+    missing_ids = [menu_item_id for menu_item_id in quantities if menu_item_id not in menu_items]
+    if missing_ids:
+        # 快照中沒有（例如通知尚未送達），回資料庫查並補進快照
+        result = await db.execute(
+            select(models.MenuItem).where(models.MenuItem.id.in_(missing_ids))
+        )
+        for menu_item in result.scalars():
+            menu_cache.upsert(menu_item)
+            menu_items[menu_item.id] = menu_item
+
+    line_items = []
     total_amount = 0
-    for item in order.items:
-        menu_item = db.query(models.MenuItem).filter(models.MenuItem.id == item.menu_item_id).first()
+    for menu_item_id, quantity in quantities.items():
+        menu_item = menu_items.get(menu_item_id)
         if not menu_item:
-            raise HTTPException(status_code=404, detail=f"Menu item {item.menu_item_id} not found")
+            raise HTTPException(status_code=404, detail=f"Menu item {menu_item_id} not found")
         if not menu_item.is_available:
             pass
             #raise HTTPException(status_code=400, detail=f"Menu item {menu_item.en_name} is not available")
-        total_amount += menu_item.price * item.quantity
+        line_items.append((menu_item, quantity))
+        total_amount += menu_item.price * quantity
+
+    return line_items, total_amount
+
+# 訂單相關路由
+@app.post("/orders/", response_model=schemas.Order)
+async def create_order(
+    order: schemas.OrderCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    # 一次查詢所有菜單項目並計算訂單總金額
+    line_items, total_amount = await price_order_items(db, order.items)
 
-    # 創建訂單
+    # 創建訂單，flush 取得 id 但不提交，訂單與訂單項目在同一個交易內寫入
     db_order = models.Order(
         user_id=order.user_id,
         total_amount=total_amount,
@@ -174,93 +209,199 @@ async def create_order(
         payment_status=order.payment_status,
     )
     db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
-
-    # 添加訂單項目
-    for item in order.items:
-        db_order_item = models.OrderItem(
-            order_id=db_order.id,
-            menu_item_id=item.menu_item_id,
-            quantity=item.quantity,
-            unit_price=db.query(models.MenuItem).get(item.menu_item_id).price
-        )
-        db.add(db_order_item)
-        dining_record_item_dict = {
-            "user_id": order.user_id,
-            "order_id": db_order.id,
-            "menu_item_id": item.menu_item_id,
-            "menu_item_name": db.query(models.MenuItem).get(item.menu_item_id).en_name,
-            "total_amount": db_order_item.unit_price * item.quantity,
-            "payment_status": db_order.payment_status
+    await db.flush()
+
+    # 一次批次寫入所有訂單項目
+    await db.execute(
+        insert(models.OrderItem),
+        [
+            {
+                "order_id": db_order.id,
+                "menu_item_id": menu_item.id,
+                "quantity": quantity,
+                "unit_price": menu_item.price,
+            }
+            for menu_item, quantity in line_items
+        ]
+    )
+    # 在提交前組好回應與通知內容
+    created_order = schemas.Order.model_validate(db_order)
+    order_event_items = [
+        {
+            "menu_item_id": menu_item.id,
+            "menu_item_name": menu_item.en_name,
+            "total_amount": menu_item.price * quantity
         }
-        if os.getenv("IS_TEST") != "true":
-            send_order_notification(dining_record_item_dict) 
-    
-    db.commit()
-    return db_order
+        for menu_item, quantity in line_items
+    ]
+    # 同一個交易內累加每小時 / 每日的銷售 rollup，放在 commit 前最後一步以縮短熱門 rollup 列的鎖定時間
+    await rollups.add_order(db, db_order.order_date, [
+        (menu_item.id, quantity, menu_item.price * quantity) for menu_item, quantity in line_items
+    ])
+    await db.commit()
+
+    if os.getenv("IS_TEST") != "true":
+        # 一張訂單只送一則事件，包含所有訂單項目
+        await send_order_event(
+            ORDER_PLACED_EVENT,
+            created_order.user_id,
+            created_order.payment_status,
+            [{"order_id": created_order.id, "items": order_event_items}]
+        )
+
+    return created_order
 
 @app.get("/orders/{order_id}", response_model=schemas.Order)
-def get_order(
+async def get_order(
     order_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    order = await db.scalar(select(models.Order).where(models.Order.id == order_id))
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
 @app.get("/users/{user_id}/orders/", response_model=List[schemas.Order])
-def get_user_orders(
+async def get_user_orders(
     user_id: int,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    response: Response,
+    cursor: Optional[str] = None,  # 上一頁回應的 X-Next-Cursor
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
 ):
-    return db.query(models.Order).filter(
-        models.Order.user_id == user_id
-    ).offset(skip).limit(limit).all()
+    # 由新到舊，keyset 在 (order_date, id) 上
+    result = await db.execute(
+        pagination.keyset(
+            select(models.Order).where(models.Order.user_id == user_id),
+            models.Order.order_date, models.Order.id, cursor, limit
+        )
+    )
+    return pagination.page(response, result.scalars().all(), limit, lambda order: (order.order_date, order.id))
 
 @app.put("/orders/{user_id}/status")
-def update_order_status(
+async def update_order_status(
     user_id: int,
     status: str,
-    db: Session = Depends(get_db)
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    order_ids: List[int] = Query(default=None),
+    db: AsyncSession = Depends(get_db),
+    principal: dict = Depends(verify_token)  # 本地驗證 user_service 簽發的 JWT
 ):
-    orders = db.query(models.Order).filter(models.Order.user_id == user_id).all()
-    if not orders:
-        raise HTTPException(status_code=404, detail="No orders found for this user")
+    require_owner_or_admin(principal, user_id)
     if status not in ["paid", "unpaid"]:
         raise HTTPException(status_code=400, detail="Invalid status")
-    for order in orders:
-        logger.info(f"Updating order {order.id} status to {status}")
-        current_order_items = db.query(models.OrderItem).filter(models.OrderItem.order_id == order.id).all()
-        for item in current_order_items:
-            new_record_dict = {
-                "user_id": user_id,
-                "order_id": order.id,
-                "menu_item_id": item.menu_item_id,
-                "menu_item_name": db.query(models.MenuItem).get(item.menu_item_id).en_name,
-                "total_amount": item.unit_price * item.quantity,
-                "payment_status": status,
-                "is_put": True
-            }
-            order.payment_status = status
-            if os.getenv("IS_TEST") != "true":
-                send_order_notification(new_record_dict)
+
+    # 一次 UPDATE 只更新狀態不同的訂單，並取回受影響的訂單 id
+    stmt = update(models.Order).where(
+        models.Order.user_id == user_id,
+        or_(models.Order.payment_status.is_(None), models.Order.payment_status != status)
+    )
+    # 可選的結算範圍：訂單日期 [start_date, end_date) 或指定訂單
+    if start_date is not None:
+        stmt = stmt.where(models.Order.order_date >= start_date)
+    if end_date is not None:
+        stmt = stmt.where(models.Order.order_date < end_date)
+    if order_ids:
+        stmt = stmt.where(models.Order.id.in_(order_ids))
+    updated_order_ids = (await db.execute(
+        stmt.values(payment_status=status)
+        .returning(models.Order.id)
+        .execution_options(synchronize_session=False)
+    )).scalars().all()
+
+    if not updated_order_ids:
+        has_orders = await db.scalar(
+            select(models.Order.id).where(models.Order.user_id == user_id).limit(1)
+        )
+        if has_orders is None:
+            raise HTTPException(status_code=404, detail="No orders found for this user")
+        return {"user_id": user_id, "payment_status": status, "updated_order_ids": []}
+
+    # 一次 join 取回受影響訂單的所有項目與菜名
+    order_item_rows = (await db.execute(
+        select(
+            models.OrderItem.order_id,
+            models.OrderItem.menu_item_id,
+            models.MenuItem.en_name,
+            models.OrderItem.unit_price,
+            models.OrderItem.quantity
+        )
+        .join(models.MenuItem, models.OrderItem.menu_item_id == models.MenuItem.id)
+        .where(models.OrderItem.order_id.in_(updated_order_ids))
+        .order_by(models.OrderItem.order_id)
+    )).all()
+    await db.commit()
+    logger.info(f"Updated orders {updated_order_ids} of user {user_id} to {status}")
+
+    changed_orders = {order_id: {"order_id": order_id, "items": []} for order_id in sorted(updated_order_ids)}
+    for row in order_item_rows:
+        changed_orders[row.order_id]["items"].append({
+            "menu_item_id": row.menu_item_id,
+            "menu_item_name": row.en_name,
+            "total_amount": row.unit_price * row.quantity
+        })
+    if os.getenv("IS_TEST") != "true":
+        # 所有訂單的狀態變更合併成一則事件
+        await send_order_event(ORDER_STATUS_CHANGED_EVENT, user_id, status, list(changed_orders.values()))
+
+    return {"user_id": user_id, "payment_status": status, "updated_order_ids": sorted(updated_order_ids)}
 
 
 router = APIRouter()
 
+# order_trends 每次從 cursor 取出並寫出的列數
+ANALYTICS_YIELD_PER = int(os.getenv("ANALYTICS_YIELD_PER", "1000"))
+
+ORDER_TRENDS_SCHEMA = pa.schema([
+    ("item_id", pa.int64()),
+    ("item_name", pa.string()),
+    ("quantity", pa.int64()),
+    ("income", pa.float64()),
+])
+
+def round_income(values, field: pa.Field):
+    """BatchEncoder convert hook: income rounded like the CSV"""
+    if field.name == "income":
+        return np.round(np.asarray(values, dtype=np.float64), 2)
+    return values
+
+def order_trends_line(row):
+    return f"{row.item_id},{row.item_name},{row.quantity},{row.income:.2f}\n"
+
+async def stream_order_trends(session: AsyncSession, result, rows, export_format: str = "csv"):
+    """Emit the export one cursor batch at a time, then release the cursor and the session"""
+    try:
+        if export_format == "csv":
+            yield "item_id,item_name,quantity,income\n"
+            while rows:
+                yield "".join(order_trends_line(row) for row in rows)
+                rows = await result.fetchmany(ANALYTICS_YIELD_PER)
+        else:
+            # 每批 cursor 結果直接轉成欄位寫成一個 row group / record batch
+            encoder = export_formats.BatchEncoder(export_format, ORDER_TRENDS_SCHEMA, round_income)
+            while rows:
+                yield encoder.write(rows)
+                rows = await result.fetchmany(ANALYTICS_YIELD_PER)
+            yield encoder.close()
+    finally:
+        await result.close()
+        await session.close()
+
 @router.get("/analytics", response_class=StreamingResponse)
-def get_analytics(
+async def get_analytics(
     report_type: str = "order_trends", # select from "order_trends", "menu_preferences"
     report_period: str = "daily", # select from "daily", "weekly", "monthly"
     order_ids: List[int] = Query(default=None),
-    db: Session = Depends(get_db)
+    start_date: Optional[datetime] = None,  # [start_date, end_date) 覆寫 report_period
+    end_date: Optional[datetime] = None,
+    export_format: str = Query("csv", alias="format"),  # csv, parquet, arrow（僅 order_trends）
+    db: AsyncSession = Depends(get_db)
 ):
     if report_type not in ["order_trends", "menu_preferences"]:
         raise HTTPException(status_code=400, detail="Invalid report type")
+    if export_format not in export_formats.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format")
     if report_period not in ["daily", "weekly", "monthly"]:
         raise HTTPException(status_code=400, detail="Invalid report period")
     day_dict = {
@@ -270,51 +411,47 @@ def get_analytics(
         }
     if report_type == "order_trends":
         # Aggregate: item_id, item_name, total_quantity, total_income
-        
-        results = (
-            db.query(
-                models.MenuItem.id.label("item_id"),
-                models.MenuItem.en_name.label("item_name"),
-                func.sum(models.OrderItem.quantity).label("quantity"),
-                func.sum(models.OrderItem.unit_price * models.OrderItem.quantity).label("income")
-            )
-            .join(models.OrderItem, models.MenuItem.id == models.OrderItem.menu_item_id)
-            .join(models.Order, models.OrderItem.order_id == models.Order.id)
-            .filter(models.Order.order_date >= (datetime.utcnow() - timedelta(days=day_dict[report_period])))
-            .group_by(models.MenuItem.id, models.MenuItem.en_name)
-            .order_by(func.sum(models.OrderItem.quantity).desc())
-            .all()
-        )
+        window_end = rollups.to_naive_utc(end_date) or datetime.utcnow()
+        window_start = rollups.to_naive_utc(start_date) or (window_end - timedelta(days=day_dict[report_period]))
+        if window_start >= window_end:
+            raise HTTPException(status_code=400, detail="start_date must be before end_date")
 
-        if not results:
+        # 整天 / 整點的區間讀 rollup，只有區間頭尾不滿一小時的部分查原始訂單
+        # 用自己的 session 開 server-side cursor：yield 型 dependency 會在 response 開始串流前就關閉
+        session = database.AsyncSessionLocal()
+        try:
+            result = await session.stream(
+                rollups.order_trends_query(window_start, window_end).execution_options(yield_per=ANALYTICS_YIELD_PER)
+            )
+            rows = await result.fetchmany(ANALYTICS_YIELD_PER)
+        except BaseException:
+            await session.close()
+            raise
+        if not rows:
+            await result.close()
+            await session.close()
             raise HTTPException(status_code=404, detail="No order data found")
 
-        # Generate CSV
-        buffer = io.StringIO()
-        buffer.write("item_id,item_name,quantity,income\n")
-        for row in results:
-            buffer.write(f"{row.item_id},{row.item_name},{row.quantity},{row.income:.2f}\n")
-        buffer.seek(0)
-
         return StreamingResponse(
-            buffer,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=analytics.csv"}
+            stream_order_trends(session, result, rows, export_format),
+            media_type=export_formats.MEDIA_TYPES[export_format],
+            headers={"Content-Disposition": f"attachment; filename={export_formats.filename('analytics', export_format)}"}
         )
     elif report_type == "menu_preferences":
         if order_ids is None:
             raise HTTPException(status_code=400, detail="Order IDs must be provided for menu preferences report")
+        if export_format != "csv":
+            raise HTTPException(status_code=400, detail="menu_preferences is only available as csv")
         # Define date threshold
         start_date = datetime.utcnow() - timedelta(days=day_dict[report_period])
     
         # Query how many of the given order_ids are within the time window
-        recent_order_count = (
-            db.query(models.Order)
-            .filter(
+        recent_order_count = await db.scalar(
+            select(func.count(models.Order.id))
+            .where(
                 models.Order.id.in_(order_ids),
                 models.Order.order_date >= start_date
             )
-            .count()
         )
     
         # Generate CSV
@@ -0,0 +1,144 @@
+"""
+In-process menu snapshot for order_service.
+
+The menu only changes when admins edit it (delivered through menu.notification),
+so GET /menu-items/ and order pricing read an immutable snapshot instead of Postgres.
+Writers build a new snapshot and swap the reference under a lock; readers never lock.
+Each snapshot carries a strong ETag so unchanged menus are answered with 304.
+"""
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+import schemas
+
+# 超過 TTL 的快照視為過期並從資料庫重新載入，避免多個 replica 只有一個收到 menu.notification 時永遠不一致
+MENU_CACHE_TTL = float(os.getenv("MENU_CACHE_TTL", "60"))  # seconds, 0 停用過期檢查
+# 前端輪詢時每次都帶 If-None-Match 重新驗證
+MENU_CACHE_CONTROL = os.getenv("MENU_CACHE_CONTROL", "no-cache")
+
+MENU_CACHE_REQUESTS = Counter(
+    'order_service_menu_cache_requests_total',
+    'Menu cache lookups',
+    ['operation', 'result']  # result: hit, miss, stale
+)
+
+MENU_CACHE_VERSION = Gauge(
+    'order_service_menu_cache_version',
+    'Version of the in-process menu snapshot'
+)
+
+MENU_CACHE_AGE = Gauge(
+    'order_service_menu_cache_age_seconds',
+    'Seconds since the menu snapshot was last refreshed'
+)
+
+class MenuSnapshot:
+    def __init__(self, version: int, items: Tuple[schemas.MenuItem, ...], loaded_at: float):
+        self.version = version
+        self.items = items
+        self.by_id: Dict[int, schemas.MenuItem] = {item.id: item for item in items}
+        self.loaded_at = loaded_at
+        self._etag = None
+        self._ordered = None
+        self._keys = None
+
+    @property
+    def etag(self):
+        """Strong ETag from the content alone, computed once per version"""
+        if self._etag is None:
+            # 不含版本號、依 id 排序：每個 replica 的版本號與載入順序不同，相同菜單仍得到相同 ETag
+            body = json.dumps(
+                [item.model_dump(mode="json") for item in sorted(self.items, key=lambda item: item.id)],
+                sort_keys=True, ensure_ascii=False
+            ).encode("utf-8")
+            self._etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        return self._etag
+
+    def page(self, after: Optional[Tuple[datetime, int]], limit: int):
+        """Up to limit + 1 items in (created_at, id) order after the keyset position `after`"""
+        if self._ordered is None:
+            self._ordered = sorted(self.items, key=lambda item: (item.created_at, item.id))
+            self._keys = [(item.created_at, item.id) for item in self._ordered]
+        start = 0 if after is None else bisect.bisect_right(self._keys, after)
+        return self._ordered[start:start + limit + 1]
+
+    def is_stale(self):
+        return MENU_CACHE_TTL > 0 and time.monotonic() - self.loaded_at > MENU_CACHE_TTL
+
+class MenuCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot: Optional[MenuSnapshot] = None
+        MENU_CACHE_AGE.set_function(self.age)
+
+    def age(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return float("nan")
+        return time.monotonic() - snapshot.loaded_at
+
+    def _swap(self, items):
+        # 呼叫者需持有 self._lock
+        items = tuple(sorted(items, key=lambda item: item.id))
+        previous = self._snapshot
+        # 內容沒變（例如 TTL 重新載入）就沿用版本號，ETag 不變，client 仍可拿到 304
+        if previous is None or previous.items != items:
+            self._version += 1
+        self._snapshot = MenuSnapshot(self._version, items, time.monotonic())
+        MENU_CACHE_VERSION.set(self._version)
+        return self._snapshot
+
+    def replace(self, menu_items):
+        """Replace the whole snapshot with the given MenuItem rows"""
+        items = [schemas.MenuItem.model_validate(menu_item) for menu_item in menu_items]
+        with self._lock:
+            return self._swap(items)
+
+    def upsert(self, menu_item):
+        """Add or replace one MenuItem row in a new snapshot version"""
+        item = schemas.MenuItem.model_validate(menu_item)
+        with self._lock:
+            if self._snapshot is None:
+                # 尚未完整載入，不能只放一筆，等下一次 miss 再整份載入
+                return None
+            items = dict(self._snapshot.by_id)
+            items[item.id] = item
+            return self._swap(items.values())
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def get(self, operation):
+        """Return the current snapshot, or None (counted as miss/stale) if it must be reloaded"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            MENU_CACHE_REQUESTS.labels(operation=operation, result="miss").inc()
+            return None
+        if snapshot.is_stale():
+            MENU_CACHE_REQUESTS.labels(operation=operation, result="stale").inc()
+            return None
+        MENU_CACHE_REQUESTS.labels(operation=operation, result="hit").inc()
+        return snapshot
+
+def etag_matches(if_none_match: Optional[str], etag: str):
+    """RFC 9110 If-None-Match comparison (weak comparison, as required for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
+
+menu_cache = MenuCache()
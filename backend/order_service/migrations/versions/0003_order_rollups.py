@@ -0,0 +1,79 @@
+"""order rollups
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 10:04:51.270318
+
+Hourly and daily per-menu-item order rollups, backfilled from the existing orders
+(the same buckets `python rollups.py` builds).
+
+"""
+from datetime import datetime, time
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+orders = sa.table('orders', sa.column('id', sa.Integer), sa.column('order_date', sa.DateTime))
+order_items = sa.table(
+    'order_items',
+    sa.column('order_id', sa.Integer), sa.column('menu_item_id', sa.Integer),
+    sa.column('quantity', sa.Integer), sa.column('unit_price', sa.Float)
+)
+
+
+def create_rollup(name):
+    return op.create_table(name,
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('menu_item_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('income', sa.Float(), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('bucket_start', 'menu_item_id')
+    )
+
+
+def backfill(bind, rollups) -> None:
+    rows = bind.execute(
+        sa.select(orders.c.order_date, order_items.c.menu_item_id, order_items.c.quantity, order_items.c.unit_price)
+        .join(orders, order_items.c.order_id == orders.c.id)
+        .where(orders.c.order_date.isnot(None))
+        .execution_options(yield_per=10000)
+    )
+    buckets = [{} for _ in rollups]
+    for order_date, menu_item_id, quantity, unit_price in rows:
+        quantity, unit_price = quantity or 0, unit_price or 0.0
+        for (_, floor), bucket in zip(rollups, buckets):
+            values = bucket.setdefault((floor(order_date), menu_item_id), [0, 0.0, 0])
+            values[0] += quantity
+            values[1] += unit_price * quantity
+            values[2] += 1
+
+    for (table, _), bucket in zip(rollups, buckets):
+        if bucket:
+            op.bulk_insert(table, [
+                {"bucket_start": bucket_start, "menu_item_id": menu_item_id,
+                 "quantity": quantity, "income": income, "order_count": order_count}
+                for (bucket_start, menu_item_id), (quantity, income, order_count) in bucket.items()
+            ])
+
+
+def upgrade() -> None:
+    daily = create_rollup('order_rollups_daily')
+    hourly = create_rollup('order_rollups_hourly')
+    backfill(op.get_bind(), [
+        (hourly, lambda value: value.replace(minute=0, second=0, microsecond=0)),
+        (daily, lambda value: datetime.combine(value.date(), time(0))),
+    ])
+
+
+def downgrade() -> None:
+    op.drop_table('order_rollups_hourly')
+    op.drop_table('order_rollups_daily')
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Table, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Table, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -23,6 +23,13 @@ class Order(Base):
     total_amount = Column(Float)
     payment_method = Column(String)  # cash, credit
     payment_status = Column(String)  # paid, unpaid
+
+    __table_args__ = (
+        # 使用者訂單分頁與結帳：WHERE user_id = ? [AND order_date 區間] ORDER BY order_date DESC, id DESC
+        Index("ix_orders_user_id_order_date", user_id, order_date, id),
+        # 報表頭尾不滿一小時的部分：WHERE order_date >= ? AND order_date < ?
+        Index("ix_orders_order_date", order_date),
+    )
     
     #items = relationship("MenuItem", secondary=order_items, back_populates="orders")
     order_items = relationship("OrderItem", back_populates="order")
@@ -54,4 +61,24 @@ class OrderItem(Base):
     unit_price = Column(Float)
 
     order = relationship("Order", back_populates="order_items")
-    menu_item = relationship("MenuItem", back_populates="order_items")
\ No newline at end of file
+    menu_item = relationship("MenuItem", back_populates="order_items")
+
+class OrderRollupHourly(Base):
+    """Per menu item order totals for one hour, maintained by create_order"""
+    __tablename__ = "order_rollups_hourly"
+
+    bucket_start = Column(DateTime, primary_key=True)
+    menu_item_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    income = Column(Float, nullable=False, default=0.0)
+    order_count = Column(Integer, nullable=False, default=0)
+
+class OrderRollupDaily(Base):
+    """Per menu item order totals for one (UTC) day, maintained by create_order"""
+    __tablename__ = "order_rollups_daily"
+
+    bucket_start = Column(DateTime, primary_key=True)
+    menu_item_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    income = Column(Float, nullable=False, default=0.0)
+    order_count = Column(Integer, nullable=False, default=0)
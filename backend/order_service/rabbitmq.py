@@ -6,6 +6,11 @@ import threading
 import time
 import logging
 import os
+import asyncio
+import aio_pika
+from aio_pika.pool import Pool
+from menu_cache import menu_cache
+from batch_consumer import BatchConsumer
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,6 +22,9 @@ RABBITMQ_USER = os.getenv("RABBITMQ_USER", "admin")
 RABBITMQ_PASSWORD = os.getenv("RABBITMQ_PASSWORD", "password")
 MAX_RETRIES = 1
 RETRY_DELAY = 5  # seconds
+PUBLISHER_POOL_SIZE = int(os.getenv("RABBITMQ_PUBLISHER_POOL_SIZE", "4"))
+PUBLISHER_HEARTBEAT = 60  # seconds
+PUBLISH_RETRIES = 2
 
 # Exchange and queue names
 NOTIFICATION_EXCHANGE = "notifications"
@@ -25,24 +33,11 @@ NOTIFICATION_QUEUE = "menu_notifications"
 ORDER_NOTIFICATION_ROUTING_KEY = "order.notification"
 ORDER_NOTIFICATION_QUEUE = "order_notifications"
 
-def get_rabbitmq_channel():
-    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-    parameters = pika.ConnectionParameters(
-        host=RABBITMQ_HOST,
-        port=RABBITMQ_PORT,
-        credentials=credentials
-    )
-    connection = pika.BlockingConnection(parameters)
-    channel = connection.channel()
-    
-    # Declare exchange
-    channel.exchange_declare(
-        exchange=NOTIFICATION_EXCHANGE,
-        exchange_type='topic',
-        durable=True
-    )
-    
-    return channel, connection
+# Order events: version 2 carries every line item of an order in one message,
+# version 1 is the legacy one-message-per-item format
+ORDER_EVENT_VERSION = int(os.getenv("ORDER_EVENT_VERSION", "2"))
+ORDER_PLACED_EVENT = "order.placed"
+ORDER_STATUS_CHANGED_EVENT = "order.status_changed"
 
 def get_connection():
     """Create a connection to RabbitMQ with retries"""
@@ -69,6 +64,85 @@ def get_connection():
             logger.warning(f"Failed to connect to RabbitMQ, retrying in {RETRY_DELAY} seconds...")
             time.sleep(RETRY_DELAY)
 
+class AsyncRabbitMQPublisher:
+    """
+    Async publisher backed by aio-pika.
+
+    A robust connection reconnects by itself after the broker drops it, and a
+    pool of channels with publisher confirms is shared by every request, so
+    publishing never blocks the event loop or opens a connection per message.
+    """
+
+    def __init__(self, pool_size=PUBLISHER_POOL_SIZE):
+        self.pool_size = pool_size
+        self._connection = None
+        self._channel_pool = None
+        self._lock = None
+
+    async def _get_connection(self):
+        if self._connection is None or self._connection.is_closed:
+            self._connection = await aio_pika.connect_robust(
+                host=RABBITMQ_HOST,
+                port=RABBITMQ_PORT,
+                login=RABBITMQ_USER,
+                password=RABBITMQ_PASSWORD,
+                heartbeat=PUBLISHER_HEARTBEAT
+            )
+        return self._connection
+
+    async def _open_channel(self):
+        connection = await self._get_connection()
+        channel = await connection.channel(publisher_confirms=True)
+        await channel.declare_exchange(
+            NOTIFICATION_EXCHANGE,
+            aio_pika.ExchangeType.TOPIC,
+            durable=True
+        )
+        return channel
+
+    async def _get_channel_pool(self):
+        if self._channel_pool is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._channel_pool is None:
+                    self._channel_pool = Pool(self._open_channel, max_size=self.pool_size)
+        return self._channel_pool
+
+    async def publish(self, routing_key, message):
+        """Publish a persistent JSON message, awaiting the broker confirm"""
+        message = aio_pika.Message(
+            body=json.dumps(message).encode(),
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,  # make message persistent
+            content_type='application/json',
+            timestamp=time.time()  # consumers export lag from it
+        )
+        channel_pool = await self._get_channel_pool()
+        for attempt in range(PUBLISH_RETRIES):
+            try:
+                async with channel_pool.acquire() as channel:
+                    if channel.is_closed:
+                        await channel.reopen()
+                    exchange = await channel.get_exchange(NOTIFICATION_EXCHANGE, ensure=False)
+                    await exchange.publish(message, routing_key=routing_key)
+                return
+            except (aio_pika.exceptions.AMQPError, ConnectionError) as e:
+                if attempt == PUBLISH_RETRIES - 1:
+                    logger.error(f"Failed to publish to RabbitMQ after {PUBLISH_RETRIES} attempts: {e}")
+                    raise
+                logger.warning(f"RabbitMQ publish failed, retrying: {e}")
+
+    async def close(self):
+        """Close the channel pool and the connection"""
+        if self._channel_pool is not None:
+            await self._channel_pool.close()
+            self._channel_pool = None
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+publisher = AsyncRabbitMQPublisher()
+
 def setup_rabbitmq():
     """Set up RabbitMQ exchange and queue with retries"""
     for attempt in range(MAX_RETRIES):
@@ -114,82 +188,69 @@ def setup_rabbitmq():
             logger.warning(f"Failed to set up RabbitMQ, retrying in {RETRY_DELAY} seconds...")
             time.sleep(RETRY_DELAY)
 
+def handle_menu_notification(body, db: Session):
+    """Add or update the menu item in the session; returns the menu cache update to run after commit"""
+    data = json.loads(body)
+    required_fields = ["zh_name", "en_name", "price", "url", "is_available"]
+    optional_fields = ["id"]
+    if not all(field in data for field in required_fields):
+        raise ValueError("Notification data is missing required fields")
+    current_menu_id = data.get("id", -1)
+    menu_item = db.query(models.MenuItem).filter(models.MenuItem.id == current_menu_id).first()
+    #if not exists, add
+    if menu_item is None:
+        menu_item = models.MenuItem(
+            zh_name=data["zh_name"],
+            en_name=data["en_name"],
+            price=data["price"],
+            url=data["url"],
+            is_available=data.get("is_available", True)
+        )
+        db.add(menu_item)
+    else:
+        #already exists, update
+        menu_item.zh_name = data["zh_name"]
+        menu_item.en_name = data["en_name"]
+        menu_item.price = data["price"]
+        menu_item.url = data["url"]
+        menu_item.is_available = data.get("is_available", True)
+    # 快照只能在 commit 之後更新，否則 rollback 的變更會被讀到
+    return lambda: menu_cache.upsert(menu_item)
+
 def process_notification_menu(ch, method, properties, body, db: Session):
+    """Process a single menu notification in its own transaction"""
     try:
-        data = json.loads(body)
-        required_fields = ["zh_name", "en_name", "price", "url", "is_available"]
-        optional_fields = ["id"]
-        if not all(field in data for field in required_fields):
-            logger.error("Notification data is missing required fields")
-            ch.basic_nack(delivery_tag=method.delivery_tag)
-            return
-        current_menu_id = data.get("id", -1)
-        #if not exists, add
-        if db.query(models.MenuItem).filter(models.MenuItem.id == current_menu_id).first() is None:
-            menu_item = models.MenuItem(
-                zh_name=data["zh_name"],
-                en_name=data["en_name"],
-                price=data["price"],
-                url=data["url"],
-                is_available=data.get("is_available", True)
-            )
-            db.add(menu_item)
-            db.commit()
-        else:
-            #already exists, update
-            menu_item = db.query(models.MenuItem).filter(models.MenuItem.id == current_menu_id).first()
-            if menu_item:
-                menu_item.zh_name = data["zh_name"]
-                menu_item.en_name = data["en_name"]
-                menu_item.price = data["price"]
-                menu_item.url = data["url"]
-                menu_item.is_available = data.get("is_available", True)
-                db.commit()
-
+        update_cache = handle_menu_notification(body, db)
+        db.commit()
+        update_cache()
     except json.JSONDecodeError as e:
         logger.error(f"Failed to decode JSON: {e}")
         ch.basic_nack(delivery_tag=method.delivery_tag)
     except Exception as e:
         logger.error(f"Unexpected error processing notification: {e}")
+        db.rollback()
         ch.basic_nack(delivery_tag=method.delivery_tag)
     else:
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
-def consume_notifications(db: Session):
-    connection = get_connection()
-    channel = connection.channel()
-
-    channel.basic_qos(prefetch_count=1)  # Fair dispatch
-    channel.basic_consume(
-        queue=NOTIFICATION_QUEUE,
-        on_message_callback=lambda ch, method, properties, body: process_notification_menu(ch, method, properties, body, db),
-        auto_ack=False
-    )
+def consume_notifications(session_factory):
+    """Consume menu notifications, one session and one commit per batch"""
+    BatchConsumer(get_connection(), NOTIFICATION_QUEUE, handle_menu_notification, session_factory).start()
+    logger.info("RabbitMQ connection closed")
 
-    try: 
-        channel.start_consuming()
-    except KeyboardInterrupt:
-        logger.info("Stopping RabbitMQ consumer")
-        channel.stop_consuming()
-    finally:
-        connection.close()
-        logger.info("RabbitMQ connection closed")
-
-def start_consumer_thread(db: Session):
+def start_consumer_thread(session_factory):
     consumer_thread = threading.Thread(
         target=consume_notifications, 
-        args=(db,), 
+        args=(session_factory,), 
         daemon=True)
     consumer_thread.start()
 
     return consumer_thread
 
-def send_order_notification(dining_record_item):
+async def send_order_notification(dining_record_item):
     """
     Send a menu item notification to RabbitMQ
     """
-    channel, connection = get_rabbitmq_channel()
-    
     if "is_put" not in dining_record_item:
         notification = {
             "user_id": dining_record_item["user_id"],
@@ -210,16 +271,36 @@ def send_order_notification(dining_record_item):
             "is_put": dining_record_item["is_put"]
         }
     
-    # Publish notification to RabbitMQ
-    channel.basic_publish(
-        exchange=NOTIFICATION_EXCHANGE,
-        routing_key=ORDER_NOTIFICATION_ROUTING_KEY,
-        body=json.dumps(notification),
-        properties=pika.BasicProperties(
-            delivery_mode=2,  # make message persistent
-            content_type='application/json'
-        )
-    )
-    
-    # Close RabbitMQ connection
-    connection.close()
\ No newline at end of file
+    # Publish notification over a pooled channel
+    await publisher.publish(ORDER_NOTIFICATION_ROUTING_KEY, notification)
+
+async def send_order_event(event_type, user_id, payment_status, orders):
+    """
+    Send one order event for all line items of the given orders.
+    orders: [{"order_id": int, "items": [{"menu_item_id", "menu_item_name", "total_amount"}]}]
+    """
+    if ORDER_EVENT_VERSION < 2:
+        # Consumers still on the per-item format, fan out into legacy messages
+        for order in orders:
+            for item in order["items"]:
+                dining_record_item = {
+                    "user_id": user_id,
+                    "order_id": order["order_id"],
+                    "menu_item_id": item["menu_item_id"],
+                    "menu_item_name": item["menu_item_name"],
+                    "total_amount": item["total_amount"],
+                    "payment_status": payment_status
+                }
+                if event_type == ORDER_STATUS_CHANGED_EVENT:
+                    dining_record_item["is_put"] = True
+                await send_order_notification(dining_record_item)
+        return
+
+    event = {
+        "version": 2,
+        "event": event_type,
+        "user_id": user_id,
+        "payment_status": payment_status,
+        "orders": orders
+    }
+    await publisher.publish(ORDER_NOTIFICATION_ROUTING_KEY, event)
@@ -0,0 +1,226 @@
+"""
+Hourly and daily per-menu-item order rollups (quantity, income, order count).
+
+create_order adds every order to both tables in the same transaction. The analytics
+report reads whole days / whole hours from the rollups and only scans raw orders for
+the partial hours at the edges of its window. rebuild_rollups recomputes both tables
+from orders / order_items and reports drift.
+
+Usage (from backend/order_service):
+    python rollups.py          # rebuild
+    python rollups.py --check  # only report drift, exit 1 if any
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime, time, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+def to_naive_utc(value: Optional[datetime]):
+    """order_date is stored as naive UTC, so convert tz-aware inputs before comparing"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def floor_hour(value: datetime):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def floor_day(value: datetime):
+    return datetime.combine(value.date(), time(0))
+
+def _ceil(value: datetime, floor, step: timedelta):
+    floored = floor(value)
+    return floored if floored == value else floored + step
+
+ROLLUPS = (
+    (models.OrderRollupHourly.__table__, floor_hour),
+    (models.OrderRollupDaily.__table__, floor_day),
+)
+
+def _upsert(dialect_name: str, table):
+    # INSERT ... ON CONFLICT 累加，同一個小時 / 同一天的並行訂單不會互相覆蓋
+    stmt = (sqlite if dialect_name == "sqlite" else postgresql).insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=["bucket_start", "menu_item_id"],
+        set_={
+            "quantity": table.c.quantity + stmt.excluded.quantity,
+            "income": table.c.income + stmt.excluded.income,
+            "order_count": table.c.order_count + stmt.excluded.order_count,
+        }
+    )
+
+async def add_order(db, order_date: datetime, line_items):
+    """
+    Add one order's (menu_item_id, quantity, income) lines to both rollups; the caller commits.
+    Run it as the last write before the commit, the rollup rows stay locked until then.
+    """
+    # 合併重複的品項並依 menu_item_id 排序：每筆交易都以相同順序鎖住 rollup 列，並行訂單不會 deadlock
+    lines = {}
+    for menu_item_id, quantity, income in line_items:
+        total_quantity, total_income = lines.get(menu_item_id, (0, 0.0))
+        lines[menu_item_id] = (total_quantity + quantity, total_income + income)
+
+    dialect_name = db.get_bind().dialect.name
+    for table, floor in ROLLUPS:
+        await db.execute(_upsert(dialect_name, table), [
+            {
+                "bucket_start": floor(order_date),
+                "menu_item_id": menu_item_id,
+                "quantity": quantity,
+                "income": income,
+                "order_count": 1,
+            }
+            for menu_item_id, (quantity, income) in sorted(lines.items())
+        ])
+
+def split_window(start: datetime, end: datetime):
+    """
+    Cover [start, end) with (source, from, to) ranges: "daily" for whole days, "hourly" for the
+    remaining whole hours and "raw" for the partial hours at either edge.
+    """
+    first_hour, last_hour = _ceil(start, floor_hour, HOUR), floor_hour(end)
+    if first_hour >= last_hour:
+        return [("raw", start, end)]
+
+    ranges = []
+    if start < first_hour:
+        ranges.append(("raw", start, first_hour))
+    first_day, last_day = _ceil(first_hour, floor_day, DAY), floor_day(last_hour)
+    if first_day >= last_day:
+        ranges.append(("hourly", first_hour, last_hour))
+    else:
+        if first_hour < first_day:
+            ranges.append(("hourly", first_hour, first_day))
+        ranges.append(("daily", first_day, last_day))
+        if last_day < last_hour:
+            ranges.append(("hourly", last_day, last_hour))
+    if last_hour < end:
+        ranges.append(("raw", last_hour, end))
+    return ranges
+
+def order_trends_query(start: datetime, end: datetime):
+    """item_id, item_name, quantity, income over [start, end), most ordered first"""
+    parts = []
+    for source, range_start, range_end in split_window(start, end):
+        if source == "raw":
+            parts.append(
+                select(
+                    models.OrderItem.menu_item_id.label("menu_item_id"),
+                    models.OrderItem.quantity.label("quantity"),
+                    (models.OrderItem.unit_price * models.OrderItem.quantity).label("income")
+                )
+                .join(models.Order, models.OrderItem.order_id == models.Order.id)
+                .where(models.Order.order_date >= range_start, models.Order.order_date < range_end)
+            )
+        else:
+            rollup = models.OrderRollupDaily if source == "daily" else models.OrderRollupHourly
+            parts.append(
+                select(
+                    rollup.menu_item_id.label("menu_item_id"),
+                    rollup.quantity.label("quantity"),
+                    rollup.income.label("income")
+                )
+                .where(rollup.bucket_start >= range_start, rollup.bucket_start < range_end)
+            )
+    lines = union_all(*parts).subquery() if len(parts) > 1 else parts[0].subquery()
+
+    return (
+        select(
+            models.MenuItem.id.label("item_id"),
+            models.MenuItem.en_name.label("item_name"),
+            func.sum(lines.c.quantity).label("quantity"),
+            func.sum(lines.c.income).label("income")
+        )
+        .join(lines, models.MenuItem.id == lines.c.menu_item_id)
+        .group_by(models.MenuItem.id, models.MenuItem.en_name)
+        .order_by(func.sum(lines.c.quantity).desc())
+    )
+
+def compute_rollups(db: Session):
+    """Recompute {table name: {(bucket_start, menu_item_id): (quantity, income, order_count)}} from raw orders"""
+    expected = {table.name: {} for table, _ in ROLLUPS}
+    rows = db.execute(
+        select(
+            models.Order.order_date,
+            models.OrderItem.menu_item_id,
+            models.OrderItem.quantity,
+            models.OrderItem.unit_price
+        ).join(models.Order, models.OrderItem.order_id == models.Order.id)
+        .execution_options(yield_per=10000)
+    )
+    for order_date, menu_item_id, quantity, unit_price in rows:
+        for table, floor in ROLLUPS:
+            key = (floor(order_date), menu_item_id)
+            total_quantity, income, order_count = expected[table.name].get(key, (0, 0.0, 0))
+            expected[table.name][key] = (total_quantity + quantity, income + unit_price * quantity, order_count + 1)
+    return expected
+
+def _rounded(values):
+    quantity, income, order_count = values
+    return quantity, round(income, 2), order_count
+
+def find_drift(db: Session, expected):
+    """List of (table, key, stored, expected) for every bucket that differs from the recomputed value"""
+    drift = []
+    for table, _ in ROLLUPS:
+        stored = {
+            (row.bucket_start, row.menu_item_id): _rounded((row.quantity, row.income, row.order_count))
+            for row in db.execute(select(table))
+        }
+        wanted = {key: _rounded(values) for key, values in expected[table.name].items()}
+        for key in sorted(stored.keys() | wanted.keys()):
+            if stored.get(key) != wanted.get(key):
+                drift.append((table.name, key, stored.get(key), wanted.get(key)))
+    return drift
+
+def rebuild_rollups(db: Session, check_only: bool = False):
+    """Recompute both rollups from scratch; returns the drift found before the rebuild"""
+    expected = compute_rollups(db)
+    drift = find_drift(db, expected)
+    if drift:
+        logger.warning(f"Order rollup drift in {len(drift)} buckets")
+    if check_only:
+        return drift
+
+    for table, _ in ROLLUPS:
+        db.execute(table.delete())
+        rows = [
+            {"bucket_start": bucket_start, "menu_item_id": menu_item_id,
+             "quantity": quantity, "income": income, "order_count": order_count}
+            for (bucket_start, menu_item_id), (quantity, income, order_count) in expected[table.name].items()
+        ]
+        if rows:
+            db.execute(table.insert(), rows)
+    db.commit()
+    return drift
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only report drift, do not rewrite the tables")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        drift = rebuild_rollups(db, check_only=args.check)
+    finally:
+        db.close()
+    for table, key, stored, expected in drift:
+        print(f"{table} {key}: stored {stored}, expected {expected}")
+    print(f"{len(drift)} drifted buckets" + ("" if args.check else ", rebuilt"))
+    return 1 if args.check and drift else 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
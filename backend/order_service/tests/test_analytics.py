@@ -1,4 +1,5 @@
 import pytest
+from datetime import datetime
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -134,4 +135,179 @@ def test_analytics(client):
     """
     assert not df.empty
     assert df["total_order_ids"].tolist() == [2]
-    assert df["recent_orders_within_period"].tolist() == [2]
\ No newline at end of file
+    assert df["recent_orders_within_period"].tolist() == [2]
+    # 任意 [start_date, end_date) 區間覆寫 report_period
+    response = client.get("/api/analytics", params={"report_type": "order_trends", "start_date": "2000-01-01T00:00:00"})
+    assert response.status_code == 200
+    assert pd.read_csv(StringIO(response.content.decode("utf-8")))["quantity"].tolist() == [4]
+    response = client.get("/api/analytics", params={
+        "report_type": "order_trends", "start_date": "2000-01-01T00:00:00", "end_date": "2000-01-02T00:00:00"
+    })
+    assert response.status_code == 404
+    response = client.get("/api/analytics", params={
+        "report_type": "order_trends", "start_date": "2000-01-02T00:00:00", "end_date": "2000-01-01T00:00:00"
+    })
+    assert response.status_code == 400
+
+def test_split_window():
+    from order_service.rollups import split_window
+
+    assert split_window(datetime(2024, 1, 1, 10, 30), datetime(2024, 1, 3, 8, 15)) == [
+        ("raw", datetime(2024, 1, 1, 10, 30), datetime(2024, 1, 1, 11)),
+        ("hourly", datetime(2024, 1, 1, 11), datetime(2024, 1, 2)),
+        ("daily", datetime(2024, 1, 2), datetime(2024, 1, 3)),
+        ("hourly", datetime(2024, 1, 3), datetime(2024, 1, 3, 8)),
+        ("raw", datetime(2024, 1, 3, 8), datetime(2024, 1, 3, 8, 15)),
+    ]
+    assert split_window(datetime(2024, 1, 1), datetime(2024, 1, 8)) == [
+        ("daily", datetime(2024, 1, 1), datetime(2024, 1, 8)),
+    ]
+    assert split_window(datetime(2024, 1, 1, 10, 5), datetime(2024, 1, 1, 10, 55)) == [
+        ("raw", datetime(2024, 1, 1, 10, 5), datetime(2024, 1, 1, 10, 55)),
+    ]
+
+def test_add_order_upserts_rollups_in_menu_item_order():
+    import asyncio
+    from types import SimpleNamespace
+    from order_service.rollups import add_order
+
+    class RecordingSession:
+        def __init__(self):
+            self.batches = []
+
+        def get_bind(self):
+            return SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+        async def execute(self, stmt, rows):
+            self.batches.append([(row["menu_item_id"], row["quantity"], row["income"]) for row in rows])
+
+    db = RecordingSession()
+    asyncio.run(add_order(db, datetime(2024, 1, 1, 12, 30), [(3, 1, 3.0), (1, 2, 4.0), (3, 2, 6.0)]))
+    # 兩張 rollup 表都依 menu_item_id 排序，重複的品項合併成一列
+    assert db.batches == [[(1, 2, 4.0), (3, 3, 9.0)]] * 2
+
+def test_analytics_reads_rollups(client):
+    from order_service.main import SessionLocal, rollups
+
+    response = client.post("/menu-items/", json={
+        "zh_name": "彙總測試", "en_name": "Rollup Dish", "price": 5.0, "url": "", "is_available": True
+    })
+    menu_item_id = response.json()["id"]
+    client.post("/orders/", json={
+        "user_id": 4, "payment_method": "cash", "items": [{"menu_item_id": menu_item_id, "quantity": 3}]
+    })
+
+    db = SessionLocal()
+    try:
+        # create_order 在同一個交易內累加 rollup，重新計算不應有差異
+        hourly = db.query(rollups.models.OrderRollupHourly).filter_by(menu_item_id=menu_item_id).one()
+        assert (hourly.quantity, hourly.income, hourly.order_count) == (3, 15.0, 1)
+        assert rollups.rebuild_rollups(db, check_only=True) == []
+
+        # 過去的整天 / 整點區間只讀 rollup（這裡沒有對應的原始訂單）
+        db.add_all([
+            rollups.models.OrderRollupDaily(bucket_start=datetime(2001, 1, 1), menu_item_id=menu_item_id,
+                                            quantity=7, income=35.0, order_count=5),
+            rollups.models.OrderRollupHourly(bucket_start=datetime(2001, 1, 1, 12), menu_item_id=menu_item_id,
+                                             quantity=2, income=10.0, order_count=2),
+        ])
+        db.commit()
+
+        response = client.get("/api/analytics", params={
+            "report_type": "order_trends", "start_date": "2001-01-01T00:00:00", "end_date": "2001-01-02T00:00:00"
+        })
+        assert response.text.splitlines()[1:] == [f"{menu_item_id},Rollup Dish,7,35.00"]
+        response = client.get("/api/analytics", params={
+            "report_type": "order_trends", "start_date": "2001-01-01T11:30:00", "end_date": "2001-01-01T13:00:00"
+        })
+        assert response.text.splitlines()[1:] == [f"{menu_item_id},Rollup Dish,2,10.00"]
+
+        # 帶時區的區間先換成 UTC：台北時間 08:00 - 次日 08:00 即 UTC 的 2001-01-01 整天
+        response = client.get("/api/analytics", params={
+            "report_type": "order_trends", "start_date": "2001-01-01T08:00:00+08:00", "end_date": "2001-01-02T08:00:00+08:00"
+        })
+        assert response.status_code == 200
+        assert response.text.splitlines()[1:] == [f"{menu_item_id},Rollup Dish,7,35.00"]
+        response = client.get("/api/analytics", params={
+            "report_type": "order_trends", "start_date": "2001-01-01T11:30:00Z", "end_date": "2001-01-01T13:00:00Z"
+        })
+        assert response.text.splitlines()[1:] == [f"{menu_item_id},Rollup Dish,2,10.00"]
+
+        # 手動寫入的 bucket 屬於 drift，重建後回到由原始訂單計算的結果
+        assert len(rollups.rebuild_rollups(db)) == 2
+        assert rollups.rebuild_rollups(db, check_only=True) == []
+    finally:
+        db.close()
+
+def test_analytics_streams_in_partitions(client, monkeypatch):
+    from order_service import main as order_main
+    from order_service.main import SessionLocal, rollups
+
+    db = SessionLocal()
+    try:
+        menu_item_ids = []
+        for i in range(5):
+            menu_item = MenuItem(zh_name=f"串流 {i}", en_name=f"Stream Dish {i}", price=1.0, url="", is_available=True)
+            db.add(menu_item)
+            db.flush()
+            menu_item_ids.append(menu_item.id)
+            db.add(rollups.models.OrderRollupDaily(bucket_start=datetime(2002, 1, 1), menu_item_id=menu_item.id,
+                                                   quantity=10 - i, income=10.0 - i, order_count=1))
+        db.commit()
+    finally:
+        db.close()
+
+    # 每批只從 cursor 取 2 列，結果仍須完整且維持排序
+    monkeypatch.setattr(order_main, "ANALYTICS_YIELD_PER", 2)
+    response = client.get("/api/analytics", params={
+        "report_type": "order_trends", "start_date": "2002-01-01T00:00:00", "end_date": "2002-01-02T00:00:00"
+    })
+    assert response.status_code == 200
+    assert response.text.splitlines() == ["item_id,item_name,quantity,income"] + [
+        f"{menu_item_id},Stream Dish {i},{10 - i},{10.0 - i:.2f}" for i, menu_item_id in enumerate(menu_item_ids)
+    ]
+
+def test_analytics_columnar_formats(client, monkeypatch):
+    import io
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from order_service import main as order_main
+    from order_service.main import SessionLocal, rollups
+
+    db = SessionLocal()
+    try:
+        menu_item_ids = []
+        for i in range(3):
+            menu_item = MenuItem(zh_name=f"欄式 {i}", en_name=f"Columnar Dish {i}", price=1.0, url="", is_available=True)
+            db.add(menu_item)
+            db.flush()
+            menu_item_ids.append(menu_item.id)
+            db.add(rollups.models.OrderRollupDaily(bucket_start=datetime(2003, 1, 1), menu_item_id=menu_item.id,
+                                                   quantity=5 - i, income=(5 - i) * 1.005, order_count=1))
+        db.commit()
+    finally:
+        db.close()
+
+    monkeypatch.setattr(order_main, "ANALYTICS_YIELD_PER", 2)
+    params = {"report_type": "order_trends", "start_date": "2003-01-01T00:00:00", "end_date": "2003-01-02T00:00:00"}
+    expected = {
+        "item_id": menu_item_ids,
+        "item_name": [f"Columnar Dish {i}" for i in range(3)],
+        "quantity": [5, 4, 3],
+        "income": [round((5 - i) * 1.005, 2) for i in range(3)],
+    }
+
+    response = client.get("/api/analytics", params={**params, "format": "parquet"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.parquet"
+    parquet_file = pq.ParquetFile(io.BytesIO(response.content))
+    # 每批 cursor 結果一個 row group
+    assert parquet_file.metadata.num_row_groups == 2
+    assert parquet_file.read(use_threads=False).to_pydict() == expected
+
+    response = client.get("/api/analytics", params={**params, "format": "arrow"})
+    assert response.status_code == 200
+    assert "analytics.arrow" in response.headers["content-disposition"]
+    assert pa.ipc.open_stream(response.content).read_all().to_pydict() == expected
+
+    assert client.get("/api/analytics", params={**params, "format": "xlsx"}).status_code == 400
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from order_service import auth
+
+def make_token(minutes=30, secret=auth.SECRET_KEY, **claims):
+    payload = {"sub": "alice", "user_id": 3, "role": "employee", "exp": datetime.utcnow() + timedelta(minutes=minutes)}
+    payload.update(claims)
+    return jwt.encode(payload, secret, algorithm=auth.ALGORITHM)
+
+def test_verify_token_locally():
+    token = make_token()
+    with patch.object(auth.user_service_client, "get", new=AsyncMock()) as mock_get:
+        principal = asyncio.run(auth.verify_token(token=token, credentials=None))
+    assert principal["username"] == "alice"
+    assert principal["id"] == 3
+    assert principal["role"] == "employee"
+    mock_get.assert_not_called()
+
+@pytest.mark.parametrize("token, detail", [
+    (make_token(minutes=-1), "Token has expired"),
+    (make_token(secret="not-the-secret"), "Invalid token"),
+    ("not-a-jwt", "Invalid token"),
+])
+def test_verify_token_rejects(token, detail):
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(auth.verify_token(token=token, credentials=None))
+    assert exc_info.value.status_code == 401
+    assert exc_info.value.detail == detail
+
+def test_principal_check_is_cached(monkeypatch):
+    monkeypatch.setattr(auth, "PRINCIPAL_CHECK_TTL", 30)
+    monkeypatch.setattr(auth, "principal_cache", auth.TTLCache(30, 10))
+    token = make_token()
+    response = MagicMock(status_code=200)
+    response.json.return_value = {"id": 7, "username": "alice", "role": "admin"}
+
+    with patch.object(auth.user_service_client, "get", new=AsyncMock(return_value=response)) as mock_get:
+        first = asyncio.run(auth.verify_token(token=token, credentials=None))
+        second = asyncio.run(auth.verify_token(token=token, credentials=None))
+    assert first == second
+    assert first["id"] == 7
+    assert first["role"] == "admin"
+    mock_get.assert_called_once()
+
+    revoked = make_token(sub="bob")
+    with patch.object(auth.user_service_client, "get", new=AsyncMock(return_value=MagicMock(status_code=401))) as mock_get:
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                asyncio.run(auth.verify_token(token=revoked, credentials=None))
+    mock_get.assert_called_once()
+
+@pytest.mark.parametrize("status_code", [429, 500, 502, 503])
+def test_principal_check_does_not_cache_transient_errors(monkeypatch, status_code):
+    monkeypatch.setattr(auth, "PRINCIPAL_CHECK_TTL", 30)
+    monkeypatch.setattr(auth, "principal_cache", auth.TTLCache(30, 10))
+    token = make_token()
+
+    with patch.object(auth.user_service_client, "get", new=AsyncMock(return_value=MagicMock(status_code=status_code))) as mock_get:
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc_info:
+                asyncio.run(auth.verify_token(token=token, credentials=None))
+            assert exc_info.value.status_code == 503
+    assert mock_get.call_count == 2
+
+    # 恢復後同一個 token 立刻可以用
+    response = MagicMock(status_code=200)
+    response.json.return_value = {"id": 7, "username": "alice", "role": "employee"}
+    with patch.object(auth.user_service_client, "get", new=AsyncMock(return_value=response)):
+        assert asyncio.run(auth.verify_token(token=token, credentials=None))["id"] == 7
+
+def test_principal_check_unreadable_body(monkeypatch):
+    monkeypatch.setattr(auth, "PRINCIPAL_CHECK_TTL", 30)
+    monkeypatch.setattr(auth, "principal_cache", auth.TTLCache(30, 10))
+    response = MagicMock(status_code=200)
+    response.json.side_effect = ValueError("not json")
+    token = make_token()
+
+    with patch.object(auth.user_service_client, "get", new=AsyncMock(return_value=response)):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(auth.verify_token(token=token, credentials=None))
+    assert exc_info.value.status_code == 503
+    assert auth.principal_cache.get(token) is None
+
+def test_require_owner_or_admin():
+    auth.require_owner_or_admin({"id": 5, "role": "employee"}, 5)
+    auth.require_owner_or_admin({"id": None, "role": "admin"}, 5)
+    for principal in ({"id": 6, "role": "employee"}, {"id": None, "role": "employee"}):
+        with pytest.raises(HTTPException) as exc_info:
+            auth.require_owner_or_admin(principal, 5)
+        assert exc_info.value.status_code == 403
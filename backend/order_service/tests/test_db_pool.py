@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# 與 database.py 使用同一個 db_pool module，metrics 才不會重複註冊
+from order_service.database import db_pool
+
+def sample(name, engine_name):
+    return REGISTRY.get_sample_value(f"db_pool_{name}", {"engine": engine_name}) or 0
+
+def test_sqlite_keeps_default_pool():
+    assert db_pool.engine_options("sqlite:///./test.db", "sync") == {}
+
+def test_postgres_pool_settings(monkeypatch):
+    monkeypatch.setattr(db_pool, "DB_POOL_SIZE", 3)
+    monkeypatch.setattr(db_pool, "DB_MAX_OVERFLOW", 2)
+    monkeypatch.setattr(db_pool, "DB_STATEMENT_TIMEOUT_MS", 5000)
+    monkeypatch.setattr(db_pool, "DB_PGBOUNCER", False)
+
+    options = db_pool.engine_options("postgresql://u:p@db:5432/orders", "sync")
+    assert issubclass(options["poolclass"], QueuePool)
+    assert (options["pool_size"], options["max_overflow"]) == (3, 2)
+    assert options["connect_args"] == {"options": "-c statement_timeout=5000"}
+
+    options = db_pool.engine_options("postgresql+asyncpg://u:p@db:5432/orders", "async")
+    assert options["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+
+def test_pgbouncer_mode_disables_prepared_statement_cache(monkeypatch):
+    monkeypatch.setattr(db_pool, "DB_STATEMENT_TIMEOUT_MS", 5000)
+    monkeypatch.setattr(db_pool, "DB_PGBOUNCER", True)
+
+    connect_args = db_pool.engine_options("postgresql+asyncpg://u:p@pgbouncer:6432/orders", "async")["connect_args"]
+    assert connect_args["statement_cache_size"] == 0
+    assert connect_args["prepared_statement_cache_size"] == 0
+    assert "server_settings" not in connect_args
+    # psycopg2 不用 server-side prepared statement，也不能帶 startup parameter
+    assert db_pool.engine_options("postgresql://u:p@pgbouncer:6432/orders", "sync")["connect_args"] == {}
+
+def test_checkout_wait_and_saturation_metrics(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=db_pool._timed_pool(QueuePool, "test"),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1
+    )
+    db_pool.instrument(engine, "test")
+    waits = sample("checkout_wait_seconds_count", "test")
+    timeouts = sample("checkout_timeouts_total", "test")
+    assert sample("capacity", "test") == 1
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        assert sample("connections_in_use", "test") == 1
+        assert sample("saturation", "test") == 1.0
+
+        # pool 已滿：另一個 thread 等到 pool_timeout 後放棄
+        errors = []
+        def checkout():
+            try:
+                engine.connect()
+            except PoolTimeoutError as exc:
+                errors.append(exc)
+        worker = threading.Thread(target=checkout)
+        worker.start()
+        worker.join()
+        assert len(errors) == 1
+
+    assert sample("connections_in_use", "test") == 0
+    assert sample("checkout_wait_seconds_count", "test") == waits + 2
+    assert sample("checkout_timeouts_total", "test") == timeouts + 1
+    assert sample("checkout_wait_seconds_sum", "test") >= 0.1
+    engine.dispose()
@@ -212,4 +212,235 @@ def test_get_user_orders(client):
     amount_temp = 0
     for item in data:
         amount_temp += item["total_amount"]
-    assert amount_temp == 70.0 # 2 * (2 * 10.0 + 1 * 10.0) = 70.0
\ No newline at end of file
+    assert amount_temp == 70.0 # 2 * (2 * 10.0 + 1 * 10.0) = 70.0
+
+def test_get_user_orders_keyset_pages(client):
+    order_ids = [
+        client.post("/orders/", json={
+            "user_id": 31, "payment_method": "cash", "items": [{"menu_item_id": 1, "quantity": 1}]
+        }).json()["id"]
+        for _ in range(5)
+    ]
+
+    # 由新到舊，每頁 2 筆，最後一頁沒有 X-Next-Cursor
+    pages = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/users/31/orders/", params=params)
+        assert response.status_code == 200
+        pages.append([order["id"] for order in response.json()])
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 2, "cursor": response.headers["X-Next-Cursor"]}
+    assert pages == [order_ids[4:2:-1], order_ids[2:0:-1], order_ids[:1]]
+
+    assert client.get("/users/31/orders/", params={"limit": 10000}).status_code == 422
+    assert client.get("/users/31/orders/", params={"cursor": "not-a-cursor"}).status_code == 400
+
+def test_get_user_orders_default_page(client):
+    from order_service.pagination import DEFAULT_PAGE_SIZE
+    for _ in range(DEFAULT_PAGE_SIZE + 1):
+        client.post("/orders/", json={
+            "user_id": 33, "payment_method": "cash", "items": [{"menu_item_id": 1, "quantity": 1}]
+        })
+
+    # 沒有 limit 時也只回傳一頁，其餘由 X-Next-Cursor 取得
+    response = client.get("/users/33/orders/")
+    assert len(response.json()) == DEFAULT_PAGE_SIZE
+    response = client.get("/users/33/orders/", params={"cursor": response.headers["X-Next-Cursor"]})
+    assert len(response.json()) == 1
+    assert "X-Next-Cursor" not in response.headers
+
+def test_get_menu_items_keyset_pages(client):
+    all_ids = [item["id"] for item in client.get("/menu-items/").json()]
+    assert len(all_ids) >= 3
+
+    response = client.get("/menu-items/", params={"limit": 2})
+    first_page = [item["id"] for item in response.json()]
+    response = client.get("/menu-items/", params={"limit": 2, "cursor": response.headers["X-Next-Cursor"]})
+    second_page = [item["id"] for item in response.json()]
+    assert first_page + second_page == all_ids[:4]
+
+def test_create_order_merges_repeated_items(client):
+    order_data = {
+        "user_id": 4,
+        "payment_method": "cash",
+        "items": [
+            {
+                "menu_item_id": 1,
+                "quantity": 1
+            },
+            {
+                "menu_item_id": 2,
+                "quantity": 1
+            },
+            {
+                "menu_item_id": 1,
+                "quantity": 2
+            }
+        ]
+    }
+
+    response = client.post("/orders/", json=order_data)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_amount"] == 45.0 # 3 * 10.0 + 1 * 15.0
+
+    response = client.get(f"/orders/{data['id']}")
+    assert response.status_code == 200
+    assert response.json()["total_amount"] == 45.0
+
+
+def make_auth_headers(**claims):
+    import jwt
+    from datetime import datetime, timedelta
+    from order_service import auth
+    payload = {"sub": "testuser", "user_id": 5, "role": "employee", "exp": datetime.utcnow() + timedelta(minutes=30)}
+    payload.update(claims)
+    return {"Authorization": f"Bearer {jwt.encode(payload, auth.SECRET_KEY, algorithm=auth.ALGORITHM)}"}
+
+@pytest.fixture
+def auth_headers():
+    return make_auth_headers()
+
+def test_update_order_status(client, auth_headers):
+    order_data = {
+        "user_id": 5,
+        "payment_method": "credit_card",
+        "items": [
+            {
+                "menu_item_id": 1,
+                "quantity": 1
+            }
+        ]
+    }
+    first_order_id = client.post("/orders/", json=order_data).json()["id"]
+    second_order_id = client.post("/orders/", json=order_data).json()["id"]
+
+    # 只結算指定的訂單
+    response = client.put("/orders/5/status", headers=auth_headers, params={"status": "paid", "order_ids": [first_order_id]})
+    assert response.status_code == 200
+    assert response.json()["updated_order_ids"] == [first_order_id]
+
+    # 已經是 paid 的訂單不會再被更新
+    response = client.put("/orders/5/status", headers=auth_headers, params={"status": "paid"})
+    assert response.status_code == 200
+    assert response.json()["updated_order_ids"] == [second_order_id]
+
+    response = client.put("/orders/5/status", headers=auth_headers, params={"status": "paid"})
+    assert response.status_code == 200
+    assert response.json()["updated_order_ids"] == []
+
+    orders = client.get("/users/5/orders/").json()
+    assert [order["payment_status"] for order in orders] == ["paid", "paid"]
+
+    # 日期範圍外的訂單不受影響
+    response = client.put("/orders/5/status", headers=auth_headers, params={"status": "unpaid", "end_date": "2000-01-01T00:00:00"})
+    assert response.status_code == 200
+    assert response.json()["updated_order_ids"] == []
+
+
+def test_update_order_status_invalid(client, auth_headers):
+    response = client.put("/orders/5/status", headers=auth_headers, params={"status": "refunded"})
+    assert response.status_code == 400
+
+    admin_headers = make_auth_headers(sub="admin", user_id=1, role="admin")
+    response = client.put("/orders/999/status", headers=admin_headers, params={"status": "paid"})
+    assert response.status_code == 404
+
+    # 一般使用者只能結算自己的訂單
+    response = client.put("/orders/999/status", headers=auth_headers, params={"status": "paid"})
+    assert response.status_code == 403
+    response = client.put("/orders/5/status", headers=make_auth_headers(user_id=None), params={"status": "paid"})
+    assert response.status_code == 403
+
+    # 沒有或無效的 token 在本地就被擋下
+    response = client.put("/orders/5/status", params={"status": "paid"})
+    assert response.status_code == 401
+    response = client.put("/orders/5/status", headers={"Authorization": "Bearer not-a-jwt"}, params={"status": "paid"})
+    assert response.status_code == 401
+
+def test_menu_cache_follows_menu_notification(client):
+    from unittest.mock import MagicMock
+    import json
+    from order_service.main import menu_cache, process_notification_menu, SessionLocal
+
+    client.get("/menu-items/")
+    version = menu_cache.get("test").version
+
+    created = client.post("/menu-items/", json={
+        "zh_name": "快取菜單項目",
+        "en_name": "Cached Menu Item",
+        "price": 20.0,
+        "url": "http://example.com/cached.png",
+        "is_available": True
+    }).json()
+    snapshot = menu_cache.get("test")
+    assert snapshot.version > version
+    assert snapshot.by_id[created["id"]].price == 20.0
+
+    # 管理端改價，consumer 更新資料庫後換上新版本快照
+    ch = MagicMock()
+    method = MagicMock()
+    body = json.dumps({**created, "price": 25.0}, default=str)
+    db = SessionLocal()
+    try:
+        process_notification_menu(ch, method, None, body, db)
+    finally:
+        db.close()
+    ch.basic_ack.assert_called_once()
+    assert menu_cache.get("test").by_id[created["id"]].price == 25.0
+
+    items = {item["id"]: item for item in client.get("/menu-items/").json()}
+    assert items[created["id"]]["price"] == 25.0
+
+    response = client.post("/orders/", json={
+        "user_id": 6,
+        "payment_method": "cash",
+        "items": [{"menu_item_id": created["id"], "quantity": 2}]
+    })
+    assert response.status_code == 200
+    assert response.json()["total_amount"] == 50.0
+
+    metrics = client.get("/metrics").text
+    assert 'order_service_menu_cache_requests_total{operation="list",result="hit"}' in metrics
+    assert "order_service_menu_cache_age_seconds" in metrics
+
+def test_get_menu_items_conditional(client):
+    first = client.get("/menu-items/")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+
+    not_modified = client.get("/menu-items/", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+    client.post("/menu-items/", json={
+        "zh_name": "ETag 菜單項目",
+        "en_name": "ETag Menu Item",
+        "price": 30.0,
+        "url": "http://example.com/etag.png",
+        "is_available": True
+    })
+    changed = client.get("/menu-items/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert any(item["en_name"] == "ETag Menu Item" for item in changed.json())
+
+def test_menu_etag_depends_only_on_content():
+    from datetime import datetime
+    from order_service import schemas
+    # 與 main.py 使用同一個 menu_cache module，metrics 才不會重複註冊
+    from menu_cache import MenuSnapshot
+
+    items = tuple(
+        schemas.MenuItem(id=i, zh_name=f"菜{i}", en_name=f"Dish {i}", price=10.0, url="http://example.com",
+                         created_at=datetime(2025, 1, 1), updated_at=datetime(2025, 1, 1))
+        for i in (1, 2)
+    )
+    # 不同 replica 的版本號與載入順序不同，菜單相同時 ETag 必須一致
+    assert MenuSnapshot(1, items, 0.0).etag == MenuSnapshot(7, items[::-1], 0.0).etag
+    changed = (items[0], items[1].model_copy(update={"price": 12.0}))
+    assert MenuSnapshot(1, changed, 0.0).etag != MenuSnapshot(1, items, 0.0).etag
@@ -0,0 +1,117 @@
+"""
+Query plans of the hot order queries on a schema built by the Alembic migrations.
+
+Each query is run through EXPLAIN QUERY PLAN with the same bound parameters the
+endpoint sends; a full table scan or a temp B-tree for ORDER BY fails the test.
+"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, insert, inspect, select
+
+from order_service import models, pagination
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "alembic.ini")
+
+@pytest.fixture(scope="module")
+def connection(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'order.db'}")
+    with engine.begin() as connection:
+        config = Config(ALEMBIC_INI)
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
+
+        start = datetime(2025, 1, 1)
+        connection.execute(insert(models.Order), [
+            {
+                "user_id": i % 200,
+                "order_date": start + timedelta(minutes=7 * i),
+                "total_amount": 10.0,
+                "status": "completed",
+                "payment_status": "unpaid" if i % 3 else "paid",
+            }
+            for i in range(5000)
+        ])
+        connection.execute(insert(models.OrderItem), [
+            {"order_id": i + 1, "menu_item_id": i % 20, "quantity": 1, "unit_price": 10.0}
+            for i in range(5000)
+        ])
+        connection.exec_driver_sql("ANALYZE")
+    with engine.connect() as connection:
+        yield connection
+    engine.dispose()
+
+def query_plan(connection, stmt):
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    rows = connection.exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + str(compiled),
+        tuple(params[name] for name in compiled.positiontup)
+    ).all()
+    return [row[-1] for row in rows]
+
+def assert_indexed(plan, index_name):
+    assert any(index_name in step for step in plan), plan
+    assert not any(step.startswith("SCAN") and "INDEX" not in step for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+def test_migrations_match_models(connection):
+    assert compare_metadata(MigrationContext.configure(connection), models.Base.metadata) == []
+
+@pytest.mark.parametrize("cursor", [None, pagination.encode_cursor(datetime(2025, 1, 10), 1234)])
+def test_user_orders_page_plan(connection, cursor):
+    stmt = pagination.keyset(
+        select(models.Order).where(models.Order.user_id == 42),
+        models.Order.order_date, models.Order.id, cursor, 100
+    )
+    assert_indexed(query_plan(connection, stmt), "ix_orders_user_id_order_date")
+
+def test_payment_status_range_plan(connection):
+    stmt = select(models.Order.id).where(
+        models.Order.user_id == 42,
+        models.Order.order_date >= datetime(2025, 1, 1),
+        models.Order.order_date < datetime(2025, 2, 1)
+    )
+    assert_indexed(query_plan(connection, stmt), "ix_orders_user_id_order_date")
+
+def test_partial_hour_rollup_plan(connection):
+    # order_trends_query 在 rollup 邊界外不滿一小時的部分直接讀 orders
+    stmt = select(models.OrderItem.menu_item_id, models.OrderItem.quantity).join(
+        models.Order, models.OrderItem.order_id == models.Order.id
+    ).where(
+        models.Order.order_date >= datetime(2025, 1, 5, 10, 15),
+        models.Order.order_date < datetime(2025, 1, 5, 11)
+    )
+    assert_indexed(query_plan(connection, stmt), "ix_orders_order_date")
+
+def test_baseline_database_gets_backfilled_rollups(tmp_path):
+    # create_all 建好的舊資料庫會被標記為 0001，之後的 revision 要補齊 rollup 表
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as connection:
+        config = Config(ALEMBIC_INI)
+        config.attributes["connection"] = connection
+        command.upgrade(config, "0001")
+        assert "order_rollups_daily" not in inspect(connection).get_table_names()
+        connection.execute(insert(models.Order), [
+            {"id": 1, "user_id": 1, "order_date": datetime(2025, 1, 1, 12, 10), "total_amount": 20.0, "payment_status": "paid"},
+            {"id": 2, "user_id": 2, "order_date": datetime(2025, 1, 1, 12, 40), "total_amount": 10.0, "payment_status": "paid"},
+        ])
+        connection.execute(insert(models.OrderItem), [
+            {"order_id": 1, "menu_item_id": 1, "quantity": 2, "unit_price": 10.0},
+            {"order_id": 2, "menu_item_id": 1, "quantity": 1, "unit_price": 10.0},
+        ])
+        command.upgrade(config, "head")
+
+        for rollup, bucket_start in [
+            (models.OrderRollupHourly, datetime(2025, 1, 1, 12)),
+            (models.OrderRollupDaily, datetime(2025, 1, 1)),
+        ]:
+            assert connection.execute(
+                select(rollup.bucket_start, rollup.menu_item_id, rollup.quantity, rollup.income, rollup.order_count)
+            ).all() == [(bucket_start, 1, 3, 30.0, 2)]
+    engine.dispose()
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parents[2]
+
+# 每個服務的 image 只包含自己的目錄，共用的 module 以逐字複製的方式放在各服務裡
+SHARED_MODULES = {
+    "export_formats.py": ("order_service", "user_service", "admin_service"),
+    "db_pool.py": ("order_service", "user_service", "admin_service"),
+    "pagination.py": ("order_service", "user_service"),
+}
+
+@pytest.mark.parametrize("module, services", SHARED_MODULES.items())
+def test_shared_module_copies_are_identical(module, services):
+    expected = (BACKEND / services[0] / module).read_bytes()
+    for service in services[1:]:
+        assert (BACKEND / service / module).read_bytes() == expected, f"{service}/{module} drifted from {services[0]}"
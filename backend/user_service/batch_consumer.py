@@ -0,0 +1,153 @@
+"""
+Batched RabbitMQ consumption with one session per batch.
+
+Up to RABBITMQ_PREFETCH_COUNT deliveries are in flight per consumer. Whatever has
+arrived when RABBITMQ_BATCH_SIZE messages are pending or RABBITMQ_BATCH_TIMEOUT has
+passed is handled in a fresh session and a single transaction, and acked only after
+the commit. If the batch fails, it is rolled back and retried one message per
+transaction, so only the messages that fail on their own are nacked (and redelivered).
+"""
+import logging
+import os
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_COUNT = int(os.getenv("RABBITMQ_PREFETCH_COUNT", "100"))
+BATCH_SIZE = int(os.getenv("RABBITMQ_BATCH_SIZE", "100"))
+BATCH_TIMEOUT = float(os.getenv("RABBITMQ_BATCH_TIMEOUT", "0.2"))  # seconds a partial batch may wait
+
+# handle(body, db) 把一則訊息寫進 session（不 commit），可回傳 commit 之後才執行的 callback；
+# 丟出例外代表這則訊息處理失敗，會被 nack
+Handler = Callable[[bytes, Session], Optional[Callable[[], None]]]
+
+def _run(session_factory, handle: Handler, deliveries: Sequence[Tuple[int, bytes]]):
+    """Handle deliveries in one session and one commit; raises if any of them fails"""
+    after_commit = []
+    db = session_factory()
+    try:
+        for _, body in deliveries:
+            callback = handle(body, db)
+            if callback is not None:
+                after_commit.append(callback)
+        db.commit()
+        for callback in after_commit:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"After-commit callback failed: {e}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def handle_batch(
+    session_factory,
+    handle: Handler,
+    deliveries: Sequence[Tuple[int, bytes]],
+    key: Optional[Callable[[bytes], object]] = None
+):
+    """
+    Run handle for every (delivery_tag, body) in one transaction; returns (acked tags, nacked tags).
+
+    With key, a delivery that fails in the per-message retry also fails every later delivery
+    with the same key without running them, so they are never committed out of order.
+    """
+    try:
+        _run(session_factory, handle, deliveries)
+        return [delivery_tag for delivery_tag, _ in deliveries], []
+    except Exception as e:
+        if len(deliveries) == 1:
+            logger.error(f"Failed to process message {deliveries[0][0]}: {e}")
+            return [], [deliveries[0][0]]
+        logger.warning(f"Batch of {len(deliveries)} messages failed ({e}), retrying one message per transaction")
+
+    # 只在批次失敗時退回逐筆 commit，讓有問題的訊息不會連累同批的其他訊息
+    acked, nacked = [], []
+    failed_keys = set()
+    for delivery in deliveries:
+        delivery_key = key(delivery[1]) if key is not None else None
+        if delivery_key is not None and delivery_key in failed_keys:
+            nacked.append(delivery[0])
+            continue
+        try:
+            _run(session_factory, handle, [delivery])
+            acked.append(delivery[0])
+        except Exception as e:
+            logger.error(f"Failed to process message {delivery[0]}: {e}")
+            nacked.append(delivery[0])
+            if delivery_key is not None:
+                failed_keys.add(delivery_key)
+    return acked, nacked
+
+def settle(channel, acked: List[int], nacked: List[int]):
+    """Ack / nack a handled batch; a fully successful batch is acked with one multiple=True frame"""
+    if acked and not nacked:
+        # 這個 channel 上 commit 之前的訊息都已處理完，一次 ack 到最後一個 tag
+        channel.basic_ack(delivery_tag=max(acked), multiple=True)
+        return
+    for delivery_tag in acked:
+        channel.basic_ack(delivery_tag=delivery_tag)
+    for delivery_tag in nacked:
+        channel.basic_nack(delivery_tag=delivery_tag)
+
+class BatchConsumer:
+    """Consume one queue on a pika BlockingConnection, handling deliveries in batches"""
+
+    def __init__(
+        self,
+        connection,
+        queue: str,
+        handle: Handler,
+        session_factory,
+        prefetch_count: int = PREFETCH_COUNT,
+        batch_size: int = BATCH_SIZE,
+        batch_timeout: float = BATCH_TIMEOUT
+    ):
+        self.connection = connection
+        self.channel = connection.channel()
+        self.queue = queue
+        self.handle = handle
+        self.session_factory = session_factory
+        self.prefetch_count = prefetch_count
+        # batch 不能大於 prefetch，否則永遠湊不滿，只能等 timeout
+        self.batch_size = max(1, min(batch_size, prefetch_count))
+        self.batch_timeout = batch_timeout
+        self._pending = []
+        self._timer = None
+
+    def start(self):
+        """Consume until the connection closes or the thread is interrupted"""
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.channel.basic_consume(queue=self.queue, on_message_callback=self._on_message)
+        try:
+            self.channel.start_consuming()
+        except KeyboardInterrupt:
+            self.channel.stop_consuming()
+        finally:
+            self.connection.close()
+
+    def _on_message(self, channel, method, properties, body):
+        self._pending.append((method.delivery_tag, body))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self.connection.call_later(self.batch_timeout, self._on_timeout)
+
+    def _on_timeout(self):
+        self._timer = None
+        self.flush()
+
+    def flush(self):
+        """Handle, commit and settle whatever is pending"""
+        if self._timer is not None:
+            self.connection.remove_timeout(self._timer)
+            self._timer = None
+        if not self._pending:
+            return
+        deliveries, self._pending = self._pending, []
+        acked, nacked = handle_batch(self.session_factory, self.handle, deliveries)
+        settle(self.channel, acked, nacked)
@@ -0,0 +1,180 @@
+"""
+Throughput of the order_notifications consumer against an in-process broker stand-in:
+the old consumer (prefetch 1, one shared session, one commit and one ack per message)
+vs. BatchConsumer at several prefetch / batch sizes (one session and one commit per batch).
+
+The stand-in implements the slice of pika's BlockingConnection / BlockingChannel the
+consumers use (basic_qos, basic_consume, start_consuming, basic_ack/nack, call_later)
+and honours prefetch_count, so the numbers only measure the consumer and the database.
+A file-backed SQLite database keeps commit cost realistic; use --database-url to
+measure against Postgres.
+
+Usage (from backend/user_service):
+    python benchmarks/order_event_consumer.py [--messages 2000] [--batch-sizes 1 10 50 100]
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models
+from batch_consumer import BatchConsumer
+from rabbitmq import ORDER_NOTIFICATION_QUEUE, ORDER_PLACED_EVENT, handle_order_notification, process_order_notification
+
+class Method:
+    def __init__(self, delivery_tag):
+        self.delivery_tag = delivery_tag
+
+class StandInChannel:
+    """Delivers queued bodies to one consumer, never more than prefetch_count unacked"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.prefetch_count = 0
+        self.callback = None
+        self.unacked = set()
+        self.acked = 0
+        self.nacked = 0
+        self.ack_frames = 0
+
+    def basic_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False):
+        self.callback = on_message_callback
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.ack_frames += 1
+        tags = {tag for tag in self.unacked if tag <= delivery_tag} if multiple else {delivery_tag}
+        self.unacked -= tags
+        self.acked += len(tags)
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        self.unacked.discard(delivery_tag)
+        self.nacked += 1
+
+    def start_consuming(self):
+        """Run until the queue is drained and every delivery is settled"""
+        connection = self.connection
+        while connection.queue or self.unacked:
+            if connection.queue and (self.prefetch_count == 0 or len(self.unacked) < self.prefetch_count):
+                connection.delivery_tag += 1
+                self.unacked.add(connection.delivery_tag)
+                self.callback(self, Method(connection.delivery_tag), None, connection.queue.popleft())
+            elif connection.timers:
+                # 沒有新訊息可送（prefetch 已滿或 queue 已空）時，batch timeout 立即到期
+                _, callback = connection.timers.popitem()
+                callback()
+            else:
+                raise RuntimeError("consumer stalled with unacked deliveries and no timer")
+
+    def stop_consuming(self):
+        pass
+
+class StandInConnection:
+    def __init__(self, bodies):
+        self.queue = collections.deque(bodies)
+        self.delivery_tag = 0
+        self.timers = {}
+        self._next_timer = 0
+        self._channel = StandInChannel(self)
+
+    def channel(self):
+        return self._channel
+
+    def call_later(self, delay, callback):
+        self._next_timer += 1
+        self.timers[self._next_timer] = callback
+        return self._next_timer
+
+    def remove_timeout(self, timer_id):
+        self.timers.pop(timer_id, None)
+
+    def close(self):
+        pass
+
+def order_events(count):
+    return [
+        json.dumps({
+            "version": 2,
+            "event": ORDER_PLACED_EVENT,
+            "user_id": i % 50 + 1,
+            "payment_status": "unpaid",
+            "orders": [{
+                "order_id": i,
+                "items": [
+                    {"menu_item_id": i % 20, "menu_item_name": f"Item {i % 20}", "total_amount": 10.0},
+                    {"menu_item_id": (i + 7) % 20, "menu_item_name": f"Item {(i + 7) % 20}", "total_amount": 5.0}
+                ]
+            }]
+        }).encode()
+        for i in range(1, count + 1)
+    ]
+
+def legacy_consume(connection, session_factory):
+    """The previous consumer: prefetch 1 and one session shared by every message"""
+    db = session_factory()
+    channel = connection.channel()
+    channel.basic_qos(prefetch_count=1)
+    channel.basic_consume(
+        queue=ORDER_NOTIFICATION_QUEUE,
+        on_message_callback=lambda ch, method, properties, body: process_order_notification(ch, method, properties, body, db)
+    )
+    channel.start_consuming()
+    db.close()
+
+def measure(engine, session_factory, messages, consume):
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    connection = StandInConnection(order_events(messages))
+    start = time.perf_counter()
+    consume(connection, session_factory)
+    elapsed = time.perf_counter() - start
+
+    channel = connection.channel()
+    assert channel.acked == messages and channel.nacked == 0, (channel.acked, channel.nacked)
+    db = session_factory()
+    assert db.query(models.DiningRecord).count() == 2 * messages
+    db.close()
+    return elapsed, channel.ack_frames
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(args.database_url or f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        print(f"{'consumer':>22} {'seconds':>8} {'msg/s':>8} {'ack frames':>10}")
+        elapsed, ack_frames = measure(engine, session_factory, args.messages, legacy_consume)
+        print(f"{'prefetch 1 (before)':>22} {elapsed:>8.2f} {args.messages / elapsed:>8.0f} {ack_frames:>10}")
+        for batch_size in args.batch_sizes:
+            elapsed, ack_frames = measure(
+                engine, session_factory, args.messages,
+                lambda connection, factory: BatchConsumer(
+                    connection, ORDER_NOTIFICATION_QUEUE, handle_order_notification, factory,
+                    prefetch_count=batch_size, batch_size=batch_size
+                ).start()
+            )
+            print(f"{f'batch {batch_size}':>22} {elapsed:>8.2f} {args.messages / elapsed:>8.0f} {ack_frames:>10}")
+        engine.dispose()
+
+if __name__ == "__main__":
+    run()
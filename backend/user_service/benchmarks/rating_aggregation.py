@@ -0,0 +1,110 @@
+"""
+Latency and peak Python memory of GET /ratings/{menu_item_id} against review count:
+the old load-every-row implementation vs. the SQL COUNT/SUM(CASE) aggregate vs. the
+menu_item_rating_stats counters the endpoint reads now.
+
+Usage (from backend/user_service):
+    python benchmarks/rating_aggregation.py [--reviews 1000 10000 30000] [--repeat 3]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+from main import get_menu_item_rating, query_menu_item_ratings
+from rating_stats import rebuild_rating_stats
+
+MENU_ITEM_ID = 1
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def legacy_get_menu_item_rating(menu_item_id, db):
+    """The pre-aggregation implementation: every DiningRecord and Review materialized as ORM objects"""
+    dining_records = db.query(models.DiningRecord).filter(
+        models.DiningRecord.menu_item_id == menu_item_id
+    ).all()
+    dining_record_ids = [dr.id for dr in dining_records]
+    reviews = db.query(models.Review).filter(
+        models.Review.dining_record_id.in_(dining_record_ids)
+    ).all()
+    total_reviews = len(reviews)
+    good_reviews = sum(1 for review in reviews if review.rating == "good")
+    return {
+        "menu_item_id": menu_item_id,
+        "menu_item_name": dining_records[0].menu_item_name,
+        "total_reviews": total_reviews,
+        "good_reviews": good_reviews,
+        "good_ratio": good_reviews / total_reviews if total_reviews > 0 else 0
+    }
+
+def seed(review_count):
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(models.DiningRecord), [
+            {"id": i, "user_id": 1, "order_id": i, "menu_item_id": MENU_ITEM_ID, "menu_item_name": "Dish",
+             "dining_date": start + timedelta(minutes=i), "total_amount": 10.0, "payment_status": "paid"}
+            for i in range(1, review_count + 1)
+        ])
+        conn.execute(insert(models.Review), [
+            {"user_id": 1, "dining_record_id": i, "rating": "good" if i % 3 else "bad", "comment": "x" * 40}
+            for i in range(1, review_count + 1)
+        ])
+    db = SessionLocal()
+    rebuild_rating_stats(db)
+    db.close()
+
+def measure(fn, repeat):
+    timings = []
+    peak = 0
+    for _ in range(repeat):
+        db = SessionLocal()
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(db)
+        timings.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        db.close()
+    return result, min(timings), peak
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    # sqlite 的 IN 參數上限約 32k，舊版實作超過這個量只能在 Postgres 上量測
+    parser.add_argument("--reviews", type=int, nargs="+", default=[1000, 10000, 30000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+    logging.getLogger("rating_stats").setLevel(logging.ERROR)
+
+    print(f"{'reviews':>8} {'before ms':>9} {'aggregate ms':>12} {'stats ms':>8} {'before KiB':>10} {'stats KiB':>9}")
+    for review_count in args.reviews:
+        seed(review_count)
+        before, before_time, before_peak = measure(lambda db: legacy_get_menu_item_rating(MENU_ITEM_ID, db), args.repeat)
+        aggregate, aggregate_time, _ = measure(lambda db: query_menu_item_ratings(db, [MENU_ITEM_ID])[MENU_ITEM_ID], args.repeat)
+        after, after_time, after_peak = measure(lambda db: get_menu_item_rating(MENU_ITEM_ID, db=db), args.repeat)
+        aggregate = {key: value for key, value in aggregate.items() if key != "order_ids"}
+        assert before == aggregate == after, (before, aggregate, after)
+        print(f"{review_count:>8} {before_time * 1000:>9.1f} {aggregate_time * 1000:>12.1f} {after_time * 1000:>8.1f} "
+              f"{before_peak / 1024:>10.0f} {after_peak / 1024:>9.0f}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,274 @@
+"""
+Pool of order_notifications workers with per-user ordering.
+
+One pika connection per pod receives up to RABBITMQ_PREFETCH_COUNT deliveries and
+routes each one to one of ORDER_CONSUMER_WORKERS worker threads by a hash of its
+user_id. Every event of a user (and so of each of their orders) goes through the same
+worker in arrival order, while different users are handled in parallel. A worker
+handles what has queued up for it in batches (batch_consumer.handle_batch, one session
+and one commit per batch) and hands the outcome back to the connection thread, the
+only thread allowed to touch the channel, which acks up to the highest delivery tag
+whose predecessors are all settled.
+
+A delivery that fails is not requeued behind the user's later events: the worker holds
+it, together with everything that arrives after it for the same user, and retries it
+with a growing delay. The other users of that worker keep going meanwhile. After
+ORDER_CONSUMER_MAX_ATTEMPTS failures it is logged and rejected without requeue, and the
+held events of that user continue in order.
+
+RabbitMQ still spreads the queue over every pod's consumer, so the ordering guarantee
+is per pod; events of one user published close together on different pods rely on the
+handlers being idempotent.
+
+Queue depth (ready messages, polled with a passive queue_declare) and consumer lag
+(now minus the publish timestamp of the last committed message) are exported as gauges.
+"""
+import collections
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+from prometheus_client import Counter, Gauge
+
+from batch_consumer import BATCH_SIZE, BATCH_TIMEOUT, PREFETCH_COUNT, Handler, handle_batch
+
+logger = logging.getLogger(__name__)
+
+ORDER_CONSUMER_WORKERS = int(os.getenv("ORDER_CONSUMER_WORKERS", "4"))
+QUEUE_METRICS_INTERVAL = float(os.getenv("RABBITMQ_QUEUE_METRICS_INTERVAL", "15"))  # seconds
+MAX_ATTEMPTS = int(os.getenv("ORDER_CONSUMER_MAX_ATTEMPTS", "5"))
+RETRY_DELAY = float(os.getenv("ORDER_CONSUMER_RETRY_DELAY", "0.5"))  # seconds, doubled after every failure
+
+QUEUE_DEPTH = Gauge(
+    'user_service_order_notifications_queue_depth',
+    'Messages ready in the order_notifications queue'
+)
+
+CONSUMER_LAG = Gauge(
+    'user_service_order_notifications_lag_seconds',
+    'Seconds between publishing and committing the most recently handled order notification'
+)
+
+REJECTED = Counter(
+    'user_service_order_notifications_rejected_total',
+    'Order notifications dropped after failing ORDER_CONSUMER_MAX_ATTEMPTS times'
+)
+
+WORKER_BACKLOG = Gauge(
+    'user_service_order_consumer_backlog',
+    'Deliveries received by this pod and waiting for a worker',
+    ['worker']
+)
+
+def routing_key(body: bytes):
+    """The user_id of an order notification, None when the body cannot be read"""
+    try:
+        return json.loads(body).get("user_id")
+    except (ValueError, AttributeError):
+        return None
+
+def worker_for(key, workers: int):
+    """Stable worker index for a key; unreadable messages all go to worker 0"""
+    if key is None:
+        return 0
+    return zlib.crc32(str(key).encode("utf-8")) % workers
+
+class ConsumerPool:
+    """Consume one queue with a pool of worker threads, keeping per-user order"""
+
+    def __init__(
+        self,
+        connection,
+        queue_name: str,
+        handle: Handler,
+        session_factory,
+        workers: int = ORDER_CONSUMER_WORKERS,
+        prefetch_count: int = PREFETCH_COUNT,
+        batch_size: int = BATCH_SIZE,
+        batch_timeout: float = BATCH_TIMEOUT,
+        metrics_interval: float = QUEUE_METRICS_INTERVAL,
+        max_attempts: int = MAX_ATTEMPTS,
+        retry_delay: float = RETRY_DELAY
+    ):
+        self.connection = connection
+        self.channel = connection.channel()
+        self.queue_name = queue_name
+        self.handle = handle
+        self.session_factory = session_factory
+        self.workers = max(1, workers)
+        self.prefetch_count = prefetch_count
+        self.batch_size = max(1, min(batch_size, prefetch_count))
+        self.batch_timeout = batch_timeout
+        self.metrics_interval = metrics_interval
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self._inboxes = [queue.Queue() for _ in range(self.workers)]
+        self._threads = []
+        # 只在 connection thread 上讀寫
+        self._outstanding = collections.deque()
+        self._finished = {}
+
+    def start(self):
+        """Start the workers and consume until the connection closes or the thread is interrupted"""
+        for index, inbox in enumerate(self._inboxes):
+            WORKER_BACKLOG.labels(worker=str(index)).set_function(inbox.qsize)
+            thread = threading.Thread(target=self._work, args=(inbox,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.channel.basic_consume(queue=self.queue_name, on_message_callback=self._on_message)
+        if self.metrics_interval > 0:
+            self._update_queue_depth()
+        try:
+            self.channel.start_consuming()
+        except KeyboardInterrupt:
+            self.channel.stop_consuming()
+        finally:
+            self.stop()
+            self.connection.close()
+
+    def stop(self):
+        """Let every worker finish what it already has, then end the worker threads"""
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _on_message(self, channel, method, properties, body):
+        self._outstanding.append(method.delivery_tag)
+        timestamp = getattr(properties, "timestamp", None)
+        index = worker_for(routing_key(body), self.workers)
+        self._inboxes[index].put((method.delivery_tag, body, timestamp))
+
+    def _next_batch(self, inbox, wait=None):
+        """
+        Block for one delivery (at most wait seconds), then gather more until batch_size or
+        batch_timeout; None means stop, an empty list means nothing arrived in time
+        """
+        try:
+            first = inbox.get(timeout=wait)
+        except queue.Empty:
+            return []
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                delivery = inbox.get(timeout=remaining) if remaining > 0 else inbox.get_nowait()
+            except queue.Empty:
+                break
+            if delivery is None:
+                # 先處理手上的批次，下一輪再結束
+                inbox.put(None)
+                break
+            batch.append(delivery)
+        return batch
+
+    def _work(self, inbox):
+        # 失敗的 delivery 與同一使用者之後到的 delivery 都先留在 worker，依序重試
+        held = {}       # key -> [(delivery_tag, body, timestamp), ...]，失敗的那筆在最前面
+        retry_at = {}   # key -> 下次重試的 monotonic 時間
+        attempts = {}   # delivery_tag -> 已失敗次數
+        while True:
+            wait = max(0.0, min(retry_at.values()) - time.monotonic()) if held else None
+            batch = self._next_batch(inbox, wait)
+            if batch is None:
+                # 結束前把還卡著的 delivery 交回 broker，之後依原順序重送
+                requeued = [tag for waiting in held.values() for tag, _, _ in waiting]
+                if requeued:
+                    self.connection.add_callback_threadsafe(functools.partial(self._settle, [], [], requeued))
+                return
+
+            now = time.monotonic()
+            deliveries = []
+            for key, waiting in held.items():
+                if retry_at[key] <= now:
+                    deliveries.extend(waiting)
+            for delivery in batch:
+                key = routing_key(delivery[1])
+                if key in held:
+                    held[key].append(delivery)
+                    if retry_at[key] <= now:
+                        deliveries.append(delivery)
+                else:
+                    deliveries.append(delivery)
+            if not deliveries:
+                continue
+            for key in [key for key in held if retry_at[key] <= now]:
+                del held[key], retry_at[key]
+
+            acked, nacked = handle_batch(
+                self.session_factory, self.handle, [(tag, body) for tag, body, _ in deliveries], key=routing_key
+            )
+            for tag in acked:
+                attempts.pop(tag, None)
+            rejected, dropped_keys = [], set()
+            failed = set(nacked)
+            for delivery in deliveries:
+                if delivery[0] not in failed:
+                    continue
+                key = routing_key(delivery[1])
+                if key in held:
+                    held[key].append(delivery)
+                    continue
+                if key in dropped_keys:
+                    # 擋住它的那筆已經丟掉，下一輪直接處理
+                    held[key] = [delivery]
+                    retry_at[key] = 0.0
+                    continue
+                # 同一個 key 第一筆失敗的才是真正出錯的，後面的只是被擋住
+                attempts[delivery[0]] = attempts.get(delivery[0], 0) + 1
+                if attempts[delivery[0]] >= self.max_attempts:
+                    del attempts[delivery[0]]
+                    logger.error(
+                        f"Dropping message {delivery[0]} after {self.max_attempts} failed attempts: {delivery[1]!r}"
+                    )
+                    REJECTED.inc()
+                    rejected.append(delivery[0])
+                    dropped_keys.add(key)
+                    continue
+                held[key] = [delivery]
+                retry_at[key] = time.monotonic() + self.retry_delay * 2 ** (attempts[delivery[0]] - 1)
+
+            timestamps = [timestamp for tag, _, timestamp in deliveries if timestamp is not None and tag in acked]
+            if timestamps:
+                CONSUMER_LAG.set(max(0.0, time.time() - max(timestamps)))
+            # pika 的 channel 不是 thread-safe，ack 交回 connection thread 執行
+            self.connection.add_callback_threadsafe(functools.partial(self._settle, acked, rejected))
+
+    def _settle(self, acked, rejected, requeued=()):
+        for delivery_tag in rejected:
+            self.channel.basic_reject(delivery_tag=delivery_tag, requeue=False)
+            self._finished[delivery_tag] = False
+        for delivery_tag in requeued:
+            self.channel.basic_nack(delivery_tag=delivery_tag)
+            self._finished[delivery_tag] = False
+        for delivery_tag in acked:
+            self._finished[delivery_tag] = True
+
+        # 各 worker 完成的順序不一定，只能 ack 到前面全部都處理完的位置
+        ack_up_to = None
+        while self._outstanding and self._outstanding[0] in self._finished:
+            delivery_tag = self._outstanding.popleft()
+            if self._finished.pop(delivery_tag):
+                ack_up_to = delivery_tag
+        if ack_up_to is not None:
+            self.channel.basic_ack(delivery_tag=ack_up_to, multiple=True)
+
+    def _update_queue_depth(self):
+        try:
+            result = self.channel.queue_declare(queue=self.queue_name, durable=True, passive=True)
+            QUEUE_DEPTH.set(result.method.message_count)
+        except Exception as e:
+            logger.warning(f"Failed to read the depth of {self.queue_name}: {e}")
+            return
+        self.connection.call_later(self.metrics_interval, self._update_queue_depth)
@@ -6,10 +6,14 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+import db_pool  # 讀取 DB_POOL_* 環境變數，須在 load_dotenv 之後
+
 # PostgreSQL configuration for Docker
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/meal_provider_user")
 
-engine = create_engine(DATABASE_URL)
+# pool 大小、recycle、statement timeout、PgBouncer 模式見 db_pool.py
+engine = create_engine(DATABASE_URL, **db_pool.engine_options(DATABASE_URL, "sync"))
+db_pool.instrument(engine, "sync")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -0,0 +1,122 @@
+"""
+Connection pool settings and pool metrics for the service's engines.
+
+Pool size, overflow, recycle, pre-ping and the statement timeout come from env, so
+they can be tuned per deployment (replicas x engines x (size + overflow) must stay
+under Postgres max_connections). With DB_PGBOUNCER=true the engines are safe behind
+PgBouncer in transaction pooling mode: no startup parameters, no server-side
+prepared statement cache, and the statement timeout is sent with SET LOCAL.
+SQLite URLs (tests, local runs) keep SQLAlchemy's defaults.
+
+Copied verbatim into every service (tests/test_shared_modules.py in order_service keeps
+the copies identical); Prometheus tells the services apart by their pod labels.
+"""
+import os
+import time
+from uuid import uuid4
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds, -1 停用
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 停用
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time spent waiting for a pooled database connection',
+    ['engine'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts_total',
+    'Checkouts that gave up after DB_POOL_TIMEOUT',
+    ['engine']
+)
+
+POOL_IN_USE = Gauge(
+    'db_pool_connections_in_use',
+    'Connections currently checked out of the pool',
+    ['engine']
+)
+
+POOL_CAPACITY = Gauge(
+    'db_pool_capacity',
+    'pool_size + max_overflow',
+    ['engine']
+)
+
+POOL_SATURATION = Gauge(
+    'db_pool_saturation',
+    'Checked-out connections / pool capacity (1 means checkouts start to queue)',
+    ['engine']
+)
+
+def _timed_pool(base, name: str):
+    """Subclass of a queue pool that records how long each checkout waited"""
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return base._do_get(self)
+        except PoolTimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.labels(engine=name).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.labels(engine=name).observe(time.perf_counter() - start)
+
+    # pool.recreate()（engine.dispose）會用同一個 class 重建 pool
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get})
+
+def engine_options(url: str, name: str):
+    """create_engine / create_async_engine keyword arguments for this URL"""
+    url = make_url(url)
+    if url.get_backend_name() != "postgresql":
+        return {}
+    is_async = url.get_driver_name() == "asyncpg"
+
+    connect_args = {}
+    if DB_PGBOUNCER:
+        if is_async:
+            # transaction pooling 下同一個 client 的下一個交易可能換到另一條 server 連線
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    elif DB_STATEMENT_TIMEOUT_MS > 0:
+        if is_async:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        else:
+            connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    return {
+        "poolclass": _timed_pool(AsyncAdaptedQueuePool if is_async else QueuePool, name),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+def instrument(engine: Engine, name: str):
+    """Export pool usage gauges for a sync engine (async_engine.sync_engine for async ones)"""
+    if DB_PGBOUNCER and DB_STATEMENT_TIMEOUT_MS > 0 and engine.dialect.name == "postgresql":
+        # PgBouncer 不轉送 startup parameter，session 層級的 SET 又會漏到其他 client
+        @event.listens_for(engine, "begin")
+        def set_statement_timeout(connection):
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+
+    if not isinstance(engine.pool, QueuePool):
+        return
+    capacity = engine.pool.size() + max(engine.pool._max_overflow, 0)
+    POOL_CAPACITY.labels(engine=name).set(capacity)
+    # engine.dispose() 之後 engine.pool 會換成新的 pool，每次都從 engine 取
+    POOL_IN_USE.labels(engine=name).set_function(lambda: engine.pool.checkedout())
+    POOL_SATURATION.labels(engine=name).set_function(lambda: engine.pool.checkedout() / capacity if capacity else 0)
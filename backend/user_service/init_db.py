@@ -1,11 +1,31 @@
 # from user_service.database import engine
 # from user_service.models import Base
 
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
 from database import engine
-from models import Base
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+# 導入 Alembic 之前已由 create_all 建好的資料庫，結構等同這個 revision
+BASELINE_REVISION = "0001"
+
+def run_migrations():
+    """Upgrade the schema to the latest Alembic revision"""
+    config = Config(ALEMBIC_INI)
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        tables = inspect(connection).get_table_names()
+        if tables and "alembic_version" not in tables:
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, "head")
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    # menu_item_rating_stats 由 migration 0004 從既有的評論回填
+    run_migrations()
 
 if __name__ == "__main__":
     print("Creating database tables...")
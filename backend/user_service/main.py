@@ -1,20 +1,27 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import jwt
+import os
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
-from sqlalchemy import func
+from sqlalchemy import func, case, select
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from starlette.responses import Response
+from fastapi.responses import StreamingResponse
+import pyarrow as pa
 
 import models
 import schemas
 import database
 from database import get_db
-from rabbitmq import setup_rabbitmq, start_consumer_thread, start_order_consumer_thread
+from rabbitmq import setup_rabbitmq, start_consumer_thread, start_order_consumer_thread, publisher
+from principal_cache import principal_cache
+import rating_stats
+import export_formats
+import pagination
 
 # Create FastAPI app
 app = FastAPI(title="User Service API")
@@ -33,6 +40,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[pagination.NEXT_CURSOR_HEADER],
 )
 
 # Password encryption configuration
@@ -40,7 +48,7 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # JWT configuration
-SECRET_KEY = "mealprovider"  # Should be obtained from environment variables in production
+SECRET_KEY = os.getenv("SECRET_KEY", "mealprovider")  # order_service and admin_service verify tokens with the same key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
@@ -93,10 +101,10 @@ async def startup_event():
             print(f"Password: {DEFAULT_SUPER_ADMIN_PASSWORD}")
             print("IMPORTANT: Please change the default password after first login!")
         
-        # Start the consumer thread
-        consumer_thread = start_consumer_thread(db)
+        # Start the consumer threads; each opens its own session per batch
+        consumer_thread = start_consumer_thread(database.SessionLocal)
         # Start the order consumer thread
-        order_consumer_thread = start_order_consumer_thread(db)
+        order_consumer_thread = start_order_consumer_thread(database.SessionLocal)
     finally:
         db.close()
 
@@ -107,6 +115,7 @@ async def shutdown_event():
     if consumer_thread and consumer_thread.is_alive():
         # The thread is a daemon thread, so it will be terminated when the main process exits
         pass
+    publisher.close()
 
 # Authentication related functions
 def create_access_token(data: dict):
@@ -119,7 +128,7 @@ def create_access_token(data: dict):
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
-):
+) -> schemas.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -133,14 +142,21 @@ def get_current_user(
         token_data = schemas.TokenData(username=username)
     except jwt.PyJWTError:
         raise credentials_exception
-    
+
+    # 解析過的使用者 (id, username, role) 快取一段時間，避免每個請求都查 users
+    principal = principal_cache.get(token_data.username)
+    if principal is not None:
+        return principal
+
     user = db.query(models.User).filter(models.User.username == token_data.username).first()
     if user is None:
         raise credentials_exception
-    return user
+    principal = schemas.User.model_validate(user)
+    principal_cache.set(token_data.username, principal)
+    return principal
 
 def get_current_admin(
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     if current_user.role != "admin":
         raise HTTPException(
@@ -150,7 +166,7 @@ def get_current_admin(
     return current_user
 
 def get_current_super_admin(
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     if current_user.role != "super_admin":
         raise HTTPException(
@@ -211,25 +227,36 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return db_user
 
 @app.get("/users/me", response_model=schemas.User)
-async def read_users_me(current_user: models.User = Depends(get_current_user)):
+async def read_users_me(current_user: schemas.User = Depends(get_current_user)):
     return current_user
 
+def dining_record_key(dining_record: models.DiningRecord):
+    return dining_record.dining_date, dining_record.id
+
+# 用餐紀錄依 (dining_date, id) 由舊到新分頁，與原本未分頁時的順序相同
 @app.get("/users/{user_id}/dining-records/", response_model=List[schemas.DiningRecord])
 def get_user_dining_records(
     user_id: int,
+    response: Response,
+    cursor: Optional[str] = None,  # 上一頁回應的 X-Next-Cursor
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     if current_user.id != user_id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
-    return db.query(models.DiningRecord).filter(models.DiningRecord.user_id == user_id).all()
+    dining_records = pagination.keyset(
+        db.query(models.DiningRecord).filter(models.DiningRecord.user_id == user_id),
+        models.DiningRecord.dining_date, models.DiningRecord.id, cursor, limit, descending=False
+    ).all()
+    return pagination.page(response, dining_records, limit, dining_record_key)
 
 @app.post("/dining-records/{dining_record_id}/reviews/", response_model=schemas.Review)
 def create_review(
     dining_record_id: int,
     review: schemas.ReviewCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     # First check if dining record exists
     db_dining_record = db.query(models.DiningRecord).filter(
@@ -249,6 +276,7 @@ def create_review(
         dining_record_id=dining_record_id
     )
     db.add(db_review)
+    rating_stats.apply_review_change(db, db_dining_record, None, db_review.rating)
     db.commit()
     db.refresh(db_review)
     return db_review
@@ -266,14 +294,14 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token = create_access_token(data={"sub": user.username, "role": user.role})
+    access_token = create_access_token(data={"sub": user.username, "user_id": user.id, "role": user.role})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/dining-records/{dining_record_id}", response_model=schemas.DiningRecord)
 def get_dining_record(
     dining_record_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     db_dining_record = db.query(models.DiningRecord).filter(
         models.DiningRecord.id == dining_record_id,
@@ -289,7 +317,7 @@ def get_dining_record(
 def get_dining_record_review(
     dining_record_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     # First verify the dining record belongs to the user
     db_dining_record = db.query(models.DiningRecord).filter(
@@ -316,7 +344,7 @@ def update_review(
     dining_record_id: int,
     review: schemas.ReviewCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     # First verify the dining record belongs to the user
     db_dining_record = db.query(models.DiningRecord).filter(
@@ -337,8 +365,10 @@ def update_review(
         raise HTTPException(status_code=404, detail="Review not found")
     
     # Update the review
+    old_rating = db_review.rating
     for key, value in review.dict().items():
         setattr(db_review, key, value)
+    rating_stats.apply_review_change(db, db_dining_record, old_rating, db_review.rating)
     
     db.commit()
     db.refresh(db_review)
@@ -348,7 +378,7 @@ def update_review(
 def delete_review(
     dining_record_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     # First verify the dining record belongs to the user
     db_dining_record = db.query(models.DiningRecord).filter(
@@ -370,40 +400,145 @@ def delete_review(
     
     # Delete the review
     db.delete(db_review)
+    rating_stats.apply_review_change(db, db_dining_record, db_review.rating, None)
     db.commit()
     return None
 
+def query_menu_item_ratings(
+    db: Session,
+    menu_item_ids: Optional[List[int]] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """
+    One grouped aggregate over dining_records LEFT JOIN reviews, optionally limited to dining_date in [start_date, end_date).
+    Returns {menu_item_id: {...rating fields}} for items that have dining records in the window.
+    """
+    query = db.query(
+        models.DiningRecord.menu_item_id,
+        func.max(models.DiningRecord.menu_item_name),
+        func.count(models.Review.id),
+        func.coalesce(func.sum(case((models.Review.rating == "good", 1), else_=0)), 0)
+    ).outerjoin(
+        models.Review, models.Review.dining_record_id == models.DiningRecord.id
+    ).group_by(models.DiningRecord.menu_item_id)
+    if menu_item_ids is not None:
+        query = query.filter(models.DiningRecord.menu_item_id.in_(menu_item_ids))
+    if start_date is not None:
+        query = query.filter(models.DiningRecord.dining_date >= start_date)
+    if end_date is not None:
+        query = query.filter(models.DiningRecord.dining_date < end_date)
+
+    ratings = {}
+    for menu_item_id, menu_item_name, total_reviews, good_reviews in query.all():
+        good_reviews = int(good_reviews)
+        ratings[menu_item_id] = {
+            "menu_item_id": menu_item_id,
+            "menu_item_name": menu_item_name,
+            "total_reviews": total_reviews,
+            "good_reviews": good_reviews,
+            "good_ratio": good_reviews / total_reviews if total_reviews > 0 else 0,
+        }
+    return ratings
+
+def attach_order_ids(
+    db: Session,
+    ratings: dict,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """Fill "order_ids" of each rating from dining_records (no JOIN with reviews needed)"""
+    for rating in ratings.values():
+        rating["order_ids"] = []
+    if not ratings:
+        return
+    query = db.query(models.DiningRecord.menu_item_id, models.DiningRecord.order_id).filter(
+        models.DiningRecord.menu_item_id.in_(list(ratings))
+    )
+    if start_date is not None:
+        query = query.filter(models.DiningRecord.dining_date >= start_date)
+    if end_date is not None:
+        query = query.filter(models.DiningRecord.dining_date < end_date)
+    for menu_item_id, order_id in query.distinct().order_by(
+        models.DiningRecord.menu_item_id, models.DiningRecord.order_id
+    ):
+        ratings[menu_item_id]["order_ids"].append(order_id)
+
+def read_menu_item_ratings(
+    db: Session,
+    menu_item_ids: Optional[List[int]] = None,
+    include_order_ids: bool = False,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """
+    Ratings keyed by menu_item_id, counting only reviews of dining records with dining_date in [start_date, end_date).
+    Whole-day windows are read from the counters, other windows are aggregated over the records inside them.
+    Items that have dining records but none in the window are returned with zero counts.
+    """
+    start_date = rating_stats.to_naive_utc(start_date)
+    end_date = rating_stats.to_naive_utc(end_date)
+    if start_date is not None and end_date is not None and start_date >= end_date:
+        raise HTTPException(status_code=400, detail="start_date must be before end_date")
+
+    if rating_stats.is_day_boundary(start_date) and rating_stats.is_day_boundary(end_date):
+        ratings = rating_stats.read_rating_stats(db, menu_item_ids, start_date, end_date)
+    else:
+        ratings = rating_stats.read_rating_stats(db, menu_item_ids)
+        in_window = query_menu_item_ratings(db, menu_item_ids, start_date, end_date)
+        for menu_item_id, rating in ratings.items():
+            counts = in_window.get(menu_item_id, {"total_reviews": 0, "good_reviews": 0, "good_ratio": 0})
+            rating["total_reviews"] = counts["total_reviews"]
+            rating["good_reviews"] = counts["good_reviews"]
+            rating["good_ratio"] = counts["good_ratio"]
+    if include_order_ids:
+        attach_order_ids(db, ratings, start_date, end_date)
+    return ratings
+
+# 需宣告在 /ratings/{menu_item_id} 之前，否則 "bulk" 會被當成 menu_item_id
+@app.get("/ratings/bulk", response_model=List[schemas.MenuItemRatingSummary], response_model_exclude_none=True)
+def get_menu_item_ratings_bulk(
+    menu_item_ids: str = Query("all", description='Comma separated menu item ids, or "all"'),
+    include_order_ids: bool = False,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    if menu_item_ids.strip().lower() == "all":
+        ids = None
+    else:
+        try:
+            ids = sorted({int(item_id) for item_id in menu_item_ids.split(",") if item_id.strip()})
+        except ValueError:
+            raise HTTPException(status_code=400, detail='menu_item_ids must be a comma separated list of integers or "all"')
+        if not ids:
+            return []
+
+    ratings = read_menu_item_ratings(db, ids, include_order_ids, start_date, end_date)
+    # 沒有任何用餐紀錄的菜品不會出現在結果中
+    return [ratings[menu_item_id] for menu_item_id in sorted(ratings)]
+
+def get_menu_item_rating_or_404(
+    db: Session,
+    menu_item_id: int,
+    include_order_ids: bool = False,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """Rating statistics for one menu item; 404 if it has no dining records at all"""
+    rating = read_menu_item_ratings(db, [menu_item_id], include_order_ids, start_date, end_date).get(menu_item_id)
+    if rating is None:
+        raise HTTPException(status_code=404, detail="Menu item not found")
+    return rating
+
 @app.get("/ratings/{menu_item_id}", response_model=schemas.MenuItemRating)
 def get_menu_item_rating(
     menu_item_id: int,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
     db: Session = Depends(get_db)
 ):
-    # Get all dining records for this menu item
-    dining_records = db.query(models.DiningRecord).filter(
-        models.DiningRecord.menu_item_id == menu_item_id
-    ).all()
-    
-    if not dining_records:
-        raise HTTPException(status_code=404, detail="Menu item not found")
-    
-    # Get all reviews for these dining records
-    dining_record_ids = [dr.id for dr in dining_records]
-    reviews = db.query(models.Review).filter(
-        models.Review.dining_record_id.in_(dining_record_ids)
-    ).all()
-    
-    # Calculate statistics
-    total_reviews = len(reviews)  # Total number of reviews
-    good_reviews = sum(1 for review in reviews if review.rating == "good")
-    good_ratio = good_reviews / total_reviews if total_reviews > 0 else 0
-    
-    return {
-        "menu_item_id": menu_item_id,
-        "menu_item_name": dining_records[0].menu_item_name,  # All records should have the same name
-        "total_reviews": total_reviews,
-        "good_reviews": good_reviews,
-        "good_ratio": good_ratio
-    }
+    return get_menu_item_rating_or_404(db, menu_item_id, start_date=start_date, end_date=end_date)
 
 @app.get("/users/unpaid", response_model=List[schemas.UnpaidUser])
 def get_unpaid_users(
@@ -435,34 +570,102 @@ def get_unpaid_users(
     
     return list(user_unpaid.values())
 
+# 匯出時每次從 cursor 取出並編碼的筆數
+DINING_RECORD_EXPORT_BATCH = int(os.getenv("DINING_RECORD_EXPORT_BATCH", "5000"))
+
+# 一筆用餐紀錄最多一則評價，攤平成同一列
+DINING_RECORD_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("user_id", pa.int64()),
+    ("order_id", pa.int64()),
+    ("menu_item_id", pa.int64()),
+    ("menu_item_name", pa.string()),
+    ("dining_date", pa.timestamp("us")),
+    ("total_amount", pa.float64()),
+    ("payment_status", pa.string()),
+    ("review_rating", pa.string()),
+    ("review_comment", pa.string()),
+])
+
+def stream_dining_records(export_format: str):
+    """Encode dining_records LEFT JOIN reviews batch by batch straight from a server-side cursor"""
+    # yield 型的 get_db 在開始串流前就已關閉，這裡另開 session
+    db = database.SessionLocal()
+    try:
+        result = db.execute(
+            select(
+                models.DiningRecord.id,
+                models.DiningRecord.user_id,
+                models.DiningRecord.order_id,
+                models.DiningRecord.menu_item_id,
+                models.DiningRecord.menu_item_name,
+                models.DiningRecord.dining_date,
+                models.DiningRecord.total_amount,
+                models.DiningRecord.payment_status,
+                models.Review.rating,
+                models.Review.comment
+            )
+            .outerjoin(models.Review, models.Review.dining_record_id == models.DiningRecord.id)
+            .order_by(models.DiningRecord.id)
+            .execution_options(yield_per=DINING_RECORD_EXPORT_BATCH)
+        )
+        encoder = export_formats.BatchEncoder(export_format, DINING_RECORD_SCHEMA)
+        for rows in result.partitions():
+            yield encoder.write(rows)
+        yield encoder.close()
+    finally:
+        db.close()
+
 # Get all dining records (admin only)
 @app.get("/dining-records/", response_model=List[schemas.DiningRecord])
 def get_all_dining_records(
+    response: Response,
+    cursor: Optional[str] = None,  # 只用於 JSON 分頁；匯出格式一次串流全部紀錄
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    export_format: Optional[str] = Query(None, alias="format"),  # 不指定時回傳 JSON；csv, parquet, arrow 以串流匯出
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key)
 ):
-    return db.query(models.DiningRecord).all()
+    if export_format is None:
+        dining_records = pagination.keyset(
+            db.query(models.DiningRecord),
+            models.DiningRecord.dining_date, models.DiningRecord.id, cursor, limit, descending=False
+        ).all()
+        return pagination.page(response, dining_records, limit, dining_record_key)
+    if export_format not in export_formats.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format")
+    return StreamingResponse(
+        stream_dining_records(export_format),
+        media_type=export_formats.MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f"attachment; filename={export_formats.filename('dining_records', export_format)}"}
+    )
 
 # Get user notifications
 @app.get("/users/{user_id}/notifications", response_model=List[schemas.Notification])
 def get_user_notifications(
     user_id: int,
+    response: Response,
+    cursor: Optional[str] = None,  # 上一頁回應的 X-Next-Cursor
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     if current_user.id != user_id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    return db.query(models.Notification).filter(
-        models.Notification.user_id == user_id
-    ).order_by(models.Notification.created_at.desc()).all()
+    # 由新到舊
+    notifications = pagination.keyset(
+        db.query(models.Notification).filter(models.Notification.user_id == user_id),
+        models.Notification.created_at, models.Notification.id, cursor, limit
+    ).all()
+    return pagination.page(response, notifications, limit, lambda notification: (notification.created_at, notification.id))
 
 # Mark notification as read
 @app.put("/notifications/{notification_id}/read", response_model=schemas.Notification)
 def mark_notification_read(
     notification_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     notification = db.query(models.Notification).filter(
         models.Notification.id == notification_id,
@@ -478,45 +681,19 @@ def mark_notification_read(
     return notification 
 
 @app.get("/ratingswithorder/{menu_item_id}", response_model=schemas.MenuItemRatingWithOrders)
-def get_menu_item_rating(
+def get_menu_item_rating_with_orders(
     menu_item_id: int,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
     db: Session = Depends(get_db)
 ):
-    # Get all dining records for this menu item
-    dining_records = db.query(models.DiningRecord).filter(
-        models.DiningRecord.menu_item_id == menu_item_id
-    ).all()
-    
-    if not dining_records:
-        raise HTTPException(status_code=404, detail="Menu item not found")
-    
-    # Get all reviews for these dining records
-    dining_record_ids = [dr.id for dr in dining_records]
-    reviews = db.query(models.Review).filter(
-        models.Review.dining_record_id.in_(dining_record_ids)
-    ).all()
-    
-    # Calculate statistics
-    total_reviews = len(reviews)
-    good_reviews = sum(1 for review in reviews if review.rating == "good")
-    good_ratio = good_reviews / total_reviews if total_reviews > 0 else 0
-
-    order_ids = [dr.order_id for dr in dining_records]
-
-    return {
-        "menu_item_id": menu_item_id,
-        "menu_item_name": dining_records[0].menu_item_name,
-        "total_reviews": total_reviews,
-        "good_reviews": good_reviews,
-        "good_ratio": good_ratio,
-        "order_ids": order_ids
-    }
+    return get_menu_item_rating_or_404(db, menu_item_id, True, start_date, end_date)
 
 @app.get("/reviews/{menu_item_id}", response_model=List[schemas.Review])
 def get_menu_item_reviews(
     menu_item_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     # Get all dining records for this menu item
     dining_records = db.query(models.DiningRecord).filter(
@@ -538,7 +715,7 @@ def get_menu_item_reviews(
 def get_menu_item_comments(
     menu_item_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     # Get all dining records for this menu item
     dining_records = db.query(models.DiningRecord).filter(
@@ -575,7 +752,7 @@ def update_user_role(
     user_id: int,
     new_role: str,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_super_admin)
+    current_user: schemas.User = Depends(get_current_super_admin)
 ):
     # Validate the new role
     valid_roles = ["employee", "clerk", "admin"]
@@ -604,12 +781,13 @@ def update_user_role(
     target_user.role = new_role
     db.commit()
     db.refresh(target_user)
+    principal_cache.invalidate(target_user.username)
     return target_user
 
 @app.get("/users/all", response_model=List[schemas.User])
 def get_all_users(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     # Check if user is admin or super_admin
     if current_user.role not in ["admin", "super_admin"]:
@@ -0,0 +1,75 @@
+"""dining record unique key
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 21:12:40.118305
+
+Order events are upserted on (order_id, menu_item_id). Duplicates left by redelivered
+messages are removed first: the record that has a review (otherwise the oldest one)
+is kept. Reviews on the other copies are deleted with them, before 0004 builds the
+rating counters from what remains.
+
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger(__name__)
+
+dining_records = sa.table('dining_records', sa.column('id'), sa.column('order_id'), sa.column('menu_item_id'))
+reviews = sa.table('reviews', sa.column('id'), sa.column('dining_record_id'))
+
+
+def remove_duplicates(bind) -> None:
+    duplicated = sa.select(
+        dining_records.c.order_id, dining_records.c.menu_item_id
+    ).group_by(
+        dining_records.c.order_id, dining_records.c.menu_item_id
+    ).having(sa.func.count() > 1).subquery()
+    rows = bind.execute(
+        sa.select(dining_records.c.id, dining_records.c.order_id, dining_records.c.menu_item_id, reviews.c.id)
+        .join(duplicated, sa.and_(
+            dining_records.c.order_id == duplicated.c.order_id,
+            dining_records.c.menu_item_id == duplicated.c.menu_item_id
+        ))
+        .outerjoin(reviews, reviews.c.dining_record_id == dining_records.c.id)
+        .order_by(dining_records.c.id)
+    ).all()
+
+    groups = {}
+    for record_id, order_id, menu_item_id, review_id in rows:
+        groups.setdefault((order_id, menu_item_id), {}).setdefault(record_id, False)
+        if review_id is not None:
+            groups[(order_id, menu_item_id)][record_id] = True
+    removed = []
+    for records in groups.values():
+        reviewed = [record_id for record_id, has_review in records.items() if has_review]
+        keep = reviewed[0] if reviewed else next(iter(records))
+        removed.extend(record_id for record_id in records if record_id != keep)
+    if not removed:
+        return
+
+    deleted_reviews = bind.execute(reviews.delete().where(reviews.c.dining_record_id.in_(removed))).rowcount
+    bind.execute(dining_records.delete().where(dining_records.c.id.in_(removed)))
+    logger.warning(f"Removed {len(removed)} duplicate dining records and {deleted_reviews} of their reviews")
+
+
+def upgrade() -> None:
+    remove_duplicates(op.get_bind())
+    op.create_index('uq_dining_records_order_id_menu_item_id', 'dining_records', ['order_id', 'menu_item_id'], unique=True)
+    # 以 order_id 開頭的 unique index 已涵蓋付款狀態更新的查詢
+    op.drop_index('ix_dining_records_order_id_user_id', table_name='dining_records')
+
+
+def downgrade() -> None:
+    op.create_index('ix_dining_records_order_id_user_id', 'dining_records', ['order_id', 'user_id'], unique=False)
+    op.drop_index('uq_dining_records_order_id_menu_item_id', table_name='dining_records')
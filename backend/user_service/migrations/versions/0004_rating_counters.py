@@ -0,0 +1,90 @@
+"""rating counters
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 10:02:17.904512
+
+Per-menu-item review counters and their per-day buckets, backfilled from the
+existing dining records and reviews (the same totals `python rating_stats.py` builds).
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+dining_records = sa.table(
+    'dining_records',
+    sa.column('id', sa.Integer), sa.column('menu_item_id', sa.Integer),
+    sa.column('menu_item_name', sa.String), sa.column('dining_date', sa.DateTime)
+)
+reviews = sa.table('reviews', sa.column('id', sa.Integer), sa.column('dining_record_id', sa.Integer), sa.column('rating', sa.String))
+
+
+def backfill(bind, rating_stats, rating_daily) -> None:
+    rows = bind.execute(
+        sa.select(
+            dining_records.c.menu_item_id, dining_records.c.menu_item_name, dining_records.c.dining_date,
+            reviews.c.id, reviews.c.rating
+        )
+        .outerjoin(reviews, reviews.c.dining_record_id == dining_records.c.id)
+        .where(dining_records.c.menu_item_id.isnot(None))
+        .execution_options(yield_per=10000)
+    )
+    totals, daily = {}, {}
+    for menu_item_id, menu_item_name, dining_date, review_id, rating in rows:
+        total = totals.setdefault(menu_item_id, {"menu_item_name": None, "total_reviews": 0, "good_reviews": 0})
+        total["menu_item_name"] = max(total["menu_item_name"] or "", menu_item_name or "") or None
+        if review_id is None:
+            continue
+        good = int(rating == "good")
+        total["total_reviews"] += 1
+        total["good_reviews"] += good
+        if dining_date is not None:
+            bucket = daily.setdefault((menu_item_id, dining_date.date()), [0, 0])
+            bucket[0] += 1
+            bucket[1] += good
+
+    now = datetime.utcnow()
+    if totals:
+        op.bulk_insert(rating_stats, [
+            {"menu_item_id": menu_item_id, "updated_at": now, **values}
+            for menu_item_id, values in totals.items()
+        ])
+    if daily:
+        op.bulk_insert(rating_daily, [
+            {"menu_item_id": menu_item_id, "day": day, "total_reviews": total, "good_reviews": good}
+            for (menu_item_id, day), (total, good) in daily.items()
+        ])
+
+
+def upgrade() -> None:
+    rating_daily = op.create_table('menu_item_rating_daily',
+    sa.Column('menu_item_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('total_reviews', sa.Integer(), nullable=False),
+    sa.Column('good_reviews', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('menu_item_id', 'day')
+    )
+    rating_stats = op.create_table('menu_item_rating_stats',
+    sa.Column('menu_item_id', sa.Integer(), nullable=False),
+    sa.Column('menu_item_name', sa.String(), nullable=True),
+    sa.Column('total_reviews', sa.Integer(), nullable=False),
+    sa.Column('good_reviews', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('menu_item_id')
+    )
+    backfill(op.get_bind(), rating_stats, rating_daily)
+
+
+def downgrade() -> None:
+    op.drop_table('menu_item_rating_stats')
+    op.drop_table('menu_item_rating_daily')
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Float, Boolean, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -30,6 +30,24 @@ class DiningRecord(Base):
     dining_date = Column(DateTime, default=datetime.utcnow)
     total_amount = Column(Float)
     payment_status = Column(String)  # paid or unpaid
+
+    __table_args__ = (
+        # 使用者的用餐紀錄分頁：WHERE user_id = ? ORDER BY dining_date, id
+        Index("ix_dining_records_user_id_dining_date", user_id, dining_date, id),
+        # 全部用餐紀錄分頁與匯出：ORDER BY dining_date, id
+        Index("ix_dining_records_dining_date", dining_date, id),
+        # 菜品評價 / 留言：WHERE menu_item_id IN (...) [AND dining_date 區間]
+        Index("ix_dining_records_menu_item_id_dining_date", menu_item_id, dining_date),
+        # 訂單事件 upsert 的 ON CONFLICT 目標；一筆訂單的每個品項只有一筆紀錄。
+        # 也供付款狀態更新：WHERE order_id IN (...) AND user_id = ?
+        Index("uq_dining_records_order_id_menu_item_id", order_id, menu_item_id, unique=True),
+        # 未付款使用者：只索引 unpaid 的紀錄
+        Index(
+            "ix_dining_records_unpaid_user_id", user_id,
+            postgresql_where=payment_status == "unpaid",
+            sqlite_where=payment_status == "unpaid"
+        ),
+    )
     
     user = relationship("User", back_populates="dining_records")
     review = relationship("Review", back_populates="dining_record", uselist=False)
@@ -39,7 +57,7 @@ class Review(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    dining_record_id = Column(Integer, ForeignKey("dining_records.id"))
+    dining_record_id = Column(Integer, ForeignKey("dining_records.id"), index=True)
     rating = Column(String)  # "good" or "bad"
     comment = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -56,5 +74,29 @@ class Notification(Base):
     notification_type = Column(String)  # e.g., "billing", "system", etc.
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # 通知分頁：WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_notifications_user_id_created_at", user_id, created_at, id),
+    )
     
-    user = relationship("User", back_populates="notifications") 
\ No newline at end of file
+    user = relationship("User", back_populates="notifications")
+
+class MenuItemRatingStats(Base):
+    """Review counters per menu item, maintained together with reviews and dining records"""
+    __tablename__ = "menu_item_rating_stats"
+
+    menu_item_id = Column(Integer, primary_key=True)
+    menu_item_name = Column(String)
+    total_reviews = Column(Integer, nullable=False, default=0)
+    good_reviews = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class MenuItemRatingDaily(Base):
+    """Per-day buckets of the review counters, keyed by the dining date of the reviewed record"""
+    __tablename__ = "menu_item_rating_daily"
+
+    menu_item_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    total_reviews = Column(Integer, nullable=False, default=0)
+    good_reviews = Column(Integer, nullable=False, default=0)
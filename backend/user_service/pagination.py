@@ -0,0 +1,58 @@
+"""
+Keyset pagination on (timestamp, id) with opaque cursors.
+
+A page is fetched with `WHERE (ts, id) < (:ts, :id) ORDER BY ts DESC, id DESC LIMIT n + 1`
+(or the ascending equivalent), so deep pages cost the same as the first one. The extra row
+only tells whether there is a next page; its cursor is returned in the X-Next-Cursor header
+and the body stays a plain list.
+
+Every JSON listing is paged: without a limit a page has DEFAULT_PAGE_SIZE rows, never more
+than MAX_PAGE_SIZE. Callers that need the whole listing follow X-Next-Cursor.
+
+Copied verbatim into user_service and order_service (tests/test_shared_modules.py in
+order_service keeps the copies identical).
+"""
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+DEFAULT_PAGE_SIZE = min(int(os.getenv("DEFAULT_PAGE_SIZE", "100")), MAX_PAGE_SIZE)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(timestamp: datetime, row_id: int):
+    raw = json.dumps([timestamp.isoformat(), row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset(stmt, timestamp_column, id_column, cursor: Optional[str], limit: int, descending: bool = True):
+    """Apply the keyset condition, ordering and LIMIT limit + 1 to a select() or Query"""
+    key = tuple_(timestamp_column, id_column)
+    if cursor:
+        position = tuple_(*decode_cursor(cursor))
+        stmt = stmt.filter(key < position if descending else key > position)
+    if descending:
+        stmt = stmt.order_by(timestamp_column.desc(), id_column.desc())
+    else:
+        stmt = stmt.order_by(timestamp_column, id_column)
+    return stmt.limit(limit + 1)
+
+def page(response: Response, rows, limit: int, key):
+    """Drop the look-ahead row fetched by keyset() and set X-Next-Cursor from the last row kept"""
+    rows = list(rows)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
+    return rows
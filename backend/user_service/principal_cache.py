@@ -0,0 +1,66 @@
+"""
+Bounded TTL/LRU cache of resolved principals for get_current_user.
+
+Keyed by JWT subject (username) so that update_user_role can invalidate it.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))  # seconds, 0 停用快取
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+PRINCIPAL_CACHE_REQUESTS = Counter(
+    'user_service_principal_cache_requests_total',
+    'Principal cache lookups in get_current_user',
+    ['result']  # hit, miss
+)
+
+PRINCIPAL_CACHE_ENTRIES = Gauge(
+    'user_service_principal_cache_entries',
+    'Number of cached principals'
+)
+
+class PrincipalCache:
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, maxsize: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # sync endpoint 在 threadpool 裡執行，需要上鎖
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        PRINCIPAL_CACHE_ENTRIES.set_function(lambda: len(self._entries))
+
+    def get(self, subject: str):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is not None and time.monotonic() < entry[0]:
+                self._entries.move_to_end(subject)
+                PRINCIPAL_CACHE_REQUESTS.labels(result="hit").inc()
+                return entry[1]
+            self._entries.pop(subject, None)
+        PRINCIPAL_CACHE_REQUESTS.labels(result="miss").inc()
+        return None
+
+    def set(self, subject: str, principal):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[subject] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, subject: str):
+        with self._lock:
+            self._entries.pop(subject, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache()
@@ -1,12 +1,17 @@
 import pika
 import json
 from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 import models
+import rating_stats
+from batch_consumer import BatchConsumer
+from consumer_pool import ConsumerPool
 import threading
 import time
 import logging
 import os
+import queue
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +24,10 @@ RABBITMQ_USER = os.getenv("RABBITMQ_USER", "admin")
 RABBITMQ_PASSWORD = os.getenv("RABBITMQ_PASSWORD", "password")
 MAX_RETRIES = 5
 RETRY_DELAY = 5  # seconds
+PUBLISHER_POOL_SIZE = int(os.getenv("RABBITMQ_PUBLISHER_POOL_SIZE", "4"))
+PUBLISHER_HEARTBEAT = 60  # seconds
+PUBLISHER_BLOCKED_TIMEOUT = 30  # seconds
+PUBLISH_RETRIES = 2
 
 # Exchange and queue names
 NOTIFICATION_EXCHANGE = "notifications"
@@ -27,6 +36,10 @@ NOTIFICATION_QUEUE = "billing_notifications"
 ORDER_NOTIFICATION_ROUTING_KEY = "order.notification"
 ORDER_NOTIFICATION_QUEUE = "order_notifications"
 
+# Versioned order events (version 2) carry every line item of an order
+ORDER_PLACED_EVENT = "order.placed"
+ORDER_STATUS_CHANGED_EVENT = "order.status_changed"
+
 def get_connection():
     """Create a connection to RabbitMQ with retries"""
     credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
@@ -52,6 +65,93 @@ def get_connection():
             logger.warning(f"Failed to connect to RabbitMQ, retrying in {RETRY_DELAY} seconds...")
             time.sleep(RETRY_DELAY)
 
+class RabbitMQPublisher:
+    """
+    Pool of long-lived publisher connections with publisher confirms.
+
+    Each slot holds one (connection, channel) pair that is opened lazily,
+    reused across publishes and reopened when the broker drops it.
+    BlockingConnection is not thread-safe, so a slot is checked out by one
+    thread at a time.
+    """
+
+    def __init__(self, pool_size=PUBLISHER_POOL_SIZE):
+        self._slots = queue.LifoQueue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._slots.put(None)
+
+    def _open(self):
+        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
+        parameters = pika.ConnectionParameters(
+            host=RABBITMQ_HOST,
+            port=RABBITMQ_PORT,
+            credentials=credentials,
+            heartbeat=PUBLISHER_HEARTBEAT,
+            blocked_connection_timeout=PUBLISHER_BLOCKED_TIMEOUT
+        )
+        connection = pika.BlockingConnection(parameters)
+        channel = connection.channel()
+        channel.confirm_delivery()
+        channel.exchange_declare(
+            exchange=NOTIFICATION_EXCHANGE,
+            exchange_type='topic',
+            durable=True
+        )
+        return connection, channel
+
+    @staticmethod
+    def _discard(slot):
+        if slot is None:
+            return
+        connection, _ = slot
+        try:
+            if connection.is_open:
+                connection.close()
+        except Exception:
+            pass
+
+    def publish(self, routing_key, message):
+        """Publish a persistent JSON message, blocking until the broker confirms it"""
+        body = json.dumps(message)
+        slot = self._slots.get()
+        try:
+            for attempt in range(PUBLISH_RETRIES):
+                try:
+                    if slot is None or not slot[1].is_open:
+                        self._discard(slot)
+                        slot = self._open()
+                    else:
+                        # Service heartbeats that piled up while the slot sat idle
+                        slot[0].process_data_events(time_limit=0)
+                    slot[1].basic_publish(
+                        exchange=NOTIFICATION_EXCHANGE,
+                        routing_key=routing_key,
+                        body=body,
+                        properties=pika.BasicProperties(
+                            delivery_mode=2,  # make message persistent
+                            content_type='application/json'
+                        )
+                    )
+                    return
+                except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+                    self._discard(slot)
+                    slot = None
+                    if attempt == PUBLISH_RETRIES - 1:
+                        logger.error(f"Failed to publish to RabbitMQ after {PUBLISH_RETRIES} attempts: {e}")
+                        raise
+                    logger.warning(f"RabbitMQ publish failed, reconnecting: {e}")
+        finally:
+            self._slots.put(slot)
+
+    def close(self):
+        """Close every pooled connection"""
+        for _ in range(self._slots.maxsize):
+            slot = self._slots.get()
+            self._discard(slot)
+            self._slots.put(None)
+
+publisher = RabbitMQPublisher()
+
 def setup_rabbitmq():
     """Set up RabbitMQ exchange and queue with retries"""
     for attempt in range(MAX_RETRIES):
@@ -103,146 +203,155 @@ def setup_rabbitmq():
 
 def send_notification(notification_data):
     """Send a notification to RabbitMQ"""
-    connection = get_connection()
-    channel = connection.channel()
-
-    # Publish message
-    channel.basic_publish(
-        exchange=NOTIFICATION_EXCHANGE,
-        routing_key=NOTIFICATION_ROUTING_KEY,
-        body=json.dumps(notification_data),
-        properties=pika.BasicProperties(
-            delivery_mode=2,  # Make message persistent
-            content_type='application/json'
-        )
-    )
-
-    connection.close()
+    publisher.publish(NOTIFICATION_ROUTING_KEY, notification_data)
 
-def process_notification(ch, method, properties, body, db: Session):
-    """Process a notification message"""
+def handle_notification(body, db: Session):
+    """Add a billing notification to the session; malformed messages are logged and dropped"""
     try:
         data = json.loads(body)
-        
-        # Validate required fields
-        required_fields = ['user_id', 'user_name', 'unpaid_amount']
-        if not all(field in data for field in required_fields):
-            print(f"Invalid notification format: {data}")
-            return
-
-        # Create notification in database
-        notification = models.Notification(
-            user_id=data['user_id'],
-            message=f"Payment reminder: You have an unpaid amount of ${data['unpaid_amount']}",
-            notification_type="billing",
-            is_read=False
-        )
-        db.add(notification)
-        db.commit()
-
     except json.JSONDecodeError:
         print(f"Invalid JSON format: {body}")
-    except Exception as e:
-        print(f"Error processing notification: {e}")
-    finally:
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return
 
-def consume_notifications(db: Session):
-    """Start consuming notifications from RabbitMQ"""
-    connection = get_connection()
-    channel = connection.channel()
+    # Validate required fields
+    required_fields = ['user_id', 'user_name', 'unpaid_amount']
+    if not all(field in data for field in required_fields):
+        print(f"Invalid notification format: {data}")
+        return
 
-    # Set up consumer
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(
-        queue=NOTIFICATION_QUEUE,
-        on_message_callback=lambda ch, method, properties, body: process_notification(ch, method, properties, body, db)
+    # Create notification in database
+    notification = models.Notification(
+        user_id=data['user_id'],
+        message=f"Payment reminder: You have an unpaid amount of ${data['unpaid_amount']}",
+        notification_type="billing",
+        is_read=False
     )
+    db.add(notification)
 
+def process_notification(ch, method, properties, body, db: Session):
+    """Process a single notification message"""
     try:
-        channel.start_consuming()
-    except KeyboardInterrupt:
-        channel.stop_consuming()
+        handle_notification(body, db)
+        db.commit()
+    except Exception as e:
+        print(f"Error processing notification: {e}")
+        db.rollback()
     finally:
-        connection.close()
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+def consume_notifications(session_factory):
+    """Start consuming notifications from RabbitMQ, one session per batch"""
+    BatchConsumer(get_connection(), NOTIFICATION_QUEUE, handle_notification, session_factory).start()
 
-def start_consumer_thread(db: Session):
+def start_consumer_thread(session_factory):
     """Start the RabbitMQ consumer in a background thread"""
     consumer_thread = threading.Thread(
         target=consume_notifications,
-        args=(db,),
+        args=(session_factory,),
         daemon=True
     )
     consumer_thread.start()
     return consumer_thread 
 
-def consume_order_notifications(db: Session):
-    """Consume order notifications from RabbitMQ"""
-    connection = get_connection()
-    channel = connection.channel()
+def consume_order_notifications(session_factory):
+    """Consume order notifications with a pool of workers; events of one user stay in order"""
+    ConsumerPool(get_connection(), ORDER_NOTIFICATION_QUEUE, handle_order_notification, session_factory).start()
+
+def _insert(db: Session, table):
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
 
-    # Set up consumer for order notifications
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(
-        queue=ORDER_NOTIFICATION_QUEUE,
-        on_message_callback=lambda ch, method, properties, body: process_order_notification(ch, method, properties, body, db)
+def upsert_dining_records(db: Session, user_id, payment_status, items):
+    """
+    Insert one dining record per (order_id, menu_item_id) in a single statement.
+    items: [{"order_id", "menu_item_id", "menu_item_name", "total_amount"}]
+    A redelivered event hits the unique key and only refreshes the line item fields;
+    payment_status and dining_date keep what the first delivery (or a later
+    status change) wrote.
+    """
+    rows = {
+        (item['order_id'], item['menu_item_id']): {
+            "user_id": user_id,
+            "order_id": item['order_id'],
+            "menu_item_id": item['menu_item_id'],
+            "menu_item_name": item['menu_item_name'],
+            "total_amount": item['total_amount'],
+            "payment_status": payment_status,
+            "dining_date": datetime.utcnow()
+        }
+        for item in items
+    }
+    if not rows:
+        return
+    stmt = _insert(db, models.DiningRecord).values(list(rows.values()))
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["order_id", "menu_item_id"],
+        set_={
+            "menu_item_name": stmt.excluded.menu_item_name,
+            "total_amount": stmt.excluded.total_amount
+        }
+    ))
+    rating_stats.ensure_menu_items(db, {row["menu_item_id"]: row["menu_item_name"] for row in rows.values()})
+
+def set_payment_status(db: Session, user_id, order_ids, payment_status):
+    """Update every dining record of the orders in one statement; returns the number of rows"""
+    return db.query(models.DiningRecord).filter(
+        models.DiningRecord.order_id.in_(order_ids),
+        models.DiningRecord.user_id == user_id
+    ).update(
+        {models.DiningRecord.payment_status: payment_status},
+        synchronize_session=False
     )
 
-    try:
-        channel.start_consuming()
-    except KeyboardInterrupt:
-        channel.stop_consuming()
-    finally:
-        connection.close()
+def apply_order_event(data, db: Session):
+    """Apply a version 2 order event to the session; the caller commits. Replaying an event is a no-op"""
+    if data['event'] == ORDER_PLACED_EVENT:
+        items = [dict(item, order_id=order['order_id']) for order in data['orders'] for item in order['items']]
+        upsert_dining_records(db, data['user_id'], data['payment_status'], items)
+    elif data['event'] == ORDER_STATUS_CHANGED_EVENT:
+        order_ids = [order['order_id'] for order in data['orders']]
+        set_payment_status(db, data['user_id'], order_ids, data['payment_status'])
+    else:
+        raise ValueError(f"Unknown order event type: {data['event']}")
 
-def process_order_notification(ch, method, properties, body, db: Session):
-    """Process an order notification and create a dining record"""
-    try:
-        data = json.loads(body)
-        logger.info(f"Received order notification: {data}")
-        
-        # Validate required fields
-        required_fields = ['user_id', 'order_id', 'menu_item_id', 'menu_item_name', 'total_amount', 'payment_status']
-        is_put = data.get('is_put', False)
+def handle_order_notification(body, db: Session):
+    """Apply one order notification to the session; the caller commits. Raises on invalid messages"""
+    data = json.loads(body)
+    logger.info(f"Received order notification: {data}")
+
+    if data.get('version', 1) >= 2:
+        required_fields = ['event', 'user_id', 'payment_status', 'orders']
         if not all(field in data for field in required_fields):
-            logger.error(f"Invalid order notification format: {data}")
-            ch.basic_nack(delivery_tag=method.delivery_tag)
-            return
+            raise ValueError(f"Invalid order event format: {data}")
 
-        # Create dining record
-        if not is_put:
-            logger.info(f"Creating dining record for order {data['order_id']}")
-            dining_record = models.DiningRecord(
-                user_id=data['user_id'],
-                order_id=data['order_id'],
-                menu_item_id=data['menu_item_id'],
-                menu_item_name=data['menu_item_name'],
-                total_amount=data['total_amount'],
-                payment_status=data['payment_status']
-            )
+        # All line items of the event are written in one transaction
+        apply_order_event(data, db)
+        logger.info(f"Applied {data['event']} for orders {[order['order_id'] for order in data['orders']]}")
+        return
 
-            db.add(dining_record)
-            db.commit()
-            logger.info(f"Created dining record for order {data['order_id']}")
-        else:
-            logger.info(f"Updating dining record for order {data['order_id']}")
-            dining_record = db.query(models.DiningRecord).filter(
-                models.DiningRecord.order_id == data['order_id'],
-                models.DiningRecord.user_id == data['user_id']
-            ).first()
-
-            if dining_record:
-                # dining_record.menu_item_name = data['menu_item_name']
-                # dining_record.total_amount = data['total_amount']
-                dining_record.payment_status = data['payment_status']
-                db.commit()
-                logger.info(f"Updated dining record for order {data['order_id']}")
-            else:
-                logger.error(f"Dining record not found for order {data['order_id']} and menu item {data['menu_item_id']}")
+    # Legacy per-item format, still accepted during the rollout
+    # Validate required fields
+    required_fields = ['user_id', 'order_id', 'menu_item_id', 'menu_item_name', 'total_amount', 'payment_status']
+    is_put = data.get('is_put', False)
+    if not all(field in data for field in required_fields):
+        raise ValueError(f"Invalid order notification format: {data}")
 
-        # Acknowledge the message
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+    # Create dining record
+    if not is_put:
+        logger.info(f"Creating dining record for order {data['order_id']}")
+        upsert_dining_records(db, data['user_id'], data['payment_status'], [data])
+    else:
+        # 付款狀態是整筆訂單的，所有品項一起更新
+        logger.info(f"Updating dining records for order {data['order_id']}")
+        if not set_payment_status(db, data['user_id'], [data['order_id']], data['payment_status']):
+            logger.error(f"Dining record not found for order {data['order_id']} and menu item {data['menu_item_id']}")
 
+def process_order_notification(ch, method, properties, body, db: Session):
+    """Process a single order notification in its own transaction"""
+    try:
+        handle_order_notification(body, db)
+        db.commit()
     except json.JSONDecodeError:
         logger.error(f"Invalid JSON format: {body}")
         ch.basic_nack(delivery_tag=method.delivery_tag)
@@ -250,12 +359,15 @@ def process_order_notification(ch, method, properties, body, db: Session):
         logger.error(f"Error processing order notification: {e}")
         ch.basic_nack(delivery_tag=method.delivery_tag)
         db.rollback()
+    else:
+        # Acknowledge the message
+        ch.basic_ack(delivery_tag=method.delivery_tag)
 
-def start_order_consumer_thread(db: Session):
+def start_order_consumer_thread(session_factory):
     """Start the order notification consumer in a background thread"""
     consumer_thread = threading.Thread(
         target=consume_order_notifications,
-        args=(db,),
+        args=(session_factory,),
         daemon=True
     )
     consumer_thread.start()
@@ -0,0 +1,249 @@
+"""
+Incrementally maintained review counters per menu item (menu_item_rating_stats) and
+their per-day buckets (menu_item_rating_daily).
+
+The counters are changed in the same transaction as the review / dining record that
+caused the change; the caller commits. rebuild_rating_stats recomputes both tables
+from dining_records and reviews and reports drift.
+
+Usage (from backend/user_service):
+    python rating_stats.py          # rebuild
+    python rating_stats.py --check  # only report drift, exit 1 if any
+"""
+import argparse
+import logging
+import sys
+from datetime import date, datetime, time, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+def _insert(db: Session, table):
+    # INSERT ... ON CONFLICT 讓 consumer thread 與 API 同時寫入同一個菜品時不會撞 primary key
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
+
+def ensure_menu_items(db: Session, menu_item_names: Dict[int, str]):
+    """Make sure (zero) counter rows exist for menu items ({menu_item_id: menu_item_name}) that just got dining records"""
+    now = datetime.utcnow()
+    db.execute(
+        _insert(db, models.MenuItemRatingStats).values([
+            {
+                "menu_item_id": menu_item_id,
+                "menu_item_name": menu_item_name,
+                "total_reviews": 0,
+                "good_reviews": 0,
+                "updated_at": now
+            }
+            for menu_item_id, menu_item_name in menu_item_names.items()
+        ]).on_conflict_do_nothing(index_elements=["menu_item_id"])
+    )
+
+def apply_review_change(
+    db: Session,
+    dining_record: models.DiningRecord,
+    old_rating: Optional[str],
+    new_rating: Optional[str]
+):
+    """
+    Apply a review create (old_rating None), update, or delete (new_rating None) to the counters.
+    A missing counter row is inserted with the delta clamped at zero, never with negative counts.
+    """
+    total_delta = (new_rating is not None) - (old_rating is not None)
+    good_delta = (new_rating == "good") - (old_rating == "good")
+    if total_delta == 0 and good_delta == 0:
+        return
+
+    stats = models.MenuItemRatingStats
+    db.execute(
+        _insert(db, stats).values(
+            menu_item_id=dining_record.menu_item_id,
+            menu_item_name=dining_record.menu_item_name,
+            total_reviews=max(total_delta, 0),
+            good_reviews=max(good_delta, 0),
+            updated_at=datetime.utcnow()
+        ).on_conflict_do_update(
+            index_elements=["menu_item_id"],
+            set_={
+                "total_reviews": stats.total_reviews + total_delta,
+                "good_reviews": stats.good_reviews + good_delta,
+                "updated_at": datetime.utcnow(),
+            }
+        )
+    )
+
+    daily = models.MenuItemRatingDaily
+    dining_date = dining_record.dining_date or datetime.utcnow()
+    db.execute(
+        _insert(db, daily).values(
+            menu_item_id=dining_record.menu_item_id,
+            day=dining_date.date(),
+            total_reviews=max(total_delta, 0),
+            good_reviews=max(good_delta, 0)
+        ).on_conflict_do_update(
+            index_elements=["menu_item_id", "day"],
+            set_={
+                "total_reviews": daily.total_reviews + total_delta,
+                "good_reviews": daily.good_reviews + good_delta,
+            }
+        )
+    )
+
+def to_naive_utc(value: Optional[datetime]):
+    """dining_date is stored as naive UTC, so convert tz-aware inputs before comparing"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def is_day_boundary(value: Optional[datetime]):
+    value = to_naive_utc(value)
+    return value is None or value.time() == time(0)
+
+def _rating(menu_item_id, menu_item_name, total_reviews, good_reviews):
+    total_reviews = int(total_reviews or 0)
+    good_reviews = int(good_reviews or 0)
+    return {
+        "menu_item_id": menu_item_id,
+        "menu_item_name": menu_item_name,
+        "total_reviews": total_reviews,
+        "good_reviews": good_reviews,
+        "good_ratio": good_reviews / total_reviews if total_reviews > 0 else 0,
+    }
+
+def read_rating_stats(
+    db: Session,
+    menu_item_ids: Optional[List[int]] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """
+    Ratings keyed by menu_item_id, read from the counters instead of scanning reviews.
+    A window must fall on day boundaries (see is_day_boundary) and is answered from the daily buckets.
+    """
+    start_date = to_naive_utc(start_date)
+    end_date = to_naive_utc(end_date)
+    stats = models.MenuItemRatingStats
+    if start_date is None and end_date is None:
+        query = db.query(stats.menu_item_id, stats.menu_item_name, stats.total_reviews, stats.good_reviews)
+    else:
+        daily = models.MenuItemRatingDaily
+        conditions = [daily.menu_item_id == stats.menu_item_id]
+        if start_date is not None:
+            conditions.append(daily.day >= start_date.date())
+        if end_date is not None:
+            conditions.append(daily.day < end_date.date())
+        query = db.query(
+            stats.menu_item_id,
+            stats.menu_item_name,
+            func.sum(daily.total_reviews),
+            func.sum(daily.good_reviews)
+        ).outerjoin(daily, and_(*conditions)).group_by(stats.menu_item_id, stats.menu_item_name)
+    if menu_item_ids is not None:
+        query = query.filter(stats.menu_item_id.in_(menu_item_ids))
+    return {row[0]: _rating(*row) for row in query.all()}
+
+def _as_date(value):
+    # sqlite 的 date() 回傳字串
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def compute_rating_stats(db: Session):
+    """Recompute (totals, daily) from dining_records LEFT JOIN reviews"""
+    day = func.date(models.DiningRecord.dining_date)
+    rows = db.query(
+        models.DiningRecord.menu_item_id,
+        day,
+        func.max(models.DiningRecord.menu_item_name),
+        func.count(models.Review.id),
+        func.coalesce(func.sum(case((models.Review.rating == "good", 1), else_=0)), 0)
+    ).outerjoin(
+        models.Review, models.Review.dining_record_id == models.DiningRecord.id
+    ).group_by(models.DiningRecord.menu_item_id, day).all()
+
+    totals, daily = {}, {}
+    for menu_item_id, dining_day, menu_item_name, total_reviews, good_reviews in rows:
+        total = totals.setdefault(menu_item_id, {"menu_item_name": menu_item_name, "total_reviews": 0, "good_reviews": 0})
+        total["menu_item_name"] = max(total["menu_item_name"] or "", menu_item_name or "") or None
+        total["total_reviews"] += total_reviews
+        total["good_reviews"] += int(good_reviews)
+        if total_reviews:
+            daily[(menu_item_id, _as_date(dining_day))] = (total_reviews, int(good_reviews))
+    return totals, daily
+
+def find_drift(db: Session, totals, daily):
+    """List of (table, key, stored, expected) for every counter that differs from the recomputed value"""
+    drift = []
+    stats = models.MenuItemRatingStats
+    stored_totals = {
+        menu_item_id: (total_reviews, good_reviews)
+        for menu_item_id, total_reviews, good_reviews in db.query(
+            stats.menu_item_id, stats.total_reviews, stats.good_reviews
+        )
+    }
+    expected_totals = {key: (value["total_reviews"], value["good_reviews"]) for key, value in totals.items()}
+    for key in sorted(stored_totals.keys() | expected_totals.keys()):
+        if stored_totals.get(key) != expected_totals.get(key):
+            drift.append(("menu_item_rating_stats", key, stored_totals.get(key), expected_totals.get(key)))
+
+    # 計數為 0 的 bucket 與不存在的 bucket 視為相同
+    daily_stats = models.MenuItemRatingDaily
+    stored_daily = {
+        (menu_item_id, day): (total_reviews, good_reviews)
+        for menu_item_id, day, total_reviews, good_reviews in db.query(
+            daily_stats.menu_item_id, daily_stats.day, daily_stats.total_reviews, daily_stats.good_reviews
+        )
+        if total_reviews or good_reviews
+    }
+    for key in sorted(stored_daily.keys() | daily.keys()):
+        if stored_daily.get(key) != daily.get(key):
+            drift.append(("menu_item_rating_daily", key, stored_daily.get(key), daily.get(key)))
+    return drift
+
+def rebuild_rating_stats(db: Session, check_only: bool = False):
+    """Recompute both tables from scratch; returns the drift found before the rebuild"""
+    totals, daily = compute_rating_stats(db)
+    drift = find_drift(db, totals, daily)
+    if drift:
+        logger.warning(f"Rating stats drift in {len(drift)} counters")
+    if check_only:
+        return drift
+
+    db.query(models.MenuItemRatingDaily).delete(synchronize_session=False)
+    db.query(models.MenuItemRatingStats).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    db.add_all(
+        models.MenuItemRatingStats(menu_item_id=menu_item_id, updated_at=now, **values)
+        for menu_item_id, values in totals.items()
+    )
+    db.add_all(
+        models.MenuItemRatingDaily(menu_item_id=menu_item_id, day=day, total_reviews=total, good_reviews=good)
+        for (menu_item_id, day), (total, good) in daily.items()
+    )
+    db.commit()
+    return drift
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only report drift, do not rewrite the tables")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        drift = rebuild_rating_stats(db, check_only=args.check)
+    finally:
+        db.close()
+    for table, key, stored, expected in drift:
+        print(f"{table} {key}: stored {stored}, expected {expected}")
+    print(f"{len(drift)} drifted counters" + ("" if args.check else ", rebuilt"))
+    return 1 if args.check and drift else 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -87,6 +87,14 @@ class Notification(BaseModel):
     class Config:
         orm_mode = True 
 
+class MenuItemRatingSummary(BaseModel):
+    menu_item_id: int
+    menu_item_name: str
+    total_reviews: int
+    good_reviews: int
+    good_ratio: float
+    order_ids: Optional[List[int]] = None  # 只有 include_order_ids=true 時回傳
+
 class MenuItemRatingWithOrders(BaseModel):
     menu_item_id: int
     menu_item_name: str
@@ -7,7 +7,7 @@ from passlib.context import CryptContext
 from datetime import datetime, timedelta
 import jwt
 
-from ..main import app
+from ..main import app, principal_cache
 from .. import models, schemas, database
 from ..database import Base
 
@@ -21,6 +21,8 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Create test database tables
 Base.metadata.create_all(bind=engine)
+# test.db 內建 users 等資料表；之後新增的資料表（例如 menu_item_rating_stats）在這裡補建
+models.Base.metadata.create_all(bind=engine)
 
 def override_get_db():
     try:
@@ -52,6 +54,13 @@ test_review = {
     "comment": "Great meal!"
 }
 
+@pytest.fixture(autouse=True)
+def clear_principal_cache():
+    # 每個測試都會重建使用者，不能沿用前一個測試快取的 principal
+    principal_cache.clear()
+    yield
+    principal_cache.clear()
+
 @pytest.fixture
 def test_db():
     Base.metadata.create_all(bind=engine)
@@ -42,4 +42,44 @@ def test_login_wrong_password(client, test_user):
         data={"username": "testuser", "password": "wrongpassword"}
     )
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
-    assert response.json()["detail"] == "Incorrect username or password"
\ No newline at end of file
+    assert response.json()["detail"] == "Incorrect username or password"
+
+def test_current_user_is_cached_until_role_change(client, db):
+    from datetime import datetime, timedelta
+    import jwt
+    from .conftest import create_test_user
+    from .. import models
+    from ..main import principal_cache
+
+    # 用獨立的使用者，避免改到其他測試共用的 testuser 角色
+    user = create_test_user(username="cacheduser", password="cachedpass", role="employee")
+    token = jwt.encode(
+        {"sub": "cacheduser", "exp": datetime.utcnow() + timedelta(minutes=30)},
+        "mealprovider", algorithm="HS256"
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/users/me", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["role"] == "employee"
+    assert principal_cache.get("cacheduser") is not None
+
+    # 直接改資料庫不會反映，快取命中
+    db.query(models.User).filter(models.User.id == user.id).update({"role": "clerk"})
+    db.commit()
+    assert client.get("/users/me", headers=headers).json()["role"] == "employee"
+
+    # 透過 update_user_role 修改會清掉快取
+    create_test_user(username="superadmin", password="superpass", role="super_admin")
+    super_admin_token = client.post(
+        "/token", data={"username": "superadmin", "password": "superpass"}
+    ).json()["access_token"]
+    response = client.put(
+        f"/users/{user.id}/role",
+        headers={"Authorization": f"Bearer {super_admin_token}"},
+        params={"new_role": "admin"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert client.get("/users/me", headers=headers).json()["role"] == "admin"
+
+    metrics = client.get("/metrics").text
+    assert 'user_service_principal_cache_requests_total{result="hit"}' in metrics
@@ -0,0 +1,113 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ..batch_consumer import BatchConsumer
+from ..models import Base, DiningRecord, MenuItemRatingStats
+from ..rabbitmq import ORDER_NOTIFICATION_QUEUE, ORDER_PLACED_EVENT, handle_order_notification
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture(autouse=True)
+def tables():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+def order_placed(order_id, menu_item_id=1):
+    return json.dumps({
+        "version": 2,
+        "event": ORDER_PLACED_EVENT,
+        "user_id": 1,
+        "payment_status": "unpaid",
+        "orders": [{
+            "order_id": order_id,
+            "items": [{"menu_item_id": menu_item_id, "menu_item_name": f"Item {menu_item_id}", "total_amount": 10.0}]
+        }]
+    }).encode()
+
+def make_consumer(session_factory=TestingSessionLocal, **kwargs):
+    connection = MagicMock()
+    consumer = BatchConsumer(connection, ORDER_NOTIFICATION_QUEUE, handle_order_notification, session_factory, **kwargs)
+    consumer.start()
+    callback = consumer.channel.basic_consume.call_args[1]["on_message_callback"]
+    return consumer, connection, callback
+
+def deliver(consumer, callback, delivery_tag, body):
+    callback(consumer.channel, MagicMock(delivery_tag=delivery_tag), None, body)
+
+def test_full_batch_is_committed_once_and_acked_together():
+    sessions = []
+    def session_factory():
+        sessions.append(TestingSessionLocal())
+        return sessions[-1]
+
+    consumer, connection, callback = make_consumer(session_factory, prefetch_count=10, batch_size=3)
+    consumer.channel.basic_qos.assert_called_once_with(prefetch_count=10)
+
+    deliver(consumer, callback, 1, order_placed(100))
+    deliver(consumer, callback, 2, order_placed(101))
+    # 未滿一批前不寫入、不 ack
+    assert sessions == []
+    consumer.channel.basic_ack.assert_not_called()
+    connection.call_later.assert_called_once()
+
+    deliver(consumer, callback, 3, order_placed(102, menu_item_id=2))
+    assert len(sessions) == 1
+    consumer.channel.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+    connection.remove_timeout.assert_called_once_with(connection.call_later.return_value)
+
+    db = TestingSessionLocal()
+    assert sorted(record.order_id for record in db.query(DiningRecord)) == [100, 101, 102]
+    assert db.query(MenuItemRatingStats).count() == 2
+    db.close()
+
+def test_partial_batch_flushes_on_timeout():
+    consumer, connection, callback = make_consumer(prefetch_count=10, batch_size=10, batch_timeout=0.5)
+    deliver(consumer, callback, 1, order_placed(100))
+
+    delay, on_timeout = connection.call_later.call_args[0]
+    assert delay == 0.5
+    on_timeout()
+    consumer.channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+
+def test_bad_message_only_fails_itself():
+    consumer, connection, callback = make_consumer(prefetch_count=10, batch_size=3)
+    deliver(consumer, callback, 1, order_placed(100))
+    deliver(consumer, callback, 2, b"not json")
+    deliver(consumer, callback, 3, order_placed(101))
+
+    # 批次 rollback 後逐筆重試
+    consumer.channel.basic_ack.assert_any_call(delivery_tag=1)
+    consumer.channel.basic_ack.assert_any_call(delivery_tag=3)
+    consumer.channel.basic_nack.assert_called_once_with(delivery_tag=2)
+
+    db = TestingSessionLocal()
+    assert sorted(record.order_id for record in db.query(DiningRecord)) == [100, 101]
+    db.close()
+
+def test_failed_commit_nacks_the_whole_batch():
+    consumer, connection, callback = make_consumer(prefetch_count=10, batch_size=2)
+    with patch("sqlalchemy.orm.Session.commit", side_effect=RuntimeError("database is gone")):
+        deliver(consumer, callback, 1, order_placed(100))
+        deliver(consumer, callback, 2, order_placed(101))
+
+    consumer.channel.basic_ack.assert_not_called()
+    assert [call.kwargs for call in consumer.channel.basic_nack.call_args_list] == [{"delivery_tag": 1}, {"delivery_tag": 2}]
+
+    db = TestingSessionLocal()
+    assert db.query(DiningRecord).count() == 0
+    db.close()
+
+def test_batch_size_is_capped_by_prefetch():
+    consumer, _, _ = make_consumer(prefetch_count=5, batch_size=50)
+    assert consumer.batch_size == 5
@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+from unittest.mock import MagicMock
+
+from prometheus_client import REGISTRY
+
+# 與 rabbitmq.py 使用同一個 consumer_pool module，metrics 才不會重複註冊
+from ..rabbitmq import ConsumerPool, ORDER_NOTIFICATION_QUEUE
+
+def sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {})
+
+def order_event(user_id, order_id):
+    return json.dumps({"user_id": user_id, "order_id": order_id}).encode()
+
+def make_pool(handle, **kwargs):
+    connection = MagicMock()
+    pool = ConsumerPool(connection, ORDER_NOTIFICATION_QUEUE, handle, MagicMock(), metrics_interval=0, **kwargs)
+    return pool, connection
+
+def run_pool(pool, connection, deliveries):
+    """Deliver (tag, body) pairs the way pika does and consume until all of them are settled"""
+    # pika 在 connection thread 上依序執行 callback
+    settle_lock = threading.Lock()
+    def add_callback_threadsafe(callback):
+        with settle_lock:
+            callback()
+    connection.add_callback_threadsafe.side_effect = add_callback_threadsafe
+    def start_consuming():
+        callback = pool.channel.basic_consume.call_args[1]["on_message_callback"]
+        for tag, body in deliveries:
+            callback(pool.channel, MagicMock(delivery_tag=tag), MagicMock(timestamp=None), body)
+        deadline = time.monotonic() + 5
+        while pool._outstanding and time.monotonic() < deadline:
+            time.sleep(0.01)
+    pool.channel.start_consuming.side_effect = start_consuming
+    pool.start()
+
+def test_events_of_one_user_stay_in_order():
+    handled = []
+    def handle(body, db):
+        data = json.loads(body)
+        # 讓不同 worker 的處理時間交錯
+        time.sleep(0.001 * (data["order_id"] % 3))
+        handled.append((data["user_id"], data["order_id"], threading.current_thread().name))
+
+    pool, connection = make_pool(handle, workers=4, prefetch_count=100, batch_size=2, batch_timeout=0.01)
+    deliveries = [(tag, order_event(tag % 5, tag)) for tag in range(1, 41)]
+
+    run_pool(pool, connection, deliveries)
+
+    assert len(handled) == 40
+    for user_id in range(5):
+        events = [(order_id, thread) for handled_user, order_id, thread in handled if handled_user == user_id]
+        assert [order_id for order_id, _ in events] == [tag for tag in range(1, 41) if tag % 5 == user_id]
+        assert len({thread for _, thread in events}) == 1
+    assert max(call.kwargs["delivery_tag"] for call in pool.channel.basic_ack.call_args_list) == 40
+    pool.channel.basic_nack.assert_not_called()
+    connection.close.assert_called_once()
+
+def test_ack_waits_for_earlier_deliveries():
+    pool, _ = make_pool(lambda body, db: None, workers=2)
+    for tag in (1, 2, 3):
+        pool._on_message(pool.channel, MagicMock(delivery_tag=tag), MagicMock(timestamp=None), order_event(tag, tag))
+
+    # tag 2 先完成，但 tag 1 還沒處理完，不能 ack
+    pool._settle([2], [])
+    pool.channel.basic_ack.assert_not_called()
+
+    # tag 1 放棄重試：只 reject 它自己，ack 推進到 2
+    pool._settle([], [1])
+    pool.channel.basic_reject.assert_called_once_with(delivery_tag=1, requeue=False)
+    pool.channel.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+
+    pool._settle([3], [])
+    pool.channel.basic_ack.assert_called_with(delivery_tag=3, multiple=True)
+    assert not pool._outstanding and not pool._finished
+
+def test_failed_event_is_retried_before_later_events_of_the_user():
+    committed = []
+    failures = {1: 2}
+    def handle(body, db):
+        data = json.loads(body)
+        if failures.get(data["order_id"], 0) > 0:
+            failures[data["order_id"]] -= 1
+            raise RuntimeError("database unavailable")
+        committed.append(data["order_id"])
+
+    pool, connection = make_pool(handle, workers=1, batch_size=10, batch_timeout=0.01, retry_delay=0.01)
+    # 同一個使用者的兩筆事件，加上另一個使用者的一筆
+    run_pool(pool, connection, [(1, order_event(7, 1)), (2, order_event(7, 2)), (3, order_event(8, 3))])
+
+    assert committed.index(1) < committed.index(2)
+    assert sorted(committed) == [1, 2, 3]
+    assert max(call.kwargs["delivery_tag"] for call in pool.channel.basic_ack.call_args_list) == 3
+    pool.channel.basic_nack.assert_not_called()
+    pool.channel.basic_reject.assert_not_called()
+
+def test_event_that_keeps_failing_is_rejected_without_requeue():
+    committed = []
+    def handle(body, db):
+        data = json.loads(body)
+        if data["order_id"] == 1:
+            raise ValueError("bad event")
+        committed.append(data["order_id"])
+
+    pool, connection = make_pool(handle, workers=1, batch_size=10, batch_timeout=0.01, max_attempts=3, retry_delay=0.01)
+    run_pool(pool, connection, [(1, order_event(7, 1)), (2, order_event(7, 2))])
+
+    pool.channel.basic_reject.assert_called_once_with(delivery_tag=1, requeue=False)
+    pool.channel.basic_nack.assert_not_called()
+    assert committed == [2]
+    pool.channel.basic_ack.assert_called_with(delivery_tag=2, multiple=True)
+
+def test_unreadable_messages_go_to_the_first_worker():
+    pool, _ = make_pool(lambda body, db: None, workers=3)
+    pool._on_message(pool.channel, MagicMock(delivery_tag=1), MagicMock(timestamp=None), b"not json")
+    assert pool._inboxes[0].qsize() == 1
+
+def test_queue_depth_and_lag_metrics():
+    pool, connection = make_pool(lambda body, db: None, workers=1)
+    pool.metrics_interval = 15
+    pool.channel.queue_declare.return_value.method.message_count = 42
+    pool._update_queue_depth()
+    pool.channel.queue_declare.assert_called_once_with(queue=ORDER_NOTIFICATION_QUEUE, durable=True, passive=True)
+    assert sample("user_service_order_notifications_queue_depth") == 42
+    connection.call_later.assert_called_once_with(15, pool._update_queue_depth)
+
+    inbox = pool._inboxes[0]
+    inbox.put((1, order_event(1, 1), int(time.time()) - 30))
+    inbox.put(None)
+    pool._work(inbox)
+    assert sample("user_service_order_notifications_lag_seconds") >= 30
@@ -138,4 +138,85 @@ def test_get_all_dining_records(client: TestClient, db):
         headers={"X-API-Key": "invalid_key"}
     )
     assert response.status_code == 401
-    assert response.json()["detail"] == "Invalid API key" 
\ No newline at end of file
+    assert response.json()["detail"] == "Invalid API key" 
+def test_get_all_dining_records_keyset_pages(client: TestClient, db):
+    db.query(DiningRecord).delete()
+    db.commit()
+    db.add_all(
+        DiningRecord(user_id=1, order_id=i, menu_item_id=1, menu_item_name=f"Dish {i}",
+                     dining_date=datetime(2024, 1, 1), total_amount=10.0, payment_status="paid")
+        for i in range(5)
+    )
+    db.commit()
+    headers = {"X-API-Key": "mealprovider_admin_key"}
+
+    order_ids = []
+    params = {"limit": 3}
+    while True:
+        response = client.get("/dining-records/", params=params, headers=headers)
+        assert response.status_code == 200
+        order_ids.append([record["order_id"] for record in response.json()])
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 3, "cursor": response.headers["X-Next-Cursor"]}
+    assert order_ids == [[0, 1, 2], [3, 4]]
+
+    response = client.get("/dining-records/", params={"cursor": "%%%"}, headers=headers)
+    assert response.status_code == 400
+
+def test_export_dining_records(client: TestClient, db, monkeypatch):
+    import io
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from .. import main as user_main
+    from ..models import Review
+
+    db.query(Review).delete()
+    db.query(DiningRecord).delete()
+    db.commit()
+    dining_records = [
+        DiningRecord(user_id=1, order_id=i, menu_item_id=1, menu_item_name=f"Dish {i}",
+                     dining_date=datetime(2024, 1, i), total_amount=10.0 * i, payment_status="paid")
+        for i in range(1, 4)
+    ]
+    db.add_all(dining_records)
+    db.commit()
+    db.add(Review(user_id=1, dining_record_id=dining_records[0].id, rating="good", comment="ok"))
+    db.commit()
+
+    # 每批 2 筆，3 筆紀錄會分成兩個 row group / record batch
+    monkeypatch.setattr(user_main, "DINING_RECORD_EXPORT_BATCH", 2)
+    headers = {"X-API-Key": "mealprovider_admin_key"}
+    expected = {
+        "id": [record.id for record in dining_records],
+        "order_id": [1, 2, 3],
+        "menu_item_name": ["Dish 1", "Dish 2", "Dish 3"],
+        "dining_date": [datetime(2024, 1, i) for i in range(1, 4)],
+        "total_amount": [10.0, 20.0, 30.0],
+        "review_rating": ["good", None, None],
+    }
+
+    response = client.get("/dining-records/", params={"format": "parquet"}, headers=headers)
+    assert response.status_code == 200
+    parquet_file = pq.ParquetFile(io.BytesIO(response.content))
+    assert parquet_file.metadata.num_row_groups == 2
+    table = parquet_file.read(use_threads=False).to_pydict()
+    assert {name: table[name] for name in expected} == expected
+
+    response = client.get("/dining-records/", params={"format": "arrow"}, headers=headers)
+    assert response.status_code == 200
+    reader = pa.ipc.open_stream(response.content)
+    batches = list(reader)
+    assert [batch.num_rows for batch in batches] == [2, 1]
+    table = pa.Table.from_batches(batches).to_pydict()
+    assert {name: table[name] for name in expected} == expected
+
+    response = client.get("/dining-records/", params={"format": "csv"}, headers=headers)
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0] == ",".join(user_main.DINING_RECORD_SCHEMA.names)
+    assert lines[1].endswith(",Dish 1,2024-01-01 00:00:00,10.0,paid,good,ok")
+    assert len(lines) == 4
+
+    response = client.get("/dining-records/", params={"format": "xlsx"}, headers=headers)
+    assert response.status_code == 400
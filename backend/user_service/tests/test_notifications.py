@@ -49,6 +49,50 @@ def test_get_user_notifications_success(client, test_user, test_user_token, db):
         assert "created_at" in notification
         assert notification["notification_type"] in ["system", "billing"]
 
+def test_get_user_notifications_keyset_pages(client, test_user, test_user_token, db):
+    """Notifications are paged newest first with an opaque cursor"""
+    notifications = [
+        models.Notification(user_id=test_user.id, message=f"Notification {i}", notification_type="system",
+                            created_at=datetime(2024, 1, 1 + i // 2))  # 兩兩同一時間，以 id 區分
+        for i in range(5)
+    ]
+    db.add_all(notifications)
+    db.commit()
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    messages = []
+    params = {"limit": 2}
+    while True:
+        response = client.get(f"/users/{test_user.id}/notifications", params=params, headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        messages += [notification["message"] for notification in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 2, "cursor": response.headers["X-Next-Cursor"]}
+    assert messages == [f"Notification {i}" for i in range(4, -1, -1)]
+
+    response = client.get(f"/users/{test_user.id}/notifications", params={"limit": 100000}, headers=headers)
+    assert response.status_code == 422
+
+def test_get_user_notifications_default_page(client, test_user, test_user_token, db):
+    """Without a limit a page has DEFAULT_PAGE_SIZE notifications and a cursor to the rest"""
+    from ..pagination import DEFAULT_PAGE_SIZE
+    db.add_all(
+        models.Notification(user_id=test_user.id, message=f"Notification {i}", notification_type="system")
+        for i in range(DEFAULT_PAGE_SIZE + 1)
+    )
+    db.commit()
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    response = client.get(f"/users/{test_user.id}/notifications", headers=headers)
+    assert len(response.json()) == DEFAULT_PAGE_SIZE
+    response = client.get(
+        f"/users/{test_user.id}/notifications", params={"cursor": response.headers["X-Next-Cursor"]}, headers=headers
+    )
+    assert len(response.json()) == 1
+    assert "X-Next-Cursor" not in response.headers
+
 def test_get_user_notifications_unauthorized(client, test_user, test_user_token, db):
     """Test unauthorized access to notifications"""
     # Create another test user
@@ -4,19 +4,23 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 import json
+import threading
 import pika
 from unittest.mock import patch, MagicMock
 
 from ..main import app, get_db
-from ..models import Base, User, DiningRecord
+from ..models import Base, User, DiningRecord, MenuItemRatingStats
 from ..rabbitmq import (
     NOTIFICATION_EXCHANGE,
     ORDER_NOTIFICATION_ROUTING_KEY,
     process_order_notification,
     consume_order_notifications,
     ORDER_NOTIFICATION_QUEUE,
+    ORDER_PLACED_EVENT,
+    ORDER_STATUS_CHANGED_EVENT,
     setup_rabbitmq
 )
+from ..batch_consumer import PREFETCH_COUNT
 
 # Create test database
 TEST_DATABASE_URL = "sqlite:///:memory:"
@@ -102,6 +106,179 @@ def test_process_order_notification(db):
     # Verify message was acknowledged
     mock_channel.basic_ack.assert_called_once_with(delivery_tag=1)
 
+def test_process_order_placed_event(db):
+    """Test that one versioned event creates a dining record per line item in one commit"""
+    mock_channel = MagicMock()
+    mock_method = MagicMock()
+    mock_method.delivery_tag = 1
+
+    test_event = {
+        "version": 2,
+        "event": ORDER_PLACED_EVENT,
+        "user_id": 1,
+        "payment_status": "unpaid",
+        "orders": [
+            {
+                "order_id": 200,
+                "items": [
+                    {"menu_item_id": 1, "menu_item_name": "Item A", "total_amount": 20.0},
+                    {"menu_item_id": 2, "menu_item_name": "Item B", "total_amount": 15.0}
+                ]
+            }
+        ]
+    }
+
+    with patch.object(db, "commit", wraps=db.commit) as mock_commit:
+        process_order_notification(
+            mock_channel,
+            mock_method,
+            None,
+            json.dumps(test_event).encode(),
+            db
+        )
+        assert mock_commit.call_count == 1
+
+    dining_records = db.query(DiningRecord).filter(
+        DiningRecord.order_id == 200
+    ).order_by(DiningRecord.menu_item_id).all()
+
+    assert [record.menu_item_name for record in dining_records] == ["Item A", "Item B"]
+    assert [record.total_amount for record in dining_records] == [20.0, 15.0]
+    assert all(record.payment_status == "unpaid" for record in dining_records)
+    # 同一個 transaction 內建立評分計數列
+    stats = db.query(MenuItemRatingStats).order_by(MenuItemRatingStats.menu_item_id).all()
+    assert [(row.menu_item_id, row.menu_item_name, row.total_reviews) for row in stats] == [
+        (1, "Item A", 0), (2, "Item B", 0)
+    ]
+    mock_channel.basic_ack.assert_called_once_with(delivery_tag=1)
+
+def test_process_order_status_changed_event(db):
+    """Test that a status change event updates every line item of the listed orders"""
+    for order_id, menu_item_id in [(300, 1), (300, 2), (301, 1), (302, 1)]:
+        db.add(DiningRecord(
+            user_id=1,
+            order_id=order_id,
+            menu_item_id=menu_item_id,
+            menu_item_name="Item",
+            total_amount=10.0,
+            payment_status="unpaid"
+        ))
+    db.commit()
+
+    mock_channel = MagicMock()
+    mock_method = MagicMock()
+    mock_method.delivery_tag = 1
+
+    test_event = {
+        "version": 2,
+        "event": ORDER_STATUS_CHANGED_EVENT,
+        "user_id": 1,
+        "payment_status": "paid",
+        "orders": [
+            {"order_id": 300, "items": []},
+            {"order_id": 301, "items": []}
+        ]
+    }
+
+    process_order_notification(
+        mock_channel,
+        mock_method,
+        None,
+        json.dumps(test_event).encode(),
+        db
+    )
+
+    db.expire_all()
+    statuses = {
+        (record.order_id, record.menu_item_id): record.payment_status
+        for record in db.query(DiningRecord).all()
+    }
+    assert statuses == {
+        (300, 1): "paid",
+        (300, 2): "paid",
+        (301, 1): "paid",
+        (302, 1): "unpaid"
+    }
+    mock_channel.basic_ack.assert_called_once_with(delivery_tag=1)
+
+def test_redelivered_order_events_are_idempotent(db):
+    """Test that replaying placed / status changed events leaves one record per line item"""
+    mock_channel = MagicMock()
+    placed = json.dumps({
+        "version": 2,
+        "event": ORDER_PLACED_EVENT,
+        "user_id": 1,
+        "payment_status": "unpaid",
+        "orders": [{
+            "order_id": 400,
+            "items": [
+                {"menu_item_id": 1, "menu_item_name": "Item A", "total_amount": 20.0},
+                {"menu_item_id": 2, "menu_item_name": "Item B", "total_amount": 15.0}
+            ]
+        }]
+    }).encode()
+    paid = json.dumps({
+        "version": 2,
+        "event": ORDER_STATUS_CHANGED_EVENT,
+        "user_id": 1,
+        "payment_status": "paid",
+        "orders": [{"order_id": 400, "items": []}]
+    }).encode()
+
+    # nack 之後 requeue 的訊息會再送一次，順序也可能被打亂
+    for body in [placed, placed, paid, placed, paid]:
+        process_order_notification(mock_channel, MagicMock(delivery_tag=1), None, body, db)
+
+    db.expire_all()
+    records = db.query(DiningRecord).order_by(DiningRecord.menu_item_id).all()
+    assert [(record.menu_item_id, record.payment_status) for record in records] == [(1, "paid"), (2, "paid")]
+    assert db.query(MenuItemRatingStats).count() == 2
+    mock_channel.basic_nack.assert_not_called()
+
+def test_legacy_notifications_are_idempotent(db):
+    """Test the per-item format: redelivery does not duplicate, is_put updates every item of the order"""
+    mock_channel = MagicMock()
+    items = [
+        {"user_id": 1, "order_id": 500, "menu_item_id": menu_item_id, "menu_item_name": f"Item {menu_item_id}",
+         "total_amount": 10.0, "payment_status": "unpaid"}
+        for menu_item_id in (1, 2, 3)
+    ]
+    for item in items + items:
+        process_order_notification(mock_channel, MagicMock(delivery_tag=1), None, json.dumps(item).encode(), db)
+    assert db.query(DiningRecord).count() == 3
+
+    process_order_notification(
+        mock_channel, MagicMock(delivery_tag=2), None,
+        json.dumps(dict(items[0], payment_status="paid", is_put=True)).encode(), db
+    )
+    db.expire_all()
+    assert [record.payment_status for record in db.query(DiningRecord)] == ["paid", "paid", "paid"]
+    mock_channel.basic_nack.assert_not_called()
+
+def test_process_invalid_order_event(db):
+    """Test that a versioned event without its orders is rejected"""
+    mock_channel = MagicMock()
+    mock_method = MagicMock()
+    mock_method.delivery_tag = 1
+
+    test_event = {
+        "version": 2,
+        "event": ORDER_PLACED_EVENT,
+        "user_id": 1,
+        "payment_status": "unpaid"
+    }
+
+    process_order_notification(
+        mock_channel,
+        mock_method,
+        None,
+        json.dumps(test_event).encode(),
+        db
+    )
+
+    assert db.query(DiningRecord).count() == 0
+    mock_channel.basic_nack.assert_called_once_with(delivery_tag=1)
+
 def test_process_invalid_order_notification(db):
     """Test processing an invalid order notification"""
     # Mock channel and method
@@ -190,23 +367,30 @@ def test_consume_order_notifications(mock_connection, db):
         routing_key=ORDER_NOTIFICATION_ROUTING_KEY
     )
     
-    # Set up the consumer
-    consume_order_notifications(db)
+    # start_consuming 期間送一則訊息進來，等 worker commit 後在 connection thread 上 ack
+    settled = threading.Event()
+    def add_callback_threadsafe(callback):
+        callback()
+        settled.set()
+    mock_connection.return_value.add_callback_threadsafe.side_effect = add_callback_threadsafe
+    def start_consuming():
+        callback = mock_channel.basic_consume.call_args[1]['on_message_callback']
+        callback(
+            mock_channel,
+            MagicMock(delivery_tag=1),
+            MagicMock(timestamp=None),
+            json.dumps(test_data).encode()
+        )
+        assert settled.wait(5)
+    mock_channel.start_consuming.side_effect = start_consuming
+    
+    # Set up the consumer; every batch opens its own session
+    consume_order_notifications(TestingSessionLocal)
     
     # Verify consumer was set up
     mock_channel.basic_consume.assert_called_once()
-    mock_channel.basic_qos.assert_called_once_with(prefetch_count=1)
-    
-    # Get the callback that was registered
-    callback = mock_channel.basic_consume.call_args[1]['on_message_callback']
-    
-    # Simulate receiving a message
-    callback(
-        mock_channel,
-        MagicMock(delivery_tag=1),
-        None,
-        json.dumps(test_data).encode()
-    )
+    mock_channel.basic_qos.assert_called_once_with(prefetch_count=PREFETCH_COUNT)
+    mock_channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
     
     # Verify dining record was created
     dining_record = db.query(DiningRecord).filter(
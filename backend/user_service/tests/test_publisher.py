@@ -0,0 +1,64 @@
+import json
+import pika
+from unittest.mock import patch, MagicMock
+
+from ..rabbitmq import RabbitMQPublisher, NOTIFICATION_EXCHANGE, NOTIFICATION_ROUTING_KEY
+
+@patch('pika.BlockingConnection')
+def test_publisher_reuses_connection(mock_connection):
+    """Consecutive publishes share one pooled connection with confirms enabled"""
+    mock_channel = MagicMock()
+    mock_connection.return_value.channel.return_value = mock_channel
+
+    publisher = RabbitMQPublisher(pool_size=1)
+    publisher.publish(NOTIFICATION_ROUTING_KEY, {"user_id": 1})
+    publisher.publish(NOTIFICATION_ROUTING_KEY, {"user_id": 2})
+
+    assert mock_connection.call_count == 1
+    mock_channel.confirm_delivery.assert_called_once()
+    assert mock_channel.basic_publish.call_count == 2
+    kwargs = mock_channel.basic_publish.call_args[1]
+    assert kwargs["exchange"] == NOTIFICATION_EXCHANGE
+    assert kwargs["routing_key"] == NOTIFICATION_ROUTING_KEY
+    assert json.loads(kwargs["body"]) == {"user_id": 2}
+    assert kwargs["properties"].delivery_mode == 2
+
+@patch('pika.BlockingConnection')
+def test_publisher_reconnects_after_lost_connection(mock_connection):
+    """A dropped connection is replaced and the message is published on the new one"""
+    broken_channel = MagicMock()
+    broken_channel.basic_publish.side_effect = pika.exceptions.StreamLostError("connection reset")
+    healthy_channel = MagicMock()
+    broken_connection = MagicMock()
+    broken_connection.channel.return_value = broken_channel
+    healthy_connection = MagicMock()
+    healthy_connection.channel.return_value = healthy_channel
+    mock_connection.side_effect = [broken_connection, healthy_connection]
+
+    publisher = RabbitMQPublisher(pool_size=1)
+    publisher.publish(NOTIFICATION_ROUTING_KEY, {"user_id": 1})
+
+    assert mock_connection.call_count == 2
+    broken_connection.close.assert_called_once()
+    healthy_channel.basic_publish.assert_called_once()
+
+    # The healthy connection stays in the pool for the next publish
+    publisher.publish(NOTIFICATION_ROUTING_KEY, {"user_id": 2})
+    assert mock_connection.call_count == 2
+    assert healthy_channel.basic_publish.call_count == 2
+
+@patch('pika.BlockingConnection')
+def test_publisher_gives_up_when_broker_is_down(mock_connection):
+    """Connection errors surface once the retries are exhausted"""
+    mock_connection.side_effect = pika.exceptions.AMQPConnectionError("refused")
+
+    publisher = RabbitMQPublisher(pool_size=1)
+    try:
+        publisher.publish(NOTIFICATION_ROUTING_KEY, {"user_id": 1})
+        assert False, "publish should raise"
+    except pika.exceptions.AMQPConnectionError:
+        pass
+
+    # The slot is returned to the pool so later publishes can retry
+    mock_connection.side_effect = None
+    publisher.publish(NOTIFICATION_ROUTING_KEY, {"user_id": 1})
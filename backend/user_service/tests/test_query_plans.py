@@ -0,0 +1,182 @@
+"""
+Query plans of the hot dining-record / notification / review queries on a schema
+built by the Alembic migrations.
+
+Each query is run through EXPLAIN QUERY PLAN with the same bound parameters the
+endpoint sends; a full table scan (or, for paginated queries, a temp B-tree for
+ORDER BY) fails the test.
+"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from .. import models, pagination, rating_stats
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "alembic.ini")
+
+@pytest.fixture(scope="module")
+def connection(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'user.db'}")
+    with engine.begin() as connection:
+        config = Config(ALEMBIC_INI)
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
+
+        start = datetime(2025, 1, 1)
+        connection.execute(insert(models.User), [
+            {"id": i, "username": f"user{i}", "hashed_password": "x", "role": "employee"}
+            for i in range(1, 201)
+        ])
+        connection.execute(insert(models.DiningRecord), [
+            {
+                "user_id": i % 200 + 1,
+                "order_id": i // 2 + 1,
+                "menu_item_id": i % 30,
+                "menu_item_name": f"item{i % 30}",
+                "dining_date": start + timedelta(minutes=7 * i),
+                "total_amount": 10.0,
+                # 大部分紀錄都已付款
+                "payment_status": "unpaid" if i % 50 == 0 else "paid",
+            }
+            for i in range(10000)
+        ])
+        connection.execute(insert(models.Review), [
+            {"dining_record_id": i + 1, "rating": "good", "comment": "ok", "created_at": start}
+            for i in range(0, 10000, 4)
+        ])
+        connection.execute(insert(models.Notification), [
+            {"user_id": i % 200 + 1, "message": "hi", "notification_type": "billing", "created_at": start + timedelta(hours=i)}
+            for i in range(5000)
+        ])
+        connection.exec_driver_sql("ANALYZE")
+    with engine.connect() as connection:
+        yield connection
+    engine.dispose()
+
+def query_plan(connection, stmt):
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    rows = connection.exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + str(compiled),
+        tuple(params[name] for name in compiled.positiontup)
+    ).all()
+    return [row[-1] for row in rows]
+
+def assert_indexed(plan, index_name, sorted_in_memory=False):
+    assert any(index_name in step for step in plan), plan
+    assert not any(step.startswith("SCAN") and "INDEX" not in step for step in plan), plan
+    if not sorted_in_memory:
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+
+def test_migrations_match_models(connection):
+    assert compare_metadata(MigrationContext.configure(connection), models.Base.metadata) == []
+
+CURSORS = [None, pagination.encode_cursor(datetime(2025, 1, 10), 1234)]
+
+@pytest.mark.parametrize("cursor", CURSORS)
+def test_user_dining_records_page_plan(connection, cursor):
+    stmt = pagination.keyset(
+        select(models.DiningRecord).where(models.DiningRecord.user_id == 42),
+        models.DiningRecord.dining_date, models.DiningRecord.id, cursor, 100, descending=False
+    )
+    assert_indexed(query_plan(connection, stmt), "ix_dining_records_user_id_dining_date")
+
+@pytest.mark.parametrize("cursor", CURSORS)
+def test_all_dining_records_page_plan(connection, cursor):
+    stmt = pagination.keyset(
+        select(models.DiningRecord),
+        models.DiningRecord.dining_date, models.DiningRecord.id, cursor, 100, descending=False
+    )
+    assert_indexed(query_plan(connection, stmt), "ix_dining_records_dining_date")
+
+@pytest.mark.parametrize("cursor", CURSORS)
+def test_notifications_page_plan(connection, cursor):
+    stmt = pagination.keyset(
+        select(models.Notification).where(models.Notification.user_id == 42),
+        models.Notification.created_at, models.Notification.id, cursor, 100
+    )
+    assert_indexed(query_plan(connection, stmt), "ix_notifications_user_id_created_at")
+
+def test_menu_item_dining_records_plan(connection):
+    stmt = select(models.DiningRecord.menu_item_id, models.DiningRecord.order_id).where(
+        models.DiningRecord.menu_item_id.in_([3, 7]),
+        models.DiningRecord.dining_date >= datetime(2025, 1, 1),
+        models.DiningRecord.dining_date < datetime(2025, 2, 1)
+    )
+    assert_indexed(query_plan(connection, stmt), "ix_dining_records_menu_item_id_dining_date")
+
+def test_reviews_by_dining_record_plan(connection):
+    stmt = select(models.Review).where(
+        models.Review.dining_record_id.in_([1, 5, 9])
+    ).order_by(models.Review.created_at.desc())
+    assert_indexed(query_plan(connection, stmt), "ix_reviews_dining_record_id", sorted_in_memory=True)
+
+def test_order_status_changed_plan(connection):
+    stmt = update(models.DiningRecord).where(
+        models.DiningRecord.order_id.in_([10, 11, 12]),
+        models.DiningRecord.user_id == 21
+    ).values(payment_status="paid")
+    assert_indexed(query_plan(connection, stmt), "uq_dining_records_order_id_menu_item_id")
+
+def test_duplicate_dining_records_are_removed_before_the_unique_key(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'duplicates.db'}")
+    with engine.begin() as connection:
+        config = Config(ALEMBIC_INI)
+        config.attributes["connection"] = connection
+        command.upgrade(config, "0002")
+        connection.execute(insert(models.User), [{"id": 1, "username": "user1", "hashed_password": "x", "role": "employee"}])
+        connection.execute(insert(models.DiningRecord), [
+            {"id": record_id, "user_id": 1, "order_id": order_id, "menu_item_id": menu_item_id, "payment_status": "paid"}
+            for record_id, order_id, menu_item_id in [(1, 10, 1), (2, 10, 1), (3, 10, 2), (4, 11, 1), (5, 11, 1), (6, 11, 1)]
+        ])
+        # 重複的第二筆有評價，保留它
+        connection.execute(insert(models.Review), [{"id": 1, "dining_record_id": 2, "rating": "good"}])
+        command.upgrade(config, "head")
+
+        remaining = connection.execute(select(models.DiningRecord.id).order_by(models.DiningRecord.id)).scalars().all()
+        assert remaining == [2, 3, 4]
+        assert connection.execute(select(models.Review.dining_record_id)).scalars().all() == [2]
+    engine.dispose()
+
+def test_unpaid_users_plan(connection):
+    stmt = select(
+        models.User.id, models.User.username, models.DiningRecord.total_amount
+    ).join(
+        models.DiningRecord, models.User.id == models.DiningRecord.user_id
+    ).where(models.DiningRecord.payment_status == "unpaid")
+    assert_indexed(query_plan(connection, stmt), "ix_dining_records_unpaid_user_id")
+
+def test_baseline_database_gets_backfilled_rating_counters(tmp_path):
+    # create_all 建好的舊資料庫會被標記為 0001，之後的 revision 要補齊計數表
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as connection:
+        config = Config(ALEMBIC_INI)
+        config.attributes["connection"] = connection
+        command.upgrade(config, "0001")
+        assert "menu_item_rating_stats" not in inspect(connection).get_table_names()
+        connection.execute(insert(models.User), [{"id": 1, "username": "user1", "hashed_password": "x", "role": "employee"}])
+        connection.execute(insert(models.DiningRecord), [
+            {"id": record_id, "user_id": 1, "order_id": record_id, "menu_item_id": menu_item_id,
+             "menu_item_name": f"item{menu_item_id}", "dining_date": dining_date, "payment_status": "paid"}
+            for record_id, menu_item_id, dining_date in [
+                (1, 1, datetime(2025, 1, 1, 12)), (2, 1, datetime(2025, 1, 2, 12)), (3, 2, datetime(2025, 1, 1, 12))
+            ]
+        ])
+        connection.execute(insert(models.Review), [
+            {"id": 1, "dining_record_id": 1, "rating": "good"}, {"id": 2, "dining_record_id": 2, "rating": "bad"}
+        ])
+        command.upgrade(config, "head")
+
+        stats = models.MenuItemRatingStats
+        assert connection.execute(
+            select(stats.menu_item_id, stats.total_reviews, stats.good_reviews).order_by(stats.menu_item_id)
+        ).all() == [(1, 2, 1), (2, 0, 0)]
+        assert rating_stats.rebuild_rating_stats(Session(bind=connection), check_only=True) == []
+    engine.dispose()
@@ -5,6 +5,7 @@ import time
 from datetime import datetime
 from sqlalchemy.orm import Session
 from .. import models
+from .conftest import TestingSessionLocal
 from ..rabbitmq import (
     get_connection,
     setup_rabbitmq,
@@ -69,7 +70,7 @@ def test_notification_publish_and_consume(db: Session):
     }
 
     # Start consumer thread
-    consumer_thread = start_consumer_thread(db)
+    consumer_thread = start_consumer_thread(TestingSessionLocal)
 
     # Send notification
     send_notification(test_notification)
@@ -125,7 +126,7 @@ def test_notification_format(db: Session):
     }
 
     # Start consumer thread
-    consumer_thread = start_consumer_thread(db)
+    consumer_thread = start_consumer_thread(TestingSessionLocal)
 
     # Send invalid notification
     send_notification(invalid_notification)
@@ -1,9 +1,10 @@
 import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
-from ..models import Review, DiningRecord
+from ..models import Review, DiningRecord, MenuItemRatingStats, MenuItemRatingDaily
+from ..rating_stats import rebuild_rating_stats, is_day_boundary
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 def test_create_review(client: TestClient, test_user_token, test_dining_record_instance, db):
     # Clean up any existing reviews
@@ -286,6 +287,8 @@ def test_get_menu_item_rating(client, test_user_token, test_user, db):
     )
     db.add(review3)
     db.commit()
+    # 直接寫入資料庫的評論不會經過計數器，先重建
+    rebuild_rating_stats(db)
     
     # Test getting the rating statistics
     response = client.get(f"/ratings/{menu_item_id}")
@@ -317,6 +320,7 @@ def test_get_menu_item_rating_no_reviews(client, test_user_token, test_user, db)
     )
     db.add(dining_record)
     db.commit()
+    rebuild_rating_stats(db)
     
     # Test getting the rating statistics
     response = client.get(f"/ratings/{menu_item_id}")
@@ -328,6 +332,123 @@ def test_get_menu_item_rating_no_reviews(client, test_user_token, test_user, db)
     assert data["good_reviews"] == 0
     assert data["good_ratio"] == 0 
 
+def test_get_menu_item_rating_time_window(client, test_user, db):
+    db.query(Review).delete()
+    db.query(DiningRecord).delete()
+    db.commit()
+
+    records = [
+        DiningRecord(user_id=test_user.id, order_id=201, menu_item_id=20, menu_item_name="Window Dish",
+                     dining_date=datetime(2024, 1, 1, 12), total_amount=80.0, payment_status="paid"),
+        DiningRecord(user_id=test_user.id, order_id=202, menu_item_id=20, menu_item_name="Window Dish",
+                     dining_date=datetime(2024, 1, 8, 12), total_amount=80.0, payment_status="paid"),
+    ]
+    db.add_all(records)
+    db.commit()
+    db.add_all([
+        Review(user_id=test_user.id, dining_record_id=records[0].id, rating="bad", comment="cold"),
+        Review(user_id=test_user.id, dining_record_id=records[1].id, rating="good", comment="hot"),
+    ])
+    db.commit()
+    rebuild_rating_stats(db)
+
+    assert client.get("/ratings/20").json()["total_reviews"] == 2
+
+    # [start_date, end_date) 只包含第二筆
+    response = client.get("/ratings/20", params={"start_date": "2024-01-05T00:00:00", "end_date": "2024-01-09T00:00:00"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "menu_item_id": 20, "menu_item_name": "Window Dish", "total_reviews": 1, "good_reviews": 1, "good_ratio": 1.0
+    }
+    response = client.get("/ratingswithorder/20", params={"start_date": "2024-01-05T00:00:00"})
+    assert response.json()["order_ids"] == [202]
+
+    # 期間內沒有用餐紀錄仍回傳 0，不存在的菜品才是 404
+    response = client.get("/ratings/20", params={"start_date": "2025-01-01T00:00:00"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["total_reviews"] == 0
+    assert client.get("/ratings/21").status_code == status.HTTP_404_NOT_FOUND
+
+def test_get_menu_item_ratings_bulk(client, test_user, db):
+    db.query(Review).delete()
+    db.query(DiningRecord).delete()
+    db.commit()
+
+    records = [
+        DiningRecord(user_id=test_user.id, order_id=101, menu_item_id=10, menu_item_name="Bulk Dish A",
+                     total_amount=100.0, payment_status="paid"),
+        DiningRecord(user_id=test_user.id, order_id=102, menu_item_id=10, menu_item_name="Bulk Dish A",
+                     total_amount=100.0, payment_status="paid"),
+        DiningRecord(user_id=test_user.id, order_id=103, menu_item_id=11, menu_item_name="Bulk Dish B",
+                     total_amount=50.0, payment_status="unpaid"),
+    ]
+    db.add_all(records)
+    db.commit()
+    db.add_all([
+        Review(user_id=test_user.id, dining_record_id=records[0].id, rating="good", comment="good"),
+        Review(user_id=test_user.id, dining_record_id=records[1].id, rating="bad", comment="bad"),
+    ])
+    db.commit()
+    rebuild_rating_stats(db)
+
+    response = client.get("/ratings/bulk", params={"menu_item_ids": "10,11,12", "include_order_ids": True})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"menu_item_id": 10, "menu_item_name": "Bulk Dish A", "total_reviews": 2, "good_reviews": 1,
+         "good_ratio": 0.5, "order_ids": [101, 102]},
+        {"menu_item_id": 11, "menu_item_name": "Bulk Dish B", "total_reviews": 0, "good_reviews": 0,
+         "good_ratio": 0.0, "order_ids": [103]},
+    ]
+
+    # "all" 且不帶 order_ids，結果與單筆 /ratings/{id} 相同
+    response = client.get("/ratings/bulk")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert [item["menu_item_id"] for item in data] == [10, 11]
+    assert "order_ids" not in data[0]
+    assert data[0] == client.get("/ratings/10").json()
+
+    assert client.get("/ratings/bulk", params={"menu_item_ids": "10,abc"}).status_code == status.HTTP_400_BAD_REQUEST
+
+def test_get_menu_item_ratings_bulk_time_window(client, test_user, db):
+    db.query(Review).delete()
+    db.query(DiningRecord).delete()
+    db.commit()
+
+    records = [
+        DiningRecord(user_id=test_user.id, order_id=501, menu_item_id=50, menu_item_name="Range Dish A",
+                     dining_date=datetime(2024, 4, 1, 8), total_amount=60.0, payment_status="paid"),
+        DiningRecord(user_id=test_user.id, order_id=502, menu_item_id=50, menu_item_name="Range Dish A",
+                     dining_date=datetime(2024, 4, 1, 18), total_amount=60.0, payment_status="paid"),
+        DiningRecord(user_id=test_user.id, order_id=503, menu_item_id=51, menu_item_name="Range Dish B",
+                     dining_date=datetime(2024, 4, 3, 12), total_amount=40.0, payment_status="paid"),
+    ]
+    db.add_all(records)
+    db.commit()
+    db.add_all([
+        Review(user_id=test_user.id, dining_record_id=record.id, rating=rating, comment=rating)
+        for record, rating in zip(records, ["good", "bad", "good"])
+    ])
+    db.commit()
+    rebuild_rating_stats(db)
+
+    def counts(**params):
+        response = client.get("/ratings/bulk", params={"menu_item_ids": "50,51", **params})
+        assert response.status_code == status.HTTP_200_OK
+        return {item["menu_item_id"]: (item["total_reviews"], item["good_reviews"]) for item in response.json()}
+
+    # 整日區間走每日計數，任意時間點則直接依 dining_date 彙總，期間內沒有評論的菜品為 0
+    assert counts(start_date="2024-04-01T00:00:00", end_date="2024-04-02T00:00:00") == {50: (2, 1), 51: (0, 0)}
+    assert counts(start_date="2024-04-01T12:00:00", end_date="2024-04-03T13:00:00") == {50: (1, 0), 51: (1, 1)}
+    assert counts(end_date="2024-04-01T12:00:00") == {50: (1, 1), 51: (0, 0)}
+
+    response = client.get("/ratings/bulk", params={"menu_item_ids": "50", "include_order_ids": True,
+                                                   "start_date": "2024-04-01T12:00:00"})
+    assert response.json()[0]["order_ids"] == [502]
+
+    response = client.get("/ratings/bulk", params={"start_date": "2024-04-02T00:00:00", "end_date": "2024-04-01T00:00:00"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
 def test_get_menu_item_reviews(client, test_user_token, test_user, db):
     # Clean up any existing reviews and dining records
     db.query(Review).delete()
@@ -583,4 +704,101 @@ def test_delete_review_wrong_user(client: TestClient, test_dining_record_instanc
         headers={"Authorization": f"Bearer {test_admin_token}"}
     )
     assert response.status_code == 404
-    assert response.json()["detail"] == "Dining record not found" 
\ No newline at end of file
+    assert response.json()["detail"] == "Dining record not found"
+
+def test_rating_stats_follow_review_changes(client, test_user_token, test_user, db):
+    db.query(Review).delete()
+    db.query(DiningRecord).delete()
+    db.commit()
+    record = DiningRecord(user_id=test_user.id, order_id=301, menu_item_id=30, menu_item_name="Counter Dish",
+                          dining_date=datetime(2024, 2, 1, 12), total_amount=90.0, payment_status="paid")
+    db.add(record)
+    db.commit()
+    rebuild_rating_stats(db)
+
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    path = f"/dining-records/{record.id}/reviews/"
+    window = {"start_date": "2024-02-01T00:00:00", "end_date": "2024-02-02T00:00:00"}
+
+    def counts(**params):
+        data = client.get("/ratings/30", params=params).json()
+        return data["total_reviews"], data["good_reviews"]
+
+    assert counts() == (0, 0)
+    client.post(path, json={"rating": "good", "comment": "nice"}, headers=headers)
+    assert counts() == (1, 1)
+    assert counts(**window) == (1, 1)
+    client.put(path, json={"rating": "bad", "comment": "changed my mind"}, headers=headers)
+    assert counts() == (1, 0)
+    assert rebuild_rating_stats(db, check_only=True) == []
+    client.delete(path, headers=headers)
+    assert counts() == (0, 0)
+    assert counts(**window) == (0, 0)
+    assert rebuild_rating_stats(db, check_only=True) == []
+
+def test_rebuild_rating_stats_reports_drift(client, test_user, db):
+    db.query(Review).delete()
+    db.query(DiningRecord).delete()
+    db.commit()
+    record = DiningRecord(user_id=test_user.id, order_id=401, menu_item_id=40, menu_item_name="Drift Dish",
+                          dining_date=datetime(2024, 3, 1, 12), total_amount=70.0, payment_status="paid")
+    db.add(record)
+    db.commit()
+    db.add(Review(user_id=test_user.id, dining_record_id=record.id, rating="good", comment="ok"))
+    db.commit()
+    rebuild_rating_stats(db)
+
+    db.query(MenuItemRatingStats).filter(MenuItemRatingStats.menu_item_id == 40).update({"total_reviews": 5})
+    db.commit()
+    assert rebuild_rating_stats(db, check_only=True) == [("menu_item_rating_stats", 40, (5, 1), (1, 1))]
+    assert client.get("/ratings/40").json()["total_reviews"] == 5
+
+    assert rebuild_rating_stats(db) == [("menu_item_rating_stats", 40, (5, 1), (1, 1))]
+    assert rebuild_rating_stats(db, check_only=True) == []
+    assert client.get("/ratings/40").json()["total_reviews"] == 1
+
+def test_rating_stats_missing_row_is_not_negative(client, test_user_token, test_user, db):
+    db.query(Review).delete()
+    db.query(DiningRecord).delete()
+    db.commit()
+    record = DiningRecord(user_id=test_user.id, order_id=501, menu_item_id=50, menu_item_name="Missing Dish",
+                          dining_date=datetime(2024, 4, 1, 12), total_amount=60.0, payment_status="paid")
+    db.add(record)
+    db.commit()
+    db.add(Review(user_id=test_user.id, dining_record_id=record.id, rating="good", comment="ok"))
+    db.commit()
+    db.query(MenuItemRatingStats).filter(MenuItemRatingStats.menu_item_id == 50).delete()
+    db.query(MenuItemRatingDaily).filter(MenuItemRatingDaily.menu_item_id == 50).delete()
+    db.commit()
+
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    client.delete(f"/dining-records/{record.id}/reviews/", headers=headers)
+    db.expire_all()
+    stats = db.query(MenuItemRatingStats).filter(MenuItemRatingStats.menu_item_id == 50).one()
+    daily = db.query(MenuItemRatingDaily).filter(MenuItemRatingDaily.menu_item_id == 50).one()
+    assert (stats.total_reviews, stats.good_reviews) == (0, 0)
+    assert (daily.total_reviews, daily.good_reviews) == (0, 0)
+
+def test_rating_time_window_with_offset(client, test_user, db):
+    db.query(Review).delete()
+    db.query(DiningRecord).delete()
+    db.commit()
+    record = DiningRecord(user_id=test_user.id, order_id=601, menu_item_id=60, menu_item_name="Offset Dish",
+                          dining_date=datetime(2024, 5, 2, 1), total_amount=80.0, payment_status="paid")
+    db.add(record)
+    db.commit()
+    db.add(Review(user_id=test_user.id, dining_record_id=record.id, rating="good", comment="ok"))
+    db.commit()
+    rebuild_rating_stats(db)
+
+    taipei = timezone(timedelta(hours=8))
+    assert is_day_boundary(datetime(2024, 5, 2, 8, tzinfo=taipei))
+    assert not is_day_boundary(datetime(2024, 5, 2, tzinfo=taipei))
+
+    # 2024-05-02T08:00+08:00 is midnight UTC, so the record falls in the first window only
+    response = client.get("/ratings/60", params={"start_date": "2024-05-02T08:00:00+08:00",
+                                                 "end_date": "2024-05-03T08:00:00+08:00"})
+    assert response.json()["total_reviews"] == 1
+    response = client.get("/ratings/60", params={"start_date": "2024-05-02T00:00:00+08:00",
+                                                 "end_date": "2024-05-02T08:00:00+08:00"})
+    assert response.json()["total_reviews"] == 0
@@ -4,7 +4,7 @@ import { useAuth } from "../context/AuthContext";
 import LanguageSwitcher from "./LanguageSwitcher";
 import { useTranslation } from "react-i18next";
 import "./NavBar.css";
-import { getApiUrl } from '../config/api';
+import { fetchAllPages, getApiUrl } from '../config/api';
 
 const baseLinkStyle = {
     color: "white",
@@ -35,16 +35,12 @@ function Navbar(): React.ReactElement | null {
     useEffect(() => {
         const fetchNotifications = async () => {
             try {
-                const res = await fetch(getApiUrl('USER_SERVICE', `/users/${user_id}/notifications`), {
+                const data = await fetchAllPages<Notification>(getApiUrl('USER_SERVICE', `/users/${user_id}/notifications`), {
                     method: "GET",
                     headers: {
                         Authorization: `Bearer ${token}`,
                     },
                 });
-
-                if (!res.ok) throw new Error("Failed to fetch notifications");
-
-                const data = await res.json();
                 const unread = data.filter((n: Notification) => !n.is_read && n.notification_type == "billing");
                 setNotifications(unread);
             } catch (err) {
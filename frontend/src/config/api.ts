@@ -14,4 +14,20 @@
   
   export const getApiUrl = (service: keyof typeof API_CONFIG, path: string) => {
     return `${API_CONFIG[service]}${path}`;
+  };
+
+  // 分頁列表每頁最多回傳固定筆數，依 X-Next-Cursor 逐頁取回全部資料
+  export const fetchAllPages = async <T>(url: string, init?: RequestInit): Promise<T[]> => {
+    const items: T[] = [];
+    let cursor: string | null = null;
+    do {
+      const pageUrl = cursor
+        ? `${url}${url.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(cursor)}`
+        : url;
+      const res = await fetch(pageUrl, init);
+      if (!res.ok) throw new Error(`Request failed with status ${res.status}`);
+      items.push(...(await res.json()));
+      cursor = res.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
   };
\ No newline at end of file
@@ -57,44 +57,49 @@ function MenuEditorPage() {
 
                 //const availableItems = menuItems.filter((item: any) => item.is_available || !item.is_available);
 
-                // 並行取得每個餐點的評論資料
-                const mealsWithComments = await Promise.all(
-                    menuItems.map(async (item: any) => {
-                        const ratingRes = await fetch(
-                            getApiUrl('USER_SERVICE', `/ratings/${item.id}`),
-                            {
-                                method: "GET",
-                                headers: {
-                                    Authorization: `Bearer ${token}`,
-                                },
-                            }
-                        );
+                // 一次取得所有餐點的評價統計
+                const ratingsById = new Map<number, any>();
+                const ratingRes = await fetch(
+                    getApiUrl('USER_SERVICE', '/ratings/bulk?menu_item_ids=all'),
+                    {
+                        method: "GET",
+                        headers: {
+                            Authorization: `Bearer ${token}`,
+                        },
+                    }
+                );
+                if (ratingRes.ok) {
+                    const ratings = await ratingRes.json();
+                    for (const rating of ratings) {
+                        ratingsById.set(rating.menu_item_id, rating);
+                    }
+                } else {
+                    //console.warn("取得評價失敗，將使用空評論");
+                }
 
-                        // 模擬原始格式的 comments：good_reviews 為 true，其餘為 false
-                        const comments: Comment[] = [];
+                const mealsWithComments = menuItems.map((item: any) => {
+                    // 模擬原始格式的 comments：good_reviews 為 true，其餘為 false
+                    const comments: Comment[] = [];
+                    const rating = ratingsById.get(item.id);
 
-                        if (ratingRes.ok) {
-                            const rating = await ratingRes.json();
-                            for (let i = 0; i < rating.total_reviews; i++) {
-                                comments.push({
-                                    recommended: i < rating.good_reviews,
-                                });
-                            }
-                        } else {
-                            //console.warn(`取得 ${item.id} 評價失敗，將使用空評論`);
+                    if (rating) {
+                        for (let i = 0; i < rating.total_reviews; i++) {
+                            comments.push({
+                                recommended: i < rating.good_reviews,
+                            });
                         }
+                    }
 
-                        return {
-                            id: item.id,
-                            name: item.zh_name,
-                            englishName: item.en_name,
-                            price: item.price,
-                            image: item.url,
-                            todayMeal: item.is_available, // 或根據別的 API 判斷
-                            comments,
-                        } as TodayMeal;
-                    })
-                );
+                    return {
+                        id: item.id,
+                        name: item.zh_name,
+                        englishName: item.en_name,
+                        price: item.price,
+                        image: item.url,
+                        todayMeal: item.is_available, // 或根據別的 API 判斷
+                        comments,
+                    } as TodayMeal;
+                });
 
                 setMeals(mealsWithComments);
             } catch (err) {
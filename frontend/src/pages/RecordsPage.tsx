@@ -5,7 +5,7 @@ import "datatables.net";
 import "datatables.net-dt/css/dataTables.dataTables.css";
 import { useTranslation } from "react-i18next";
 import { useAuth } from "../context/AuthContext";
-import { getApiUrl } from '../config/api';
+import { fetchAllPages, getApiUrl } from '../config/api';
 
 interface Record {
     id: number;
@@ -34,13 +34,9 @@ function RecordsPage(): React.ReactElement {
         const userId = (user as any).user_id ?? (user as any).id;
         if (!userId) return;
         setLoading(true);
-        fetch(getApiUrl('USER_SERVICE', `/users/${userId}/dining-records/`), {
+        fetchAllPages<any>(getApiUrl('USER_SERVICE', `/users/${userId}/dining-records/`), {
             headers: { Authorization: `Bearer ${token}` },
         })
-            .then((res) => {
-                if (!res.ok) throw new Error("取得用餐紀錄失敗");
-                return res.json();
-            })
             .then(async (data) => {
                 // 並行取得每筆紀錄的評論與餐點名稱
                 const recordsWithReviews = await Promise.all(
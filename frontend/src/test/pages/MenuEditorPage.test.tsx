@@ -46,14 +46,17 @@ beforeEach(() => {
         });
       }
   
-      if (url.includes("/ratings/")) {
+      if (url.includes("/ratings/bulk")) {
         return Promise.resolve({
           ok: true,
           json: () =>
-            Promise.resolve({
-              total_reviews: 3,
-              good_reviews: 2,
-            }),
+            Promise.resolve([
+              {
+                menu_item_id: 1,
+                total_reviews: 3,
+                good_reviews: 2,
+              },
+            ]),
         });
       }
   